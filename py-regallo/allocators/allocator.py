@@ -1,7 +1,14 @@
-from cfg import Module
+from cfg import Module, Function
 import cfg.resolve as resolve
 import cfg.printer as printer
 import cfg.analysis as analysis
+import multiprocessing
+import parallel
+import search
+import estimate
+import profiling
+import metrics
+import decisions
 
 class Allocator(object):
     def __init__(self, name):
@@ -11,58 +18,241 @@ class Allocator(object):
     # and number of available registers and returns True or False
     # if it was successfull or not. If might spill some variables
     # introducing new ones which need additional allocation.
-    def perform_register_allocation(self, f, regcount, spilling=True):
+    # prepared - optional result of prepare() for the function f is a copy of.
+    def perform_register_allocation(self, f, regcount, spilling=True, prepared=None):
         raise NotImplementedError()
 
+    # Performs one phase of register allocation of f with regcount registers and
+    # spilling without modifying f (see allocators/estimate.py). Returns pair
+    # (success, dictionary {variable id: alloc}) with the allocation decisions.
+    # prepared - optional result of prepare(f).
+    # By default, a copy of f is allocated.
+    def dry_run(self, f, regcount, prepared=None):
+        g = f.copy()
+        success = self.perform_register_allocation(g, regcount, True, prepared)
+        return (success, {vid: var.alloc for (vid, var) in g.vars.iteritems()})
+
+    # Computes artifacts of f which every first-phase attempt of the full register
+    # allocation of f would compute again on its copy, but which depend neither on the
+    # number of registers nor on the allocation decisions (e.g. lifetime intervals).
+    # f must not be modified. None means that there is nothing to share.
+    def prepare(self, f):
+        return None
+
+    # Allocators with equal keys compute the same artifacts in prepare(), so they
+    # can share them (see allocate_many). None means that there is nothing to share.
+    def preparation_key(self):
+        return None
+
+    # Strategy of searching for the number of registers in the first phase of the
+    # full register allocation (see allocators/search.py). None means the default one.
+    regcount_search = None
+
+    # Number of register allocation attempts made by the last full register allocation.
+    attempts = 0
+
+    # Counters (metrics.Counters) of the last full register allocation (of a function
+    # or a whole module).
+    counters = None
+
+    # Number of worker processes functions of a module are allocated in
+    # (see perform_full_module_register_allocation). 1 means that they are allocated
+    # one after another in the current process, None means all available cores.
+    processes = 1
+
     # Performs full register allocation on a given function
     # with specific number of available registers. In case of success it returns
     # the modified copy of the function and None otherwise.
-    def perform_full_register_allocation(self, f, regcount):
-        first_phase_regcount = regcount
-
-        def try_allocate_and_eliminate_phi(fprim, rc, spilling):
-            while rc >= 0:
-                g = fprim.copy()
-                allocation_success = self.perform_register_allocation(g, rc, spilling)
-                if not allocation_success:
-                    return (g, False)
-                phi_elimination_success = resolve.eliminate_phi(g, regcount)
-                if phi_elimination_success:
-                    return (g, True)
-                rc -= 1
+    # warm_start  - optional search.WarmStart shared by allocations of f with
+    #               different regcounts (see warm_start_for).
+    # preparation - optional search.Preparation shared by allocations of f with
+    #               different regcounts and allocators (see preparation_for).
+    def perform_full_register_allocation(self, f, regcount, warm_start=None, preparation=None):
+        if warm_start is not None and not warm_start.applies_to(self, f):
+            warm_start = None
+        if preparation is not None and not preparation.applies_to(self, f):
+            preparation = None
 
+        attempts = search.RegcountAttempts(self, f, regcount, warm_start, preparation)
+        self.attempts = 0
+        self.counters = metrics.Counters()
+        decisions.allocation(self, f, regcount)
+
+        # Every instruction needs all its uses in registers, even if they are spilled.
+        if regcount < f.minimal_register_pressure():
+            decisions.result(None)
             return None
 
+        strategy = self.regcount_search or search.default()
+        with profiling.phase("full register allocation", allocator=self.name, 
+                function=f.name, regcount=regcount), self.counters:
+            result = strategy.search(attempts, regcount)
+        self.attempts = attempts.count
+        decisions.result(result)
+        return result
 
-        while first_phase_regcount >= 0:
-            g, success = try_allocate_and_eliminate_phi(f, first_phase_regcount, spilling=True)
-            if success:
-                analysis.perform_full_analysis(g)
-                return g
 
-            resolve.insert_spill_code(g)
-  
-            h, success = try_allocate_and_eliminate_phi(g, regcount, spilling=False) 
-            if success:
-                analysis.perform_full_analysis(h)
-                return h
+    # Returns warm-start hint for allocations of inp with different regcounts:
+    # search.WarmStart if inp is a Function and dictionary {function name: WarmStart}
+    # if it is a Module.
+    def warm_start_for(self, inp):
+        if isinstance(inp, Module):
+            return {f.name: search.WarmStart(self, f) for f in inp.functions.values()}
 
-            first_phase_regcount -= 1
+        return search.WarmStart(self, inp)
 
+    # Returns artifacts of inp computed by prepare() to be shared by its allocations:
+    # search.Preparation if inp is a Function and dictionary {function name: Preparation}
+    # if it is a Module. They can be shared by allocators with the same preparation_key().
+    def preparation_for(self, inp):
+        if isinstance(inp, Module):
+            return {f.name: search.Preparation(self, f) for f in inp.functions.values()}
 
-        return None
+        return search.Preparation(self, inp)
+
+    # Performs full register allocation of f with every regcount by every allocator
+    # from variants (by default only self), e.g. the same algorithm with different
+    # spillers. Artifacts of f (see prepare) are computed once and shared by the
+    # variants with the same preparation_key() as self, so only the allocation
+    # decisions are made for each of them.
+    # warm_start - if True, results of the first phase are shared by allocations
+    #              with different regcounts as well (see search.WarmStart).
+    #
+    # Returns generator of triples (allocator, regcount, allocated copy of f or None).
+    # Allocations are performed lazily, for each regcount by every variant in order.
+    def allocate_many(self, f, regcounts, variants=None, warm_start=True):
+        variants = variants or [self]
+        preparation = self.preparation_for(f)
+        warm_starts = {al: al.warm_start_for(f) if warm_start else None for al in variants}
+        for regcount in regcounts:
+            for al in variants:
+                yield (al, regcount, al.perform_full_register_allocation(f, regcount,
+                    warm_starts[al], preparation))
+
+    # Estimates costs of the full register allocation of f with regcount registers
+    # without copying the function or inserting any code (see allocators/estimate.py).
+    # The exception are allocators without their own dry_run (e.g. graph coloring),
+    # which allocate a copy of f in each attempt, because they spill and assign
+    # registers to variables of the function they allocate. f itself is never modified.
+    # Returns CostEstimate with costs {cost calculator name: estimated cost difference}
+    # or None if the allocation is impossible.
+    # validate - if True, the full register allocation is performed as well and its
+    #            costs are stored in CostEstimate.actual to compare them.
+    def estimate(self, f, regcount, cost_calculators, validate=False):
+        if regcount < f.minimal_register_pressure():
+            return None
 
+        with profiling.phase("estimate", allocator=self.name, function=f.name, regcount=regcount):
+            result = estimate.estimate_allocation(self, f, regcount)
+        result.costs = {cc.name: cc.estimate_diff(result) for cc in cost_calculators}
+
+        if validate:
+            g = self.perform_full_register_allocation(f, regcount)
+            result.actual = {cc.name: cc.function_diff(g, f) if g is not None else -1
+                    for cc in cost_calculators}
+
+        return result
+
+    # Estimates costs of the full register allocation of every function in a module
+    # (see Allocator.estimate). Returns list of CostEstimates or None if allocation
+    # of any function is impossible.
+    def estimate_module(self, m, regcount, cost_calculators, validate=False):
+        estimates = []
+        for f in m.functions.values():
+            result = self.estimate(f, regcount, cost_calculators, validate)
+            if result is None:
+                return None
+            estimates.append(result)
+
+        return estimates
 
     # Performs full register allocation on each function in a module with provided 
     # number of available registers. If register allocation succeeded for each
     # function from the module, a copy of the module with modified function copies is
     # returned. If allocation failed for at least one function, None is returned.
-    def perform_full_module_register_allocation(self, m, regcount):
+    # warm_start  - optional dictionary {function name: search.WarmStart}
+    # preparation - optional dictionary {function name: search.Preparation}
+    #               (see perform_full_register_allocation).
+    def perform_full_module_register_allocation(self, m, regcount, warm_start=None,
+            preparation=None):
+        warm_start = warm_start or {}
+        preparation = preparation or {}
+
+        # Worker processes can't create their own pools.
+        if self.processes != 1 and len(m.functions) > 1 \
+                and not multiprocessing.current_process().daemon:
+            return self.perform_parallel_module_register_allocation(m, regcount, warm_start,
+                    preparation)
+
         processed_functions = []
+        attempts = 0
+        counters = metrics.Counters()
         for f in m.functions.values():
-            g = self.perform_full_register_allocation(f, regcount)
+            g = self.perform_full_register_allocation(f, regcount, warm_start.get(f.name),
+                    preparation.get(f.name))
+            attempts += self.attempts
+            counters.counts.update(self.counters.counts)
             if g is None:
+                self.attempts = attempts
+                self.counters = counters
                 return None
             processed_functions.append(g)
 
+        self.attempts = attempts
+        self.counters = counters
+
+        return Module(m.name, processed_functions)
+
+    # Performs full register allocation of every function in the module in worker
+    # processes, the biggest functions first. Workers send back the allocated
+    # functions and results of their analysis in a compact form (see Function.compact
+    # and analysis.compact_analysis). As soon as allocation of one function fails,
+    # outstanding work is cancelled and None is returned.
+    # Functions of the returned module are in the same order as in m. Warm starts
+    # and preparations are filled only in worker processes, so they can't be reused
+    # by later allocations.
+    def perform_parallel_module_register_allocation(self, m, regcount, warm_start=None,
+            preparation=None):
+        warm_start = warm_start or {}
+        preparation = preparation or {}
+        functions = m.functions.values()
+        sizes = [sum(len(bb.instructions) for bb in f.bblocks.itervalues()) for f in functions]
+
+        def allocate_compact(f):
+            g = self.perform_full_register_allocation(f, regcount, warm_start.get(f.name),
+                    preparation.get(f.name))
+            compact = None
+            if g is not None:
+                compact = (g.compact(), analysis.compact_analysis(g))
+            return (compact, self.attempts, self.counters.as_dict())
+
+        processed_functions = [None] * len(functions)
+        attempts = 0
+        counters = metrics.Counters()
+        with profiling.phase("parallel module allocation", allocator=self.name, 
+                module=m.name, regcount=regcount), counters:
+            results = parallel.imap_unordered(allocate_compact, functions, self.processes, sizes)
+            try:
+                for (index, (compact, f_attempts, counts)) in results:
+                    attempts += f_attempts
+                    # Counters of worker processes are collected by hand.
+                    for (name, n) in counts.iteritems():
+                        metrics.count(name, n)
+
+                    if compact is None:
+                        processed_functions = None
+                        break
+
+                    g = Function.from_compact(compact[0], original=functions[index])
+                    analysis.apply_compact_analysis(g, compact[1])
+                    processed_functions[index] = g
+            finally:
+                results.close()
+
+        self.attempts = attempts
+        self.counters = counters
+
+        if processed_functions is None:
+            return None
+
         return Module(m.name, processed_functions)
@@ -0,0 +1,222 @@
+import utils
+import cfg
+import cfg.resolve as resolve
+from cfg.resolve import Alloc
+
+# Dry run of the full register allocation (see Allocator.estimate). Instead of
+# inserting spill code and eliminating phi instructions, we perform a single phase
+# of register allocation (with spilling) without modifying the function (see
+# Allocator.dry_run; linear scans allocate copies of their intervals, so the function
+# isn't even copied) and derive the instructions the pipeline would insert from
+# the allocation decisions:
+# - a store after the definition and a load before every use of a spilled variable
+#   (as in resolve.insert_spill_code),
+# - moves, loads and stores replacing phi instructions, ordered as in
+#   resolve.eliminate_phi, and branches ending new blocks inserted on edges.
+#
+# The estimate is exact when the allocation succeeds without spilling. Otherwise
+# the second phase of the pipeline may assign different registers, so some moves
+# may become (or stop being) redundant, and the number of registers in the first
+# phase is only approximated (see estimate_allocation).
+
+# Instruction the full register allocation would insert into the function.
+# bb         - the basic block it would be inserted into or, if it would be inserted
+#              on a new block between two blocks, the predecessor.
+# loop_depth - loop depth of the block it would be inserted into.
+# succ       - the successor if it would be inserted on a new block between bb
+#              and succ, None otherwise.
+# redundant  - whether this is a MOV between the same registers.
+class EstimatedInstruction(object):
+    __slots__ = ("opname", "bb", "loop_depth", "succ", "redundant")
+
+    def __init__(self, opname, bb, loop_depth, succ=None, redundant=False):
+        self.opname = opname
+        self.bb = bb
+        self.loop_depth = loop_depth
+        self.succ = succ
+        self.redundant = redundant
+
+    # Estimated frequency of the block it would be inserted into. Frequency analysis
+    # of the function must be up to date (see analysis.update_frequency_analysis).
+    # A new block on an edge is executed whenever the edge is taken.
+    def get_frequency(self):
+        if self.succ is None:
+            return self.bb.frequency
+        return self.bb.frequency * self.bb.succ_probs[self.succ.id]
+
+    def __repr__(self):
+        return "{}@{}".format(self.opname, self.bb.id)
+
+class CostEstimate(object):
+    def __init__(self, f, regcount):
+        self.f = f
+        self.regcount = regcount
+
+        # Number of registers in the first phase of the allocation.
+        self.frc = None
+
+        # List of EstimatedInstructions.
+        self.inserted = []
+
+        # Original MOV instructions which would become redundant, because both
+        # their variables would be allocated to the same register.
+        self.redundant = []
+
+        # Dictionaries {cost calculator name: cost difference} with estimated costs and,
+        # if the estimate was validated, costs computed by the full register allocation
+        # (-1 if it failed).
+        self.costs = {}
+        self.actual = None
+
+    # Number of inserted instructions with the given opname.
+    def count(self, opname):
+        return sum(1 for instr in self.inserted if instr.opname == opname)
+
+    def spill_count(self):
+        return self.count(cfg.Instruction.LOAD) + self.count(cfg.Instruction.STORE)
+
+    # Returns dictionary {cost calculator name: actual - estimated} or None if
+    # the estimate was not validated.
+    def errors(self):
+        if self.actual is None:
+            return None
+        return {name: self.actual[name] - cost for (name, cost) in self.costs.iteritems()}
+
+def loop_depth(bb):
+    if bb.loop is None:
+        return 0
+    return bb.loop.depth
+
+# Loop depth of a new block inserted between pred and bb: it belongs to the
+# innermost loop containing both of them.
+def edge_loop_depth(pred, bb):
+    loop = pred.loop
+    while loop is not None and bb not in loop.body:
+        loop = loop.parent
+    return loop.depth if loop is not None else 0
+
+# allocs below are dictionaries {variable id: alloc} decided by the dry run.
+def is_spilled(var, allocs):
+    return utils.is_slotname(allocs[var.id])
+
+# Same as Instruction.is_redundant with allocation allocs.
+def is_redundant(instr, allocs):
+    if instr.opname != cfg.Instruction.MOV or not instr.definition or not instr.uses:
+        return False
+    alloc1 = allocs[instr.definition.id]
+    alloc2 = allocs[list(instr.uses)[0].id]
+    return bool(alloc1 and alloc2 and alloc1 == alloc2)
+
+# Adds instructions which resolve.insert_spill_code would insert for spilled variables.
+def estimate_spill_code(f, estimate, allocs):
+    for bb in f.bblocks.itervalues():
+        depth = loop_depth(bb)
+        for instr in bb.instructions:
+            if instr.is_phi():
+                continue
+
+            if instr.definition and is_spilled(instr.definition, allocs):
+                estimate.inserted.append(EstimatedInstruction(cfg.Instruction.STORE, bb,
+                    depth))
+
+            for var in instr.uses:
+                if is_spilled(var, allocs):
+                    estimate.inserted.append(EstimatedInstruction(cfg.Instruction.LOAD, bb,
+                        depth))
+
+            if is_redundant(instr, allocs) and not instr.is_redundant():
+                estimate.redundant.append(instr)
+
+# Adds instructions which resolve.eliminate_phi would insert (see resolve.insert_moves
+# and resolve.insert_cycles). We assume that every cycle gets a free register.
+def estimate_phi_elimination(f, estimate, allocs):
+    for bb in f.bblocks.itervalues():
+        if not bb.phis:
+            continue
+
+        for pred in bb.preds.itervalues():
+            moves = []
+            for phi in bb.phis:
+                d = Alloc(phi.definition, allocs[phi.definition.id])
+                u = Alloc(phi.uses_debug[pred.id], None)
+                if pred.id in phi.uses:
+                    u = Alloc(phi.uses[pred.id], allocs[phi.uses[pred.id].id])
+                moves.append((d, u))
+
+            moves, cycles = resolve.order_moves(moves)
+            if not moves and not cycles:
+                continue
+
+            # The moves are inserted on a new block (ending with a branch to bb)
+            # if pred has more than one successor.
+            depth = loop_depth(pred)
+            succ = None
+            if len(pred.succs) > 1:
+                depth = edge_loop_depth(pred, bb)
+                succ = bb
+
+            def insert(opname, redundant=False):
+                estimate.inserted.append(EstimatedInstruction(opname, pred, depth, succ,
+                    redundant))
+
+            if succ is not None:
+                insert(cfg.Instruction.BRANCH)
+
+            for (d, u) in moves:
+                if utils.is_regname(d.alloc):
+                    if u.alloc is None or utils.is_regname(u.alloc):
+                        insert(cfg.Instruction.MOV, redundant=(d.alloc == u.alloc))
+                    elif utils.is_slotname(u.alloc):
+                        insert(cfg.Instruction.LOAD)
+
+                elif utils.is_slotname(d.alloc):
+                    if utils.is_slotname(u.alloc):
+                        insert(cfg.Instruction.LOAD)
+                    insert(cfg.Instruction.STORE)
+
+            for cycle in cycles:
+                for _ in cycle:
+                    insert(cfg.Instruction.MOV)
+
+# Maximal register pressure of the function after insertion of spill code. Spilled
+# variables don't occupy registers, except for their copies loaded right before
+# uses and defined right before stores.
+def pressure_after_spilling(f, allocs):
+    pressure = 0
+    for bb in f.bblocks.itervalues():
+        for instr in bb.instructions:
+            if instr.is_phi():
+                continue
+
+            live_in = sum(1 for var in instr.live_in if not is_spilled(var, allocs))
+            loads = sum(1 for var in instr.uses if is_spilled(var, allocs))
+            live_out = sum(1 for var in instr.live_out if not is_spilled(var, allocs))
+            if instr.definition and is_spilled(instr.definition, allocs):
+                live_out += 1
+            pressure = max(pressure, live_in + loads, live_out)
+
+    return pressure
+
+# Performs the dry run of allocator on f with regcount registers and returns
+# CostEstimate (without costs).
+#
+# Like the full register allocation (see allocators/search.py), we look for the
+# greatest number of registers frc <= regcount for the first phase after which
+# the second phase can succeed. Instead of performing the second phase, we assume
+# it succeeds if the register pressure after insertion of spill code doesn't
+# exceed regcount. Artifacts of f (see Allocator.prepare) are computed once and
+# shared by the attempts.
+def estimate_allocation(allocator, f, regcount):
+    prepared = allocator.prepare(f)
+    estimate = CostEstimate(f, regcount)
+    frc = regcount
+    while True:
+        success, allocs = allocator.dry_run(f, frc, prepared)
+        if success or frc == 0 or pressure_after_spilling(f, allocs) <= regcount:
+            break
+        frc -= 1
+
+    estimate.frc = frc
+    estimate_spill_code(f, estimate, allocs)
+    estimate_phi_elimination(f, estimate, allocs)
+    return estimate
@@ -1,5 +1,8 @@
 import utils
 import spillers
+import profiling
+import metrics
+import decisions
 from allocators.allocator import Allocator
 from cfg.printer import FunctionString, BBString, Opts
 
@@ -27,7 +30,7 @@ def build_interference_graph(f):
                             neighs[var].add(defn)
                             neighs[defn].add(var)
 
-
+    metrics.count(metrics.INTERFERENCE_EDGES, sum(len(n) for n in neighs.values()) // 2)
     return neighs
 
 # Assign registers to non-spilled variables in the provided function,
@@ -37,6 +40,7 @@ def color(f, regcount):
     regset = utils.RegisterSet(regcount)
     for var in f.entry_bblock.live_in:
         var.alloc = regset.get_free()
+        decisions.assign(var, var.alloc)
 
     def colorbb(bb):
         #print bb.id
@@ -65,16 +69,18 @@ def color(f, regcount):
                 # in the first loop of the function colorbb.
                 reg = regset.get_free()
                 defn.alloc = reg
+                decisions.assign(defn, reg)
                 #print " ", "definition", defn, "->", reg
 
-    for bb in utils.reverse_postorder(f):
+    for bb in f.reverse_postorder():
         colorbb(bb)
 
 
 # General abstract class for graph coloring register allocation algorithms
 class GraphColoringAllocator(Allocator):
 
-    def allocate_registers(self, f, regcount, spilling=True):
+    # prepared - optional result of prepare() for the function f is a copy of.
+    def allocate_registers(self, f, regcount, spilling=True, prepared=None):
         raise NotImplementedError()
 
     # This function should deal with any function modification needed
@@ -83,10 +89,12 @@ class GraphColoringAllocator(Allocator):
     def resolve(self, f):
         raise NotImplementedError()
 
-    def perform_register_allocation(self, f, regcount, spilling=True):
-        success = self.allocate_registers(f, regcount, spilling)
+    def perform_register_allocation(self, f, regcount, spilling=True, prepared=None):
+        with profiling.phase("allocate_registers"):
+            success = self.allocate_registers(f, regcount, spilling, prepared)
         if success:
-            self.resolve(f)
+            with profiling.phase("resolve"):
+                self.resolve(f)
             return True
 
         return False
@@ -97,11 +105,19 @@ class BasicGraphColoringAllocator(GraphColoringAllocator):
         self.name = name
         self.spiller = spiller
 
-    def allocate_registers(self, f, regcount, spilling=True):
+    # Only the spiller computes anything which doesn't depend on regcount.
+    def prepare(self, f):
+        return self.spiller.prepare(f)
+
+    def preparation_key(self):
+        return self.spiller.preparation_key()
+
+    def allocate_registers(self, f, regcount, spilling=True, prepared=None):
         max_pressure = f.maximal_register_pressure()
         if max_pressure > regcount:
             if spilling:
-                self.spiller.spill_variables(f, regcount)
+                with profiling.phase("spiller"):
+                    self.spiller.spill_variables(f, regcount, prepared)
         
             return False
 
@@ -1,7 +1,19 @@
+import cfg.traversal as traversal
+import budget
+import decisions
+
 class Spiller(object):
-    def spill_variables(f, regcount):
+    # prepared - optional result of prepare() for the function f is a copy of.
+    def spill_variables(f, regcount, prepared=None):
         raise NotImplementedError()
 
+    # Computes artifacts of f which don't depend on regcount (see Allocator.prepare).
+    def prepare(self, f):
+        return None
+
+    def preparation_key(self):
+        return None
+
 
 class BeladySpiller(Spiller):
     # For every instruction and basic block we define the cost as minimal distance from the nearest use
@@ -12,17 +24,13 @@ class BeladySpiller(Spiller):
     def compute_cost(self, f, var):
         infinity = f.instr_counter
         cost = {iid: infinity for iid in range(f.instr_counter)}
-        visited = set()
         processed = set()
 
-        def dfs(bb):
-            visited.add(bb.id)
+        # Called when all successors of bb have been processed.
+        def vpost(bb):
             # Minimal cost computed over successors.
             last_cost = infinity
             for s in bb.succs.values():
-                if s.id not in visited:
-                    dfs(s)
-
                 last_cost = min(last_cost, cost[s.first_instr().id])
                 for phi in s.phis:
                     if bb.id in phi.uses and phi.uses[bb.id] == var:
@@ -47,15 +55,34 @@ class BeladySpiller(Spiller):
 
             processed.add(bb)
 
-        dfs(f.entry_bblock)
+        traversal.dfs(f.entry_bblock, vpost=vpost)
         return cost
 
 
-    def spill_variables(self, f, regcount):
-        to_spill = set()
-        cost = {}
+    # Returns dictionary {variable id: {position: cost}} for all variables of f, where
+    # position is pair (basic block id, index) for instructions and basic block id for
+    # basic blocks. Contrary to instruction ids, positions are the same in copies of f.
+    def compute_costs(self, f):
+        positions = {instr.id: (bb.id, i) for bb in f.bblocks.values()
+                for (i, instr) in enumerate(bb.instructions)}
+        costs = {}
         for var in f.vars.values():
-            cost[var] = self.compute_cost(f, var)
+            cost = self.compute_cost(f, var)
+            costs[var.id] = {positions.get(key, key): c for (key, c) in cost.iteritems()}
+
+        return costs
+
+    def prepare(self, f):
+        return self.compute_costs(f)
+
+    def preparation_key(self):
+        return self.compute_cost.im_func
+
+    def spill_variables(self, f, regcount, prepared=None):
+        to_spill = set()
+        costs = prepared
+        if costs is None:
+            costs = self.compute_costs(f)
 
         # Spills variables from the given set of live variables, according to the Belady cost function.
         def spill_from_liveset(liveset, var_cost):
@@ -70,13 +97,16 @@ class BeladySpiller(Spiller):
                 for i in range(S):
                     to_spill.add(sorted_by_cost[i])
                     sorted_by_cost[i].spill()
+                    decisions.spill(sorted_by_cost[i], sorted_by_cost[i], sorted_by_cost)
 
 
         for bb in f.bblocks.values():
-            for instr in bb.instructions:
-                spill_from_liveset(instr.live_in, var_cost = {var: cost[var][instr.id] for var in instr.live_in})
+            budget.check()
+            for (i, instr) in enumerate(bb.instructions):
+                spill_from_liveset(instr.live_in,
+                        var_cost = {var: costs[var.id][(bb.id, i)] for var in instr.live_in})
 
-            spill_from_liveset(bb.live_out, var_cost = {var: cost[var][bb.id] for var in bb.live_out})
+            spill_from_liveset(bb.live_out, var_cost = {var: costs[var.id][bb.id] for var in bb.live_out})
 
         return to_spill
 
@@ -88,17 +118,13 @@ class BeladyWithLoopsSpiller(BeladySpiller):
     def compute_cost(self, f, var):
         infinity = f.instr_counter
         cost = {iid: infinity for iid in range(f.instr_counter)}
-        visited = set()
         processed = set()
 
-        def dfs(bb):
-            visited.add(bb.id)
+        # Called when all successors of bb have been processed.
+        def vpost(bb):
             # Minimal cost computed over successors.
             last_cost = infinity
             for s in bb.succs.values():
-                if s.id not in visited:
-                    dfs(s)
-
                 last_cost = min(last_cost, cost[s.first_instr().id])
                 for phi in s.phis:
                     if bb.id in phi.uses and phi.uses[bb.id] == var:
@@ -123,7 +149,7 @@ class BeladyWithLoopsSpiller(BeladySpiller):
 
             processed.add(bb)
 
-        dfs(f.entry_bblock)
+        traversal.dfs(f.entry_bblock, vpost=vpost)
 
         print "here", var
         ## Compute maximal loop depth
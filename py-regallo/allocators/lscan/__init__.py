@@ -1 +1 @@
-from lscan import LinearScan
+from lscan import LinearScan, CountedSortedSet, ActiveSet
@@ -1,9 +1,11 @@
-from sortedcontainers import SortedSet
-from allocators.lscan import LinearScan
+from allocators.lscan import LinearScan, ActiveSet
 from allocators.lscan.intervals import Interval
 import spillers
 import sys
 import utils
+import profiling
+import budget
+import decisions
 import cfg
 
 class BasicLinearScan(LinearScan):
@@ -11,13 +13,14 @@ class BasicLinearScan(LinearScan):
         super(BasicLinearScan, self).__init__(name)
         self.spiller = spiller
 
-    # Returns dictionary {variable-id: [Interval]}
+    # Returns dictionary {variable-id: [Interval]} ordered by start points of the intervals
+    # and then by variables (see LinearScan.ordered).
     # For generality, we return list of a single Interval because in other
     # versions of the algorithm (see ExtendedLinearScan) multiple intervals
     # for one variable may appear.
     def compute_intervals(self, f):
         intervals = {v.id: Interval(v) for v in f.vars.values()}
-        bbs = utils.reverse_postorder(f)
+        bbs = f.reverse_postorder()
         utils.number_instructions(bbs)
 
         # Intervals always start from definition. If a variable is defined in a loop
@@ -61,27 +64,28 @@ class BasicLinearScan(LinearScan):
         for iv in intervals.values():
             iv.uses = sorted(iv.uses, key = lambda instr: instr.num)
 
-        # We skip empty intervals.
-        return {vid: [iv] for (vid,iv) in intervals.iteritems() if not iv.empty()}
+        # We skip empty intervals. The rest are sorted by start points once, copies
+        # bound to copies of f keep the order (see LinearScan.bind_intervals).
+        return self.ordered({vid: [iv] for (vid,iv) in intervals.iteritems() if not iv.empty()},
+                key = lambda ivl: ivl[0].fr)
 
-    
+    # intervals - intervals ordered by start points (see compute_intervals).
     def allocate_registers(self, intervals, regcount, spilling=True):
-        sorted_intervals = sorted([ivl[0] for ivl in intervals.values()], 
-                key = lambda iv: iv.fr)
+        sorted_intervals = [ivl[0] for ivl in intervals.itervalues()]
         regset = utils.RegisterSet(regcount)
-        active = SortedSet(key = lambda iv: iv.to)
+        active = ActiveSet()
         spill_occurred = False
 
         def expire_old_intervals(current):
-            for iv in active:
-                if iv.to > current.fr:
-                    return
-                active.remove(iv)
+            for iv in active.expire(current.fr):
                 regset.set_free(iv.alloc)
+                decisions.expire(iv.var, current.fr)
 
         # LinearScan main loop.
         for iv in sorted_intervals:
+            budget.check()
             expire_old_intervals(iv)
+            decisions.start(iv.var, iv.fr)
             reg = regset.get_free()
             if reg:
                 iv.allocate(reg)
@@ -89,7 +93,10 @@ class BasicLinearScan(LinearScan):
             elif not spilling:
                 return False
             else:
-                self.spiller.spill_at_interval(iv, active)
+                with profiling.phase("spiller"):
+                    candidates = decisions.variables(active)
+                    spilled = self.spiller.spill_at_interval(iv, active)
+                decisions.spill(spilled.var, iv.var, candidates)
                 spill_occurred = True
             
         if not spill_occurred:
@@ -1,22 +1,23 @@
+from allocators.lscan.intervals import furthest_next_use
+
 class Spiller(object):
     # Chooses and spills one interval (may be current).
     # Returns the spilled interval.
     # 
-    # active - SortedSet of intervals ordered by right endpoint.
+    # active - ActiveSet of intervals ordered by right endpoint.
     def spill_at_interval(self, current, active):
         raise NotImplementedError()
 
 
 class FurthestFirst(Spiller):
     def spill_at_interval(self, current, active):
-        if active:
-            spilled = active[-1] # Active interval with furthest endpoint.
-            if spilled.to > current.to:
-                current.allocate(spilled.alloc)
-                spilled.spill()
-                active.remove(spilled)
-                active.add(current)
-                return spilled
+        spilled = active.last() # Active interval with furthest endpoint.
+        if spilled is not None and spilled.to > current.to:
+            current.allocate(spilled.alloc)
+            spilled.spill()
+            active.remove(spilled)
+            active.add(current)
+            return spilled
 
         current.spill()
         return current
@@ -24,15 +25,7 @@ class FurthestFirst(Spiller):
 class FurthestNextUseFirst(Spiller):
     def spill_at_interval(self, current, active):
         if active:
-            furthest = (0, None) # (Instr num, Interval)
-            for iv in active:
-                # Find first use after the current point.
-                for use in iv.uses:
-                    if use.num > current.fr:
-                        if furthest[0] < use.num:
-                            furthest = (use.num, iv)
-                        break
-
+            furthest = furthest_next_use(active, current.fr) # (Instr num, Interval)
             if furthest[0] > current.uses[0].num:
                 spilled = furthest[1]
                 current.allocate(spilled.alloc)
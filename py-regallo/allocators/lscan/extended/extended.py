@@ -1,9 +1,52 @@
-from sortedcontainers import SortedSet
-from allocators.lscan import LinearScan
+import itertools
+from allocators.lscan import LinearScan, CountedSortedSet
 from allocators.lscan.intervals import ExtendedInterval
 from sys import maxint
 import spillers
 import utils
+import profiling
+import budget
+import decisions
+import numpy as np
+
+# CountedSortedSet of intervals allocated to registers, indexed by their registers.
+# Active and inactive intervals are kept in such sets, so the index is updated on every
+# transition between them and registers are looked up without scanning the sets.
+class RegisterIndexedSet(CountedSortedSet):
+    def __init__(self, key):
+        super(RegisterIndexedSet, self).__init__(key=key)
+        # Dictionary {register: set of intervals}.
+        self.by_register = {}
+        # Mask of registers of the intervals (see utils.register_mask).
+        self.mask = 0
+
+    def add(self, iv):
+        if iv not in self:
+            self.by_register.setdefault(iv.alloc, set()).add(iv)
+            self.mask |= utils.register_mask([iv.alloc])
+        CountedSortedSet.add(self, iv)
+
+    def remove(self, iv):
+        CountedSortedSet.remove(self, iv)
+        self.unindex(iv)
+
+    def discard(self, iv):
+        if iv in self:
+            self.unindex(iv)
+        CountedSortedSet.discard(self, iv)
+
+    # Intervals must not be reallocated while they are in the set.
+    def unindex(self, iv):
+        ivs = self.by_register[iv.alloc]
+        ivs.remove(iv)
+        if not ivs:
+            del self.by_register[iv.alloc]
+            self.mask &= ~utils.register_mask([iv.alloc])
+
+    # Removes intervals allocated to reg from the set.
+    def evict(self, reg):
+        for iv in list(self.by_register.get(reg, ())):
+            self.remove(iv)
 
 class ExtendedLinearScan(LinearScan):
     def __init__(self, spiller=spillers.default(), name="Extended Linear Scan"):
@@ -12,7 +55,7 @@ class ExtendedLinearScan(LinearScan):
 
     def compute_intervals(self, f):
         intervals = {v.id: ExtendedInterval(v) for v in f.vars.values()}
-        bbs = utils.reverse_postorder(f)
+        bbs = f.reverse_postorder()
         utils.number_instructions(bbs)
 
         for bb in bbs[::-1]:
@@ -23,10 +66,11 @@ class ExtendedLinearScan(LinearScan):
 
             for instr in bb.instructions[::-1]:
                 if instr.definition and not instr.definition.is_spilled():
-                    intervals[instr.definition.id].defn = instr
-                    last_sub = intervals[instr.definition.id].get_last_subinterval()
-                    if last_sub and not instr.is_phi(): 
-                        last_sub.fr = instr.num
+                    iv = intervals[instr.definition.id]
+                    iv.defn = instr
+                    # The last added subinterval begins at the definition.
+                    if iv.starts and not instr.is_phi(): 
+                        iv.starts[-1] = instr.num
 
                 if instr.is_phi():
                     for (bid, v) in instr.uses.iteritems():
@@ -37,8 +81,8 @@ class ExtendedLinearScan(LinearScan):
                     for v in instr.uses:
                         if not v.is_spilled():
                             intervals[v.id].uses.append(instr)
-                            last_sub = intervals[v.id].get_last_subinterval()
-                            if not last_sub or last_sub.fr > instr.num: 
+                            starts = intervals[v.id].starts
+                            if not starts or starts[-1] > instr.num: 
                                 intervals[v.id].add_subinterval(
                                         bb.first_instr().num - 0.1, 
                                         instr.num)
@@ -47,9 +91,9 @@ class ExtendedLinearScan(LinearScan):
             if not iv.empty():
                 iv.uses = sorted(iv.uses, key = lambda instr: instr.num)
                 iv.rebuild_and_order_subintervals()
-                iv.update_endpoints(iv.subintervals[0].fr, iv.subintervals[-1].to)
+                iv.update_endpoints(iv.starts[0], iv.ends[-1])
 
-        return {vid: [iv] for (vid, iv) in intervals.iteritems() if not iv.empty()}
+        return self.ordered({vid: [iv] for (vid, iv) in intervals.iteritems() if not iv.empty()})
 
 
     def try_allocate_free_register(self, current, active, inactive, regset):
@@ -66,16 +110,13 @@ class ExtendedLinearScan(LinearScan):
         # They are inactive and thus have a lifetime hole at the current position, 
         # so they do not intersect with the current interval at its definition. 
         # SSA form therefore guarantees that they never intersect.
-        if inactive:
-            # TODO: poor complexity. Change that. E.g. remember and pass active_regs.
-            occupied_regs = set([iv.alloc for iv in active])
-            for iv in inactive:
-                if iv.alloc not in occupied_regs:
-                    current.allocate(iv.alloc)
-                    current.in_lifetime_hole = True
-                    active.add(current)
-
-                    return iv.alloc
+        # The lowest register of inactive intervals which is not used by active ones.
+        reg = utils.lowest_register(inactive.mask & ~active.mask)
+        if reg:
+            current.allocate(reg)
+            current.in_lifetime_hole = True
+            active.add(current)
+            return reg
 
         return None
 
@@ -83,46 +124,51 @@ class ExtendedLinearScan(LinearScan):
         regset = utils.RegisterSet(regcount)
         spill_occurred = False
 
-        class Action:
-            START, END = 1, -1
-            def __init__(self, num, kind, sub):
-                self.num = num
-                self.kind = kind
-                self.sub = sub
-
-        # Actions are sorted by instruction number and kind.
-        actions = SortedSet(key = lambda action: (action.num, action.kind))
-
-        for ivlist in intervals.values():
-            for sub in ivlist[0].subintervals:
-                actions.add(Action(sub.fr, Action.START, sub))
-                actions.add(Action(sub.to, Action.END, sub))
-
-        active  = SortedSet(key = lambda iv: iv.to)
-        inactive = SortedSet(key = lambda iv: iv.to)
-
-        for action in actions:
-            sub, iv = action.sub, action.sub.parent
-
-            if action.kind == Action.END and iv in active:
+        # Events are endpoints of subintervals kept in parallel lists of positions,
+        # kinds and indices of their intervals. They are sorted once by position and kind
+        # (ends before starts), and events with equal keys stay in the order they were added.
+        START, END = 1, -1
+        ivs = [ivlist[0] for ivlist in intervals.values()]
+        positions, kinds, indices = [], [], []
+        for (i, iv) in enumerate(ivs):
+            for (fr, to) in zip(iv.starts, iv.ends):
+                positions += (fr, to)
+                kinds += (START, END)
+                indices += (i, i)
+        order = np.lexsort((kinds, positions)).tolist()
+
+        active = RegisterIndexedSet(key = lambda iv: iv.to)
+        inactive = RegisterIndexedSet(key = lambda iv: iv.to)
+
+        for e in order:
+            budget.check()
+            num, iv = positions[e], ivs[indices[e]]
+
+            if kinds[e] == END and iv in active:
                 # If it was not in active, it must have been spilled.
                 active.remove(iv)
-                if sub.to < iv.to: # If it's not the last subinterval.
-                    inactive.add(action.sub.parent)
+                if num < iv.to: # If it's not the last subinterval.
+                    inactive.add(iv)
                 elif not iv.in_lifetime_hole:
                     regset.set_free(iv.alloc)
+                if num == iv.to:
+                    decisions.expire(iv.var, num)
 
-            elif action.kind == Action.START and iv.fr == sub.fr: 
-                # If this SubInterval is the beginning of new Interval.
+            elif kinds[e] == START and iv.fr == num: 
+                # If this subinterval is the beginning of new Interval.
+                decisions.start(iv.var, num)
                 reg_found = self.try_allocate_free_register(iv, active, inactive, regset)
                 if not reg_found:
                     if not spilling:
                         return False
 
-                    self.spiller.spill_at_interval(iv, active, inactive)
+                    with profiling.phase("spiller"):
+                        candidates = decisions.variables(itertools.chain(active, inactive))
+                        spilled = self.spiller.spill_at_interval(iv, active, inactive)
+                    decisions.spill(spilled.var, iv.var, candidates)
                     spill_occurred = True
 
-            elif action.kind == Action.START and iv in inactive: 
+            elif kinds[e] == START and iv in inactive: 
                 # If it was not in inactive, it must have been spilled.
                 inactive.remove(iv)
                 active.add(iv)
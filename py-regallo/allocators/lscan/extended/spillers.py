@@ -1,4 +1,11 @@
+import itertools
+from allocators.lscan.intervals import furthest_next_use
+
 class Spiller(object):
+    # Chooses and spills one interval (may be current) and evicts intervals
+    # allocated to the register of the spilled one. Returns the spilled interval.
+    #
+    # active, inactive - RegisterIndexedSets of intervals ordered by right endpoint.
     def spill_at_interval(self, current, active, inactive):
         raise NotImplementedError()
 
@@ -13,13 +20,8 @@ class FurthestFirst(Spiller):
         spilled = furthest[1]
         if spilled and spilled.to > current.to:
             reg = spilled.alloc
-            for iv in list(active):
-                if iv.alloc == reg:
-                    active.remove(iv)
-
-            for iv in list(inactive):
-                if iv.alloc == reg:
-                    inactive.remove(iv)
+            active.evict(reg)
+            inactive.evict(reg)
 
             current.allocate(reg)
             spilled.spill()
@@ -32,25 +34,14 @@ class FurthestFirst(Spiller):
 
 class FurthestNextUseFirst(Spiller):
     def spill_at_interval(self, current, active, inactive):
-        furthest = (0, None)
-        for iv in list(active) + list(inactive):
-            for use in iv.uses:
-                if use.num > current.fr:
-                    if furthest[0] < use.num:
-                        furthest = (use.num, iv)
-                    break
+        furthest = furthest_next_use(itertools.chain(active, inactive), current.fr)
 
         if furthest[1] and furthest[0] > current.fr:
             spilled = furthest[1]
             reg = spilled.alloc
             
-            for iv in list(active):
-                if iv.alloc == reg:
-                    active.remove(iv)
-
-            for iv in list(inactive):
-                if iv.alloc == reg:
-                    inactive.remove(iv)
+            active.evict(reg)
+            inactive.evict(reg)
             
             current.allocate(reg)
             spilled.spill()
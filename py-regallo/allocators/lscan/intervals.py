@@ -1,4 +1,6 @@
+import bisect
 import utils
+import decisions
 
 class Interval(object):
     def __init__(self, var, fr=-0.5, to=0, alloc=None, defn=None, uses=None):
@@ -14,8 +16,41 @@ class Interval(object):
         # List of instructions which use self.var in this interval.
         self.uses = [] if uses is None else uses
 
+    # Instructions are appended to the list of uses while intervals are computed,
+    # and then it's ordered by instruction numbers. Numbers of the ordered uses are
+    # indexed when they are needed (see next_use_after), so assigning new list
+    # of uses drops the index.
+    @property
+    def uses(self):
+        return self._uses
+
+    @uses.setter
+    def uses(self, uses):
+        self._uses = uses
+        self.use_nums = None
+
+    # Returns sorted list of numbers of instructions using self.var in this interval.
+    def use_positions(self):
+        if self.use_nums is None:
+            self.use_nums = [instr.num for instr in self._uses]
+        return self.use_nums
+
+    # Returns number of the first instruction using self.var after position pos
+    # or None if there is no such instruction. O(lg n), where n = len(self.uses).
+    def next_use_after(self, pos):
+        nums = self.use_positions()
+        i = bisect.bisect_right(nums, pos)
+        return nums[i] if i < len(nums) else None
+
     def empty(self):
         return not self.uses
+
+    # Returns unallocated copy of this interval representing var.
+    # The copy shares uses and their index with this interval.
+    def copy(self, var):
+        iv = Interval(var, self.fr, self.to, None, self.defn, self.uses)
+        iv.use_nums = self.use_positions()
+        return iv
     
     def update_endpoints(self, fr=None, to=None):
         if fr is not None and (self.fr is None or self.fr > fr):
@@ -24,6 +59,7 @@ class Interval(object):
             self.to = to
 
     def allocate(self, alloc):
+        decisions.assign(self.var, alloc)
         self.alloc = alloc
         self.var.alloc = alloc
 
@@ -31,18 +67,28 @@ class Interval(object):
         self.var.spill()
         self.alloc = self.var.alloc
 
+# Returns pair (number of the next use after pos, interval) for the interval from ivs
+# whose next use after pos is the furthest one (the first of them if there are more),
+# or (0, None) if none of them is used after pos. Used by next-use spillers.
+def furthest_next_use(ivs, pos):
+    furthest = (0, None)
+    for iv in ivs:
+        num = iv.next_use_after(pos)
+        if num is not None and furthest[0] < num:
+            furthest = (num, iv)
+    return furthest
+
 # Extended version of the Interval used in ExtendedLinearScan
 # register allocator. 
 class ExtendedInterval(Interval):
+    # View of one subinterval, e.g. for printing. Subintervals are not
+    # stored as objects (see ExtendedInterval.starts and ends).
     class SubInterval:
         def __init__(self, fr, to, parent):
             self.fr = fr
             self.to = to
             self.parent = parent # Parent ExtendedInterval.
 
-        def is_last(self):
-            return self.index == len(self.parent.subintervals) - 1
-
         def intersection(self, another):
             if another.fr >= self.fr and another.fr<= self.to:
                 return another.fr
@@ -52,94 +98,104 @@ class ExtendedInterval(Interval):
 
     def __init__(self, var, fr=None, to=None, alloc=None, defn=None, uses=None):
         super(ExtendedInterval, self).__init__(var, fr, to, alloc, defn, uses)
-        self.subintervals = []
+        # Subintervals [starts[i], ends[i]]. After rebuild_and_order_subintervals
+        # they don't overlap and both lists are increasing.
+        self.starts = []
+        self.ends = []
         self.split = False
         # If the field below is True, it means that this interval was allocated
         # register occupied by another interval which is currently inactive.
         # It helps us figure out whether the register is still in use by an
         # inactive interval.
         self.in_lifetime_hole = False
-        self.next_use = 0 if uses else None
-
-    # For a single case O(n) but overall O(1).
-    def next_use(self, num):
-        if not self.uses or self.next_use >= len(self.uses):
-            return None
 
-        while (self.next_use < len(self.uses) and self.uses[self.next_use].num <= num):
-            self.next_use += 1
+    @property
+    def subintervals(self):
+        return [ExtendedInterval.SubInterval(fr, to, self)
+                for (fr, to) in zip(self.starts, self.ends)]
 
-        return self.next_use
+    def copy(self, var):
+        iv = ExtendedInterval(var, self.fr, self.to, None, self.defn)
+        iv.uses = self.uses
+        iv.use_nums = self.use_positions()
+        iv.starts = list(self.starts)
+        iv.ends = list(self.ends)
+        return iv
 
     def add_subinterval(self, fr, to):
-        siv = ExtendedInterval.SubInterval(fr, to, self)
-        self.subintervals.append(siv)
-        return siv
+        self.starts.append(fr)
+        self.ends.append(to)
 
     def empty(self):
-        return len(self.subintervals) == 0
-
-    def get_last_subinterval(self):
-        if self.empty():
-            return None
-        return self.subintervals[-1]
-
-    # O(m lg m), where m = len(self.subintervals) + len(another.subintervals)
+        return not self.starts
+
+    # Returns True if some subinterval contains position pos. O(lg m).
+    def covers(self, pos):
+        i = bisect.bisect_right(self.starts, pos) - 1
+        return i >= 0 and pos <= self.ends[i]
+
+    # Returns the first position where this and another interval intersect or None.
+    # Subintervals which end before the current subinterval of the other interval
+    # begins are skipped by binary search, so it takes O(m) in the worst case,
+    # where m = number of subintervals of both intervals, and O(k lg m) if only k of
+    # them are close to subintervals of the other interval.
     def intersection(self, another):
-        sorted_subs = sorted(self.subintervals + another.subintervals,
-                key = lambda sub: (sub.fr, sub.to))
-
-        # If two subsequent subintervals intersect, it means they are
-        # from different intervals. If i-th doesn't intersect with i+1-th
-        # it also doesn't intersect with any further.
-        for s1, s2 in zip(sorted_subs[:-1], sorted_subs[1:]):
-            i = s1.intersection(s2)
-            if i:
-                return i
+        starts1, ends1 = self.starts, self.ends
+        starts2, ends2 = another.starts, another.ends
+        i, j = 0, 0
+        while i < len(starts1) and j < len(starts2):
+            if ends1[i] < starts2[j]:
+                i = bisect.bisect_left(ends1, starts2[j], i)
+            elif ends2[j] < starts1[i]:
+                j = bisect.bisect_left(ends2, starts1[i], j)
+            else:
+                return max(starts1[i], starts2[j])
         
         return None
 
     # During intervals computation, we add new subintervals loosely,
     # no matter whether some of them overlap or not. This function
     # reorders and rebuild subintervals so that they won't overlap
-    # and will be in increasing order.
+    # and will be in increasing order. Intervals are computed backwards,
+    # so subintervals usually come in decreasing order and sorting them
+    # takes linear time.
     def rebuild_and_order_subintervals(self):
-        if not self.subintervals:
+        if not self.starts:
             return
-        new = []
-        subs = sorted(self.subintervals, key = lambda sub: sub.fr)
-        start, end = subs[0].fr, subs[0].to
-        for sub in subs[1:]:
-            if sub.fr > end + 1:
-                new.append(ExtendedInterval.SubInterval(start, end, self))
-                start, end = sub.fr, sub.to
-            elif sub.to > end:
-                end = sub.to
-        new.append(ExtendedInterval.SubInterval(start, end, self))
-        self.subintervals = new
+        subs = sorted(zip(self.starts, self.ends))
+        starts, ends = [], []
+        start, end = subs[0]
+        for (fr, to) in subs[1:]:
+            if fr > end + 1:
+                starts.append(start)
+                ends.append(end)
+                start, end = fr, to
+            elif to > end:
+                end = to
+        starts.append(start)
+        ends.append(end)
+        self.starts, self.ends = starts, ends
       
     # Splits this interval into two intervals: self = [fr, pos-1] and new = [pos, to]
     # Returns the new interval.
     def split_at(self, pos):
         # subintervals
-        sub_old = [] # Subintervals staying in first interval (self).
-        sub_new = [] # Subintervals going to sub_new interval.
-        for sub in self.subintervals:
-            if sub.to < pos:
-                sub_old.append((sub.fr, sub.to))
-            elif sub.fr > pos:
-                sub_new.append((sub.fr, sub.to))
-            else:
-                if pos > sub.fr:
-                    sub_old.append((sub.fr, pos-1))
-                sub_new.append((pos, sub.to))
+        # Those before k stay in the first interval (self), the rest go to the
+        # new one. The k-th is split if it contains pos.
+        k = bisect.bisect_left(self.ends, pos)
+        starts_old, ends_old = self.starts[:k], self.ends[:k]
+        starts_new, ends_new = self.starts[k:], self.ends[k:]
+        if starts_new and starts_new[0] < pos:
+            starts_old.append(starts_new[0])
+            ends_old.append(pos-1)
+            starts_new[0] = pos
 
         # endpoints
-        fr_old, to_old = sub_old[0][0], sub_old[-1][1]
+        fr_old, to_old = starts_old[0], ends_old[-1]
         self.fr = fr_old
         self.to = to_old
 
-        fr_new, to_new = sub_new[0][0], sub_new[-1][1]
+        fr_new, to_new = starts_new[0], ends_new[-1]
 
         # defn
         defn = None
@@ -163,15 +219,11 @@ class ExtendedInterval(Interval):
                 uses_new.append(instr)
         self.uses = uses_old
 
-        # Rewrite subintervals.
-        self.subintervals = []
-        for sub in sub_old:
-            self.add_subinterval(sub[0], sub[1])
+        self.starts, self.ends = starts_old, ends_old
 
         # TODO: the same alloc or None?
         new_iv = ExtendedInterval(self.var, fr_new, to_new, self.alloc, defn, uses_new)
-        for sub in sub_new:
-            new_iv.add_subinterval(sub[0], sub[1])
+        new_iv.starts, new_iv.ends = starts_new, ends_new
 
         return new_iv
 
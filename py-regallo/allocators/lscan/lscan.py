@@ -1,6 +1,92 @@
+import heapq
+import itertools
+import copy
+import collections
 import utils
+import profiling
+import metrics
+from sortedcontainers import SortedSet
 from allocators.allocator import Allocator
 
+# SortedSet counting insertions and removals (see metrics.py).
+class CountedSortedSet(SortedSet):
+    def add(self, value):
+        metrics.count(metrics.SORTEDSET_ADDS)
+        SortedSet.add(self, value)
+
+    def remove(self, value):
+        metrics.count(metrics.SORTEDSET_REMOVES)
+        SortedSet.remove(self, value)
+
+    def discard(self, value):
+        metrics.count(metrics.SORTEDSET_REMOVES)
+        SortedSet.discard(self, value)
+
+# Set of active intervals of BasicLinearScan ordered by right endpoints (intervals
+# with equal endpoints in the order they were added). Instead of keeping a sorted
+# list, it keeps two heaps: by nearest endpoint (for expiring) and by furthest endpoint
+# (for spilling). Removed intervals stay in the heaps and are skipped when they reach
+# the top (lazy deletion), so every operation is O(lg n) amortized. Iteration sorts
+# the intervals, which is fine for spillers, because there are at most as many active
+# intervals as registers. Endpoints of active intervals must not change.
+# Operations are counted as operations on sorted sets (see metrics.py).
+class ActiveSet(object):
+    def __init__(self):
+        # Dictionary {interval: sequence number of its entries in the heaps}.
+        self.members = {}
+        # Heaps of entries (to, sequence number, interval) and (-to, -sequence number,
+        # interval). Sequence numbers are unique, so intervals are never compared.
+        self.nearest = []
+        self.furthest = []
+        self.sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, iv):
+        return iv in self.members
+
+    def __iter__(self):
+        return iter([iv for (_, _, iv) in sorted((iv.to, seq, iv)
+            for (iv, seq) in self.members.iteritems())])
+
+    def add(self, iv):
+        metrics.count(metrics.SORTEDSET_ADDS)
+        seq = next(self.sequence)
+        self.members[iv] = seq
+        heapq.heappush(self.nearest, (iv.to, seq, iv))
+        heapq.heappush(self.furthest, (-iv.to, -seq, iv))
+        # Entries of expired intervals are removed from the top of the other heap only.
+        if len(self.furthest) > 2 * len(self.members) + 16:
+            self.furthest = [(-iv.to, -seq, iv) for (iv, seq) in self.members.iteritems()]
+            heapq.heapify(self.furthest)
+
+    def remove(self, iv):
+        metrics.count(metrics.SORTEDSET_REMOVES)
+        del self.members[iv]
+
+    # Removes and returns list of intervals ending at pos or before, in order.
+    def expire(self, pos):
+        expired = []
+        nearest, members = self.nearest, self.members
+        while nearest and nearest[0][0] <= pos:
+            _, seq, iv = heapq.heappop(nearest)
+            if members.get(iv) == seq:
+                self.remove(iv)
+                expired.append(iv)
+        return expired
+
+    # Returns the interval with the furthest endpoint (the last one in order) or None
+    # if the set is empty.
+    def last(self):
+        furthest, members = self.furthest, self.members
+        while furthest:
+            _, seq, iv = furthest[0]
+            if members.get(iv) == -seq:
+                return iv
+            heapq.heappop(furthest)
+        return None
+
 class LinearScan(Allocator): 
     def __init__(self, name):
         self.name = name
@@ -9,6 +95,34 @@ class LinearScan(Allocator):
     def compute_intervals(self, f):
         raise NotImplementedError()
 
+    # Intervals of a function are the same for all its copies, regardless of the number
+    # of registers.
+    def prepare(self, f):
+        return self.compute_intervals(f)
+
+    def preparation_key(self):
+        return self.compute_intervals.im_func
+
+    # Returns intervals {variable id: list of intervals} ordered by key(list of intervals)
+    # if it is given, and then by variables. Intervals with equal endpoints are allocated
+    # in this order, so it must not depend on the order of f.vars, which differs
+    # between copies of a function.
+    @staticmethod
+    def ordered(intervals, key=None):
+        if key is None:
+            return collections.OrderedDict(sorted(intervals.iteritems(),
+                key = lambda (vid, ivl): int(vid[1:])))
+        return collections.OrderedDict(sorted(intervals.iteritems(),
+            key = lambda (vid, ivl): (key(ivl), int(vid[1:]))))
+
+    # Returns copies of intervals computed for a function which f is a copy of,
+    # representing variables {variable id: Variable} of f, in the same order. Only
+    # allocation decisions are changed by allocate_registers, so the copies share
+    # instructions with the original intervals.
+    def bind_intervals(self, intervals, variables):
+        return collections.OrderedDict((vid, [iv.copy(variables[vid]) for iv in ivl])
+                for (vid, ivl) in intervals.iteritems())
+
     # Modifies the function intervals were build from.
     def allocate_registers(self, intervals, regcount, spilling=True):
         raise NotImplementedError()
@@ -22,12 +136,30 @@ class LinearScan(Allocator):
     # Performs full register allocation from interval computation to
     # PHI destruction and resolution. At the end performs full analaysis
     # on the input function.
-    def perform_register_allocation(self, f, regcount, spilling=True):
-        intervals = self.compute_intervals(f)
-        success = self.allocate_registers(intervals, regcount, spilling)
+    # If intervals have been prepared (see prepare), their copies are allocated instead
+    # of computing intervals of f again.
+    def perform_register_allocation(self, f, regcount, spilling=True, prepared=None):
+        with profiling.phase("compute_intervals"):
+            if prepared is None:
+                intervals = self.compute_intervals(f)
+            else:
+                intervals = self.bind_intervals(prepared, f.vars)
+        with profiling.phase("allocate_registers"):
+            success = self.allocate_registers(intervals, regcount, spilling)
         if success:
-            self.resolve(intervals)
+            with profiling.phase("resolve"):
+                self.resolve(intervals)
             return True
 
         return False
 
+    # Allocates copies of the intervals of f representing copies of its variables,
+    # so neither f nor its variables are modified. Nothing is resolved, since
+    # the dry run derives the resolution from the allocation decisions.
+    def dry_run(self, f, regcount, prepared=None):
+        if prepared is None:
+            prepared = self.prepare(f)
+        variables = {vid: copy.copy(var) for (vid, var) in f.vars.iteritems()}
+        success = self.allocate_registers(self.bind_intervals(prepared, variables), regcount)
+        return (success, {vid: var.alloc for (vid, var) in variables.iteritems()})
+
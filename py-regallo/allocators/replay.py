@@ -0,0 +1,67 @@
+import decisions
+import cfg
+import cfg.resolve as resolve
+import cfg.analysis as analysis
+
+# Replays full register allocations recorded by decisions.Recorder. Instead of
+# running the allocator, the final allocation of variables is applied to a copy
+# of the input function and only the deterministic steps of the pipeline (see
+# allocators/search.py) are performed:
+# - spill code is inserted for spilled variables (new variables get the same ids
+#   as in the recorded allocation),
+# - phi instructions are eliminated.
+# The result is the same function the allocator returned, so its costs can be
+# computed with any cost calculators.
+
+def apply_allocs(f, allocs):
+    for (vid, alloc) in allocs.iteritems():
+        if vid in f.vars:
+            f.vars[vid].alloc = alloc
+
+# Returns the allocated copy of f rebuilt from a decisions.Allocation or None if
+# the allocation failed.
+def replay(record, f):
+    if not record.success:
+        return None
+
+    g = f.copy()
+    apply_allocs(g, record.allocs)
+    if any(var.is_spilled() for var in g.vars.itervalues()):
+        resolve.insert_spill_code(g)
+        apply_allocs(g, record.allocs)
+    resolve.eliminate_phi(g, record.regcount)
+    # Temporary variables of cycles are allocated by eliminate_phi, we make sure
+    # that they have the recorded allocation.
+    apply_allocs(g, record.allocs)
+    analysis.perform_full_analysis(g)
+    return g
+
+# Returns dictionary {function name: Function} of the inputs (Functions or Modules).
+def functions_of(inputs):
+    functions = {}
+    for inp in inputs:
+        if isinstance(inp, cfg.Module):
+            functions.update(inp.functions)
+        else:
+            functions[inp.name] = inp
+    return functions
+
+# Computes costs of allocations recorded in a trace file without allocating again.
+# inputs - Functions or Modules the recorded allocations were performed on.
+#
+# Returns list of tuples (allocator name, function name, regcount, [(cost name, RESULT)])
+# in the order of the trace, where RESULT is -1 if the allocation failed. Allocations
+# of functions which are not among the inputs are skipped.
+def recost(filename, inputs, cost_calculators):
+    functions = functions_of(inputs)
+    results = []
+    for record in decisions.records(filename):
+        f = functions.get(record.function)
+        if f is None:
+            continue
+
+        g = replay(record, f)
+        costs = [(cc.name, cc.function_diff(g, f) if g is not None else -1) for cc in cost_calculators]
+        results.append((record.allocator, record.function, record.regcount, costs))
+
+    return results
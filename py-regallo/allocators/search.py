@@ -0,0 +1,305 @@
+import multiprocessing
+import parallel
+import profiling
+import metrics
+import budget
+import decisions
+import cfg.resolve as resolve
+import cfg.analysis as analysis
+
+# Full register allocation (see Allocator.perform_full_register_allocation) has
+# two phases. In the first one, the function is allocated with frc <= regcount
+# registers, spilling variables when needed. If it fails, spill code is inserted
+# and the second phase allocates the result with regcount registers and no
+# spilling. We look for the greatest frc for which both phases succeed.
+#
+# RegcountAttempts performs single attempts for a given frc and memoizes their
+# outcomes, and search strategies (LinearSearch, GallopingSearch) decide which
+# values of frc are tried.
+#
+# The first phase with spilling doesn't depend on regcount unless it allocates
+# the function without spilling (then phi elimination with regcount registers
+# follows). Functions with inserted spill code are stored in a WarmStart and
+# reused by allocations of the same function with other regcounts.
+#
+# All first-phase attempts allocate copies of f, so artifacts which don't depend on
+# the number of registers (see Allocator.prepare) are computed once, kept in
+# a Preparation and shared by every attempt.
+
+class RegcountAttempts(object):
+    def __init__(self, allocator, f, regcount, warm_start=None, preparation=None):
+        self.allocator = allocator
+        self.f = f
+        self.regcount = regcount
+
+        # WarmStart shared with allocations of f with other regcounts or None.
+        self.warm_start = warm_start
+
+        # Preparation of f shared with other allocations of f or None.
+        self.preparation = preparation
+
+        # Number of attempts of register allocation (each of them on a fresh copy
+        # of the function).
+        self.count = 0
+
+        # Dictionary {frc: allocated function or None if allocation failed}.
+        self.outcomes = {}
+
+    # Allocates a copy of fprim with rc registers and eliminates phi instructions.
+    # Returns pair (copy, success) or None if the phi elimination failed.
+    def attempt(self, fprim, rc, spilling):
+        self.count += 1
+        metrics.count(metrics.ALLOCATION_ATTEMPTS)
+        budget.check()
+        # Artifacts are computed before copying, because they may number instructions of f.
+        prepared = None
+        if fprim is self.f and self.preparation is not None:
+            prepared = self.preparation.get()
+        with profiling.phase("copy"):
+            g = fprim.copy()
+        decisions.attempt(rc, spilling)
+        with profiling.phase("register allocation", rc=rc, spilling=spilling):
+            allocation_success = self.allocator.perform_register_allocation(g, rc, spilling,
+                    prepared)
+        if not allocation_success:
+            decisions.attempt_end(decisions.FAILED)
+            return (g, False)
+        with profiling.phase("eliminate_phi"):
+            phi_elimination_success = resolve.eliminate_phi(g, self.regcount)
+        if phi_elimination_success:
+            decisions.attempt_end(decisions.SUCCEEDED)
+            return (g, True)
+        decisions.attempt_end(decisions.PHI_ELIMINATION_FAILED)
+        return None
+
+    # Tries to allocate fprim with rc, rc-1, ... registers until the phi elimination
+    # succeeds. Returns triple (copy, success, rc of the last attempt).
+    def try_allocate_and_eliminate_phi(self, fprim, rc, spilling):
+        while rc >= 0:
+            res = self.attempt(fprim, rc, spilling)
+            if res is not None:
+                return res + (rc,)
+            rc -= 1
+
+        return (None, False, -1)
+
+    # The first phase: tries to allocate f with frc, frc-1, ... registers with spilling
+    # (see try_allocate_and_eliminate_phi). If variables were spilled, spill code
+    # is inserted into the returned copy, which must not be modified later.
+    def first_phase(self, frc):
+        rc = frc
+        spilled = self.warm_start.spilled if self.warm_start is not None else {}
+        while rc >= 0:
+            if rc in spilled:
+                metrics.count(metrics.WARM_STARTS)
+                decisions.warm_start(rc)
+                return (spilled[rc], False, rc)
+
+            res = self.attempt(self.f, rc, spilling=True)
+            if res is not None:
+                g, success = res
+                if not success:
+                    with profiling.phase("insert_spill_code"):
+                        resolve.insert_spill_code(g)
+                    spilled[rc] = g
+                return res + (rc,)
+            rc -= 1
+
+        return (None, False, -1)
+
+    # Returns the allocated function if allocation with frc registers in the first
+    # phase succeeds and None otherwise.
+    def outcome(self, frc):
+        if frc in self.outcomes:
+            return self.outcomes[frc]
+
+        result = None
+        g, success, rc = self.first_phase(frc)
+        if success:
+            analysis.perform_full_analysis(g)
+            result = g
+
+        elif g is not None:
+            h, success, _ = self.try_allocate_and_eliminate_phi(g, self.regcount, spilling=False)
+            if success:
+                analysis.perform_full_analysis(h)
+                result = h
+
+        # The first phase with any frc' between rc and frc makes exactly the same
+        # attempts (from frc' down to rc), so it has the same outcome.
+        for r in range(max(rc, 0), frc + 1):
+            self.outcomes[r] = result
+
+        return result
+
+# Results of the first phase of the full register allocation of function f by
+# allocator, shared by its allocations with different regcounts (see RegcountAttempts).
+# In a sweep over regcounts, the same WarmStart should be passed to every
+# allocation of the function.
+class WarmStart(object):
+    def __init__(self, allocator, f):
+        self.allocator = allocator
+        self.fingerprint = f.fingerprint()
+
+        # Dictionary {rc: copy of f with spill code inserted after allocation with
+        # rc registers}.
+        self.spilled = {}
+
+    # Returns True if the results can be reused by allocation of f by allocator.
+    def applies_to(self, allocator, f):
+        return self.allocator is allocator and self.fingerprint == f.fingerprint()
+
+# Artifacts of function f computed by allocator.prepare, shared by all first-phase
+# attempts of allocations of f with different regcounts and by allocators with
+# the same preparation key (see Allocator.allocate_many). They are computed on first use.
+class Preparation(object):
+    def __init__(self, allocator, f):
+        self.allocator = allocator
+        self.key = allocator.preparation_key()
+        self.f = f
+        self.computed = False
+        self.artifacts = None
+
+    # Returns True if the artifacts can be used by allocation of f by allocator.
+    def applies_to(self, allocator, f):
+        return self.key is not None and self.f is f and allocator.preparation_key() == self.key
+
+    def get(self):
+        if not self.computed:
+            metrics.count(metrics.PREPARATIONS)
+            with profiling.phase("prepare", allocator=self.allocator.name, function=self.f.name):
+                self.artifacts = self.allocator.prepare(self.f)
+            self.computed = True
+        return self.artifacts
+
+# Tries frc = regcount, regcount-1, ..., 0 and returns the first successful
+# allocation. Thanks to memoized outcomes every distinct attempt is made once
+# (the plain loop made O(regcount^2) attempts in the worst case), but the result
+# is always the same.
+class LinearSearch(object):
+    def search(self, attempts, regcount):
+        for frc in range(regcount, -1, -1):
+            result = attempts.outcome(frc)
+            if result is not None:
+                return result
+
+        return None
+
+# Assumes that the outcome is monotone in frc: allocation fails for frc greater than
+# some threshold and succeeds otherwise. It tries frc = regcount, regcount-1,
+# regcount-2, regcount-4, ... until success and then finds the threshold with binary
+# search, which makes O(log regcount) attempts.
+#
+# If the outcomes observed during the search turn out not to be monotone, it falls
+# back to LinearSearch. The result may differ from LinearSearch only if the outcome
+# is not monotone between the observed values.
+class GallopingSearch(object):
+    def search(self, attempts, regcount):
+        step = 1
+        frc = regcount
+        failed = None
+        while frc >= 0 and attempts.outcome(frc) is None:
+            failed = frc
+            frc = regcount - step
+            step *= 2
+
+        if frc < 0:
+            # Nothing found yet, but values below the last probe are not known.
+            frc = 0
+            if attempts.outcome(frc) is None:
+                return LinearSearch().search(attempts, regcount)
+
+        # Invariant: outcome(lo) succeeds and outcome(hi) fails.
+        lo, hi = frc, failed
+        while hi is not None and hi - lo > 1:
+            mid = (lo + hi) // 2
+            if attempts.outcome(mid) is None:
+                hi = mid
+            else:
+                lo = mid
+
+        if not self.is_monotone(attempts.outcomes):
+            return LinearSearch().search(attempts, regcount)
+
+        return attempts.outcome(lo)
+
+    @staticmethod
+    def is_monotone(outcomes):
+        successes = [frc for (frc, res) in outcomes.iteritems() if res is not None]
+        failures = [frc for (frc, res) in outcomes.iteritems() if res is None]
+        return not successes or not failures or max(successes) < min(failures)
+
+# Tries a batch of the greatest unknown values of frc at once in worker processes
+# and returns the greatest successful one, i.e. the same allocation as LinearSearch.
+# Functions that need many retries are handled in one parallel round instead of
+# a serial chain of copies and allocations.
+#
+# Workers send back only which values of frc succeeded (allocated functions are
+# expensive to send between processes), so the winning attempt is repeated in
+# this process.
+#
+# Params:
+# processes - number of worker processes, None means all available cores.
+# batch     - number of values of frc tried at once (by default, the number of processes).
+class ParallelSearch(object):
+    def __init__(self, processes=None, batch=None):
+        self.processes = processes
+        self.batch = batch
+
+    def search(self, attempts, regcount):
+        # Worker processes can't create their own workers.
+        if multiprocessing.current_process().daemon:
+            return LinearSearch().search(attempts, regcount)
+
+        batch = self.batch or self.processes or multiprocessing.cpu_count()
+
+        # Values of frc known (from workers) to succeed.
+        successes = set()
+
+        # Returns True/False if allocation with frc succeeds/fails or None if it's unknown.
+        def status(frc):
+            if frc in successes:
+                return True
+            if frc in attempts.outcomes:
+                return attempts.outcomes[frc] is not None
+            return None
+
+        # Called in a worker process.
+        def speculate(frc):
+            count = attempts.count
+            attempts.outcome(frc)
+            flags = {r: res is not None for (r, res) in attempts.outcomes.iteritems()}
+            return (flags, attempts.count - count)
+
+        frc = regcount
+        while frc >= 0:
+            if status(frc) is False:
+                frc -= 1
+                continue
+            if status(frc) is True:
+                return attempts.outcome(frc)
+
+            candidates = [r for r in range(frc, -1, -1) if status(r) is None][:batch]
+            if len(candidates) == 1:
+                attempts.outcome(frc)
+                continue
+
+            for (_, (flags, count)) in parallel.imap_unordered(speculate, candidates, self.processes):
+                attempts.count += count
+                for (r, success) in flags.iteritems():
+                    if success:
+                        successes.add(r)
+                    else:
+                        attempts.outcomes.setdefault(r, None)
+
+                # Stop when the greatest candidate that may succeed is known.
+                r = frc
+                while status(r) is False:
+                    r -= 1
+                if status(r) is True or r < candidates[-1]:
+                    break
+
+        return None
+
+def default():
+    return LinearSearch()
@@ -0,0 +1,108 @@
+import os
+import resource
+from timeit import default_timer
+
+#########################################################################
+################################ BUDGETS ################################
+#########################################################################
+
+# Limits of time and memory of a single computation (e.g. one register
+# allocation). Checks are cooperative: long running loops call check(),
+# which raises TimeBudgetExceeded or MemoryBudgetExceeded if the enabled
+# Budget is exceeded. When no Budget is enabled, check() only checks
+# a global variable.
+#
+# Budgets are inherited by forked worker processes (see parallel.py) and
+# exceptions raised there are re-raised in the parent process.
+
+# Results recorded instead of a cost when the budget is exceeded.
+TIMEOUT = "timeout"
+OOM = "oom"
+
+# Memory usage is read from the system at most once per this number of seconds.
+MEMORY_CHECK_INTERVAL = 0.05
+
+class BudgetExceeded(Exception):
+    result = None
+
+class TimeBudgetExceeded(BudgetExceeded):
+    result = TIMEOUT
+
+class MemoryBudgetExceeded(BudgetExceeded):
+    result = OOM
+
+# Budget currently enabled or None.
+current = None
+
+def check():
+    if current is not None:
+        current.check()
+
+# Returns resident set size of this process in megabytes.
+def resident_memory():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / float(1024 * 1024)
+    except (IOError, OSError, ValueError, IndexError):
+        # Peak resident set size (in kilobytes on Linux, bytes on Mac OS).
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1024.0
+
+# Budget of a computation which starts when the budget is enabled. It can be used
+# as a context manager:
+#
+#   with Budget(seconds=60, memory=1024):
+#       allocator.perform_full_register_allocation(f, regcount)
+#
+# Params:
+# seconds - limit of wall time or None.
+# memory  - limit of memory (in megabytes) the process may allocate above the
+#           usage at the moment of enabling, or None.
+class Budget(object):
+    def __init__(self, seconds=None, memory=None):
+        self.seconds = seconds
+        self.memory = memory
+        self.previous = None
+        self.start = None
+        self.memory_start = None
+        self.last_memory_check = None
+
+    def enable(self):
+        global current
+        self.previous = current
+        current = self
+        self.start = default_timer()
+        self.last_memory_check = self.start
+        if self.memory is not None:
+            self.memory_start = resident_memory()
+
+    def disable(self):
+        global current
+        current = self.previous
+        self.previous = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+        return False
+
+    def elapsed(self):
+        return default_timer() - self.start
+
+    def check(self):
+        now = default_timer()
+        if self.seconds is not None and now - self.start > self.seconds:
+            raise TimeBudgetExceeded("Time budget of {} s exceeded".format(self.seconds))
+
+        if self.memory is not None and now - self.last_memory_check >= MEMORY_CHECK_INTERVAL:
+            self.last_memory_check = now
+            if resident_memory() - self.memory_start > self.memory:
+                raise MemoryBudgetExceeded("Memory budget of {} MB exceeded".format(self.memory))
+
+        # Enclosing budgets are checked too.
+        if self.previous is not None:
+            self.previous.check()
@@ -1,4 +1,10 @@
 import utils
+import parallel
+import profiling
+import metrics
+import budget
+import traversal
+from liveset import LiveSet
 from cfg import Loop, Function, Module
 
 ###############################################################################
@@ -22,30 +28,49 @@ def compute_defs_and_uevs(bb):
     bb.defs = defs
     bb.uevs = uevs
 
-# Liveness analysis for instructions.
+# Liveness analysis for instructions. Live sets of consecutive instructions
+# share their structure (see cfg.liveset.LiveSet): live-in set of an instruction
+# is the live-out set of the previous one and is stored as a difference from
+# its own live-out set. The differences are computed against an ordinary set
+# updated while walking the block backwards, so no LiveSet membership is checked.
 def perform_instr_liveness_analysis(bb, check_correctness=False):
-    current_live_set = bb.live_out.copy()
+    live = set(bb.live_out)
+    current_live_set = LiveSet.from_iterable(live)
 
     for instr in bb.instructions[::-1]:
-        instr.live_out = current_live_set.copy()
+        instr.live_out = current_live_set
 
-        if instr.definition:
-            var = instr.definition
-            if var in current_live_set:
-                current_live_set.remove(var)
+        removed = []
+        var = instr.definition
+        if var and var in live:
+            live.remove(var)
+            removed.append(var)
 
+        added = []
         if not instr.is_phi(): # ?
             for var in instr.uses:
-                current_live_set.add(var)
+                if var not in live:
+                    live.add(var)
+                    added.append(var)
+
+        # A variable both used and defined by instr stays live.
+        if removed and added and removed[0] in live:
+            added.remove(removed[0])
+            removed = ()
 
-        instr.live_in = current_live_set.copy()
+        current_live_set = current_live_set.apply(added, removed, live)
+        instr.live_in = current_live_set
 
 # For each basic block in the function and their instructions computes 
 # liveness sets: live_in and live_out - sets of live-in and live-out variables
 #
 # Params:
 # ordered_bbs - optional list of ordered basic blocks the analysis should be performed on.
-def perform_liveness_analysis(f, ordered_bbs = None):
+# loops       - if True, loops of f are up to date (see perform_loop_analysis), so
+#               sets of blocks are computed in a single pass (see compute_ssa_liveness)
+#               instead of iterating to a fixpoint, if possible.
+@profiling.timed("liveness analysis")
+def perform_liveness_analysis(f, ordered_bbs = None, loops = False):
     for bb in f.bblocks.values():
         compute_defs_and_uevs(bb)
         bb.live_in = set()
@@ -54,9 +79,28 @@ def perform_liveness_analysis(f, ordered_bbs = None):
     if ordered_bbs is None:
         ordered_bbs = f.bblocks.values()
 
-    change = True
+    liveness = None
+    if loops:
+        liveness = compute_ssa_liveness(f)
+
+    if liveness is not None:
+        metrics.count(metrics.LIVENESS_ITERATIONS)
+        budget.check()
+        live_in, live_out = liveness
+        for bb in ordered_bbs:
+            bb.live_out = live_out[bb.id]
+            # The same as live_in[bb.id] with variables defined by phi instructions, but
+            # built as in the iterative analysis, because the order of iteration over
+            # the sets breaks ties (e.g. registers of arguments in graph coloring).
+            phi_defs = set([phi.definition for phi in bb.phis if not phi.definition.is_spilled()])
+            maybe_live_in = (bb.uevs | (bb.live_out - bb.defs) | phi_defs)
+            bb.live_in = set([v for v in maybe_live_in if not v.is_spilled()])
+
+    change = liveness is None
     while change:
         change = False
+        metrics.count(metrics.LIVENESS_ITERATIONS)
+        budget.check()
         for bb in ordered_bbs:
             prev_bb_live_out = bb.live_out.copy()
             prev_bb_live_in = bb.live_in.copy()
@@ -83,6 +127,66 @@ def perform_liveness_analysis(f, ordered_bbs = None):
     for bb in ordered_bbs:
         perform_instr_liveness_analysis(bb) # updates liveness for each instruction.
 
+# Computes live sets of basic blocks in one backward pass instead of iterating
+# to a fixpoint, after Wimmer, Franz "Linear Scan Register Allocation on SSA Form".
+# Blocks are processed in postorder, so all successors of a block are processed
+# before it, except loop headers reached by back edges. Variables live at
+# the beginning of a loop header (other than defined by its phi instructions) are
+# defined before the loop, so they are live at the beginning and at the end of
+# every block of the loop. It uses loops of f (see perform_loop_analysis) and
+# doesn't modify f.
+#
+# Returns pair of dictionaries {basic block id: live-in set}, {basic block id: live-out
+# set}, where live-out sets are the same as bb.live_out computed by the iterative
+# analysis and live-in sets are the same as bb.live_in without variables defined by
+# phi instructions. If a retreating edge is not a back edge of any loop (the CFG is
+# irreducible or loops are out of date), a block is unreachable or a variable is
+# defined more than once (f is not in SSA form, e.g. after phi elimination),
+# returns None.
+def compute_ssa_liveness(f):
+    ordered_bbs = f.reverse_postorder()
+    if len(ordered_bbs) != len(f.bblocks):
+        return None
+
+    index = {bb.id: i for (i, bb) in enumerate(ordered_bbs)}
+    bodies = {}
+    for loop in f.loops:
+        bodies.setdefault(loop.header.id, set()).update(bb.id for bb in loop.body)
+
+    live_in = {}
+    live_out = {}
+    defined = set()
+    for bb in ordered_bbs[::-1]:
+        live = set()
+        for succ in bb.succs.values():
+            if index[succ.id] > index[bb.id]:
+                live |= live_in[succ.id]
+            elif bb.id not in bodies.get(succ.id, ()):
+                return None
+
+            for phi in succ.phis:
+                var = phi.uses.get(bb.id)
+                if var is not None and not var.is_spilled():
+                    live.add(var)
+        live_out[bb.id] = live
+
+        live = set(live)
+        for instr in bb.instructions[::-1]:
+            if instr.definition:
+                if instr.definition in defined:
+                    return None
+                defined.add(instr.definition)
+                live.discard(instr.definition)
+            if not instr.is_phi():
+                live.update(var for var in instr.uses if not var.is_spilled())
+        live_in[bb.id] = live
+
+        for bid in bodies.get(bb.id, ()):
+            live_in[bid] |= live
+            live_out[bid] |= live
+
+    return (live_in, live_out)
+
 ###############################################################################
 ################################## DOMINANCE ##################################
 ###############################################################################
@@ -91,6 +195,7 @@ def perform_liveness_analysis(f, ordered_bbs = None):
 # basic block in this function. The bb.dominators is set of basic blocks
 # that dominates bb. 
 # ordered_bbs = ids of basic blocks in order to be processed.
+@profiling.timed("dominance analysis")
 def perform_dominance_analysis(self, ordered_bbs = None):
     if ordered_bbs is None:
         ordered_bbs = self.bblocks.values()
@@ -107,6 +212,8 @@ def perform_dominance_analysis(self, ordered_bbs = None):
     change = True
     while change:
         change = False
+        metrics.count(metrics.DOMINANCE_ITERATIONS)
+        budget.check()
     
         for bb in ordered_bbs:
             dominators_size = len(bb.dominators)
@@ -125,6 +232,7 @@ def perform_dominance_analysis(self, ordered_bbs = None):
 ###############################################################################
 
 # Finds all Loops in this function.
+@profiling.timed("loop analysis")
 def perform_loop_analysis(f):
     loops = []
     def find_loop((bb_end, bb_start)):
@@ -132,10 +240,10 @@ def perform_loop_analysis(f):
             body = []
             def vpre(bb):
                 body.append(bb)
-            utils.dfs(bb_end, visited=set(), backwards=True, vpre=vpre, vstop=bb_start)
+            traversal.dfs(bb_end, backwards=True, vpre=vpre, vstop=bb_start)
             loops.append(Loop(bb_start, bb_end, body[::-1])) 
 
-    utils.dfs(f.entry_bblock, visited=set(), ef=find_loop)
+    traversal.dfs(f.entry_bblock, ef=find_loop)
     
     # Loop nesting forest
     # Compute parent relation
@@ -172,17 +280,270 @@ def perform_loop_analysis(f):
 
     f.loops = loops
 
+###############################################################################
+################################## FREQUENCY ##################################
+###############################################################################
+
+# Probabilities that a branch goes in the predicted direction, after
+# Wu, Larus "Static Branch Frequency and Program Profile Analysis".
+LOOP_BRANCH_PROB = 0.88     # Back edges are taken.
+LOOP_EXIT_PROB = 0.80       # Edges leaving a loop are not taken.
+CALL_PROB = 0.78            # Successors with a call are not taken.
+RETURN_PROB = 0.72          # Successors with a return are not taken.
+UNWIND_PROB = 0.99          # Exception edges (to landing pads) are not taken.
+MAX_CYCLIC_PROB = 0.999     # Bound for back edges of loops that are never left.
+
+# Combines two probabilities of taking the same edge using Dempster-Shafer theory.
+def combine_probabilities(p1, p2):
+    taken = p1 * p2
+    return taken / (taken + (1 - p1) * (1 - p2))
+
+# Estimates probabilities of the edges leaving the basic block bb using
+# loop and branch heuristics and returns dictionary {successor id: probability}.
+#
+# loop_bodies - dictionary {loop id: set of ids of basic blocks in the loop}.
+def estimate_branch_probabilities(bb, loop_bodies):
+    succs = bb.succs.values()
+    if len(succs) != 2:
+        return {s.id: 1.0 / len(succs) for s in succs}
+
+    def contains(s, opnames):
+        return any(instr.opname in opnames for instr in s.instructions)
+
+    def is_back_edge(s):
+        return s.dominates(bb)
+
+    def is_loop_exit(s):
+        return bb.loop is not None and s.id not in loop_bodies[bb.loop.id]
+
+    # Each heuristic is a pair (predicate, probability that the edge satisfying
+    # the predicate is taken). It applies only if exactly one successor satisfies it.
+    heuristics = [
+        (lambda s: s.instructions and s.first_instr().opname == "landingpad", 1 - UNWIND_PROB),
+        (is_back_edge, LOOP_BRANCH_PROB),
+        (is_loop_exit, 1 - LOOP_EXIT_PROB),
+        (lambda s: contains(s, ["call", "invoke"]), 1 - CALL_PROB),
+        (lambda s: contains(s, ["ret"]), 1 - RETURN_PROB)]
+
+    s1, s2 = succs
+    prob = 0.5 # probability of taking the edge (bb, s1)
+    for (predicate, p) in heuristics:
+        satisfied1, satisfied2 = predicate(s1), predicate(s2)
+        if satisfied1 and not satisfied2:
+            prob = combine_probabilities(prob, p)
+        elif satisfied2 and not satisfied1:
+            prob = combine_probabilities(prob, 1 - p)
+
+    return {s1.id: prob, s2.id: 1 - prob}
+
+# Returns set of ids of headers of loops which are never left (e.g. infinite loops):
+# no edge leads outside of the body of all loops with the header.
+def never_left_loop_headers(f):
+    bodies = {}
+    for loop in f.loops:
+        bodies.setdefault(loop.header.id, set()).update(bb.id for bb in loop.body)
+
+    return set(hid for (hid, body) in bodies.iteritems()
+            if all(s.id in body for bid in body for s in f.bblocks[bid].succs.values()))
+
+# Estimates how many times each basic block is executed per one execution of
+# the function. For each basic block it sets bb.frequency and bb.succ_probs -
+# dictionary {successor id: probability of the edge}. Probabilities sum up to 1
+# except for blocks in loops which are never left (see below).
+#
+# Frequencies satisfy the flow equations:
+#   freq(entry) = 1 + sum of freq(p) * prob(p, entry)
+#   freq(b)     = sum of freq(p) * prob(p, b) over predecessors p of b
+# Instead of solving them as a linear system, they are propagated over the loop
+# nest as in Wu, Larus. Loops are processed from the innermost ones: frequencies
+# of blocks of a loop are computed relative to its header in reverse postorder,
+# which gives the probability of getting back to the header (cyclic probability).
+# Then the header is executed 1 / (1 - cyclic probability) times per entry to the
+# loop when the enclosing loop (or the whole function) is processed. It takes
+# O(n * d) time for n basic blocks and loop nesting depth d. In irreducible CFGs
+# flow along edges which are neither forward nor back edges is ignored.
+#
+# It requires dominance and loop analysis to be performed beforehand.
+@profiling.timed("frequency analysis")
+def perform_frequency_analysis(f):
+    bbs = f.reverse_postorder()
+    loop_bodies = {loop.id: set(bb.id for bb in loop.body) for loop in f.loops}
+    for bb in bbs:
+        bb.succ_probs = estimate_branch_probabilities(bb, loop_bodies)
+
+    # Loops with the same header are processed together: {header id: body ids}.
+    headers = {}
+    for loop in f.loops:
+        headers.setdefault(loop.header.id, set()).update(loop_bodies[loop.id])
+
+    # A loop which is never left is executed infinitely many times. As Wu and Larus,
+    # we bound probabilities of its back edges so that its cyclic probability is
+    # MAX_CYCLIC_PROB, and it is executed at most 1 / (1 - MAX_CYCLIC_PROB) times.
+    never_left = never_left_loop_headers(f)
+
+    # Dictionary {header id: cyclic probability} of processed loops.
+    cyclic_probs = {}
+
+    # Propagates frequencies from head over blocks of the body (all blocks if None),
+    # where head is executed once, and returns dictionary {bblock id: frequency}.
+    # Frequencies of headers of inner loops are multiplied by 1 / (1 - their cyclic
+    # probability). If head is a loop header, its cyclic probability is computed.
+    def propagate(head, body):
+        freq = {}
+        back = []
+        for bb in bbs:
+            if body is not None and bb.id not in body:
+                continue
+
+            if bb is head:
+                bfreq = 1.0
+            else:
+                bfreq = sum(freq.get(p.id, 0.0) * p.succ_probs[bb.id]
+                        for p in bb.preds.values() if not bb.dominates(p))
+                if bb.id in cyclic_probs:
+                    bfreq /= 1 - cyclic_probs[bb.id]
+            freq[bb.id] = bfreq
+
+            if body is not None and head.id in bb.succ_probs and head.dominates(bb):
+                back.append(bb)
+
+        if body is not None:
+            cyclic = sum(freq[bb.id] * bb.succ_probs[head.id] for bb in back)
+            if head.id in never_left and cyclic > 0:
+                for bb in back:
+                    bb.succ_probs[head.id] *= MAX_CYCLIC_PROB / cyclic
+                cyclic = MAX_CYCLIC_PROB
+            cyclic_probs[head.id] = cyclic
+
+        return freq
+
+    # Bodies of loops with different headers are either disjoint or nested,
+    # so inner loops are processed first if they are ordered by size.
+    for (hid, body) in sorted(headers.iteritems(), key = lambda (hid, body): len(body)):
+        propagate(f.bblocks[hid], body)
+
+    freq = propagate(f.entry_bblock, None)
+    entry_factor = 1 / (1 - cyclic_probs.get(f.entry_bblock.id, 0.0))
+    for bb in bbs:
+        bb.frequency = freq[bb.id] * entry_factor
+
+# Performs frequency analysis of f unless its results are up to date, i.e. every
+# basic block has its frequency and probabilities of the edges to all of its
+# successors. They become outdated when register allocation inserts new basic
+# blocks on edges. Frequencies are only needed by frequency-weighted costs, so
+# they are not a part of the full analysis.
+def update_frequency_analysis(f):
+    for bb in f.reverse_postorder():
+        if bb.frequency is None or len(bb.succ_probs) != len(bb.succs) \
+                or any(s.id not in bb.succ_probs for s in bb.succs.values()):
+            perform_frequency_analysis(f)
+            return
+
 ###############################################################################
 ###############################################################################
 ###############################################################################
 
-def perform_full_analysis(obj):
+# Performs liveness, dominance and loop analysis of the given Function,
+# Module or list of Modules and returns the list of analyzed functions.
+#
+# Params:
+# processes - number of processes the analysis is performed in. If it is
+#             different than 1, functions are analyzed in parallel in worker
+#             processes (None means all available cores).
+def perform_full_analysis(obj, processes=1):
+    functions = collect_functions(obj)
+    if processes != 1 and len(functions) > 1:
+        return perform_parallel_full_analysis(functions, processes)
+
+    for f in functions:
+        with profiling.phase("full analysis", function=f.name):
+            utils.number_instructions(f.reverse_postorder())
+            perform_dominance_analysis(f)
+            perform_loop_analysis(f)
+            perform_liveness_analysis(f, loops=True)
+
+    return functions
+
+# Returns list of functions from a Function, Module or a list of them.
+def collect_functions(obj):
     if isinstance(obj, Function):
-        utils.number_instructions(utils.reverse_postorder(obj))
-        perform_liveness_analysis(obj)
-        perform_dominance_analysis(obj)
-        perform_loop_analysis(obj)
-
+        return [obj]
     elif isinstance(obj, Module):
-        for f in obj.functions.values():
-            perform_full_analysis(f)
+        return obj.functions.values()
+
+    functions = []
+    for o in obj:
+        functions.extend(collect_functions(o))
+
+    return functions
+
+###############################################################################
+############################## PARALLEL ANALYSIS ##############################
+###############################################################################
+
+# Analysis is independent for every function so it can be performed in
+# worker processes. Workers perform the iterative parts of the analysis
+# (liveness and dominance fixpoints, loop detection) and send back only the
+# block-level results as ids. Instruction numbering and instruction-level
+# liveness are then recomputed locally in a single pass over every block.
+def perform_parallel_full_analysis(functions, processes=None):
+    sizes = [sum(len(bb.instructions) for bb in f.bblocks.itervalues()) for f in functions]
+    results = parallel.imap_unordered(analyze_compact, functions, processes, sizes)
+    for (index, compact) in results:
+        apply_compact_analysis(functions[index], compact)
+
+    return functions
+
+# Performs full analysis of the function (in a worker process) and returns
+# its results in a compact form (see compact_analysis).
+def analyze_compact(f):
+    perform_full_analysis(f)
+    return compact_analysis(f)
+
+# Returns results of the full analysis of the function in a compact form:
+# (blocks, loops) where
+# blocks - list of tuples (bid, live-in ids, live-out ids, dominator ids, index of bb.loop)
+# loops  - list of tuples (header id, tail id, body ids, index of parent, depth)
+def compact_analysis(f):
+    loop_index = {loop.id: i for (i, loop) in enumerate(f.loops)}
+    def index(loop):
+        return loop_index[loop.id] if loop is not None else None
+
+    blocks = []
+    for bb in f.bblocks.itervalues():
+        blocks.append((bb.id,
+            [v.id for v in bb.live_in],
+            [v.id for v in bb.live_out],
+            [dom.id for dom in bb.dominators],
+            index(bb.loop)))
+
+    loops = []
+    for loop in f.loops:
+        loops.append((loop.header.id, loop.tail.id, [bb.id for bb in loop.body], 
+            index(loop.parent), loop.depth))
+
+    return (blocks, loops)
+
+# Updates the function with the results computed by analyze_compact.
+def apply_compact_analysis(f, compact):
+    blocks, loops = compact
+    utils.number_instructions(f.reverse_postorder())
+
+    f.loops = []
+    for (hid, tid, body_ids, parent, depth) in loops:
+        loop = Loop(f.bblocks[hid], f.bblocks[tid], [f.bblocks[bid] for bid in body_ids])
+        loop.depth = depth
+        f.loops.append(loop)
+
+    for (loop, (_, _, _, parent, _)) in zip(f.loops, loops):
+        if parent is not None:
+            loop.parent = f.loops[parent]
+
+    for (bid, live_in, live_out, dominators, loop) in blocks:
+        bb = f.bblocks[bid]
+        compute_defs_and_uevs(bb)
+        bb.live_in = set(f.vars[vid] for vid in live_in)
+        bb.live_out = set(f.vars[vid] for vid in live_out)
+        bb.dominators = set(f.bblocks[did] for did in dominators)
+        bb.loop = f.loops[loop] if loop is not None else None
+        perform_instr_liveness_analysis(bb)
@@ -1,6 +1,12 @@
 import utils
+import metrics
+import traversal
+import edges
 import json
+import collections
+import hashlib
 import os.path
+import numpy as np
 from copy import deepcopy
 
 #########################################################################
@@ -39,18 +45,89 @@ class Variable:
         return str(self.id)
 
     def spill(self):
+        metrics.count(metrics.SPILLS)
         self.alloc = utils.slot(self)
     
     def is_spilled(self):
         return utils.is_slotname(self.alloc)
 
-class Instruction:
+# Read-only set of Variables used by a (non-phi) instruction, derived from its operands.
+# Every variable appears once, even if it is used by more than one operand.
+class VariableUses(collections.Set):
+    def __init__(self, instr):
+        self.instr = instr
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    def __iter__(self):
+        return iter(self.instr.variables)
+
+    # Only Variables have kind VARIABLE, so it is enough to look for var's id.
+    # We compare ids directly, which is much faster than Variable.__eq__.
+    def __contains__(self, var):
+        return isinstance(var, Variable) and var.id in self.instr.variable_ids
+
+    def __len__(self):
+        return len(self.instr.variables)
+
+    def __repr__(self):
+        return "VariableUses(" + repr(list(self)) + ")"
+
+# Read-only dictionary {pred block id: value} of operands of a phi instruction.
+# If variables_only is True, it contains only Variables (without constants).
+class PhiOperands(collections.Mapping):
+    def __init__(self, instr, variables_only):
+        self.instr = instr
+        self.variables_only = variables_only
+        # Views are created again when operands change, so the size is computed once.
+        self.size = sum(1 for _ in self)
+
+    def index(self, bid):
+        instr = self.instr
+        k = instr.phi_index.get(bid)
+        if k is not None and self.variables_only and instr.operand_kinds[k] != Instruction.VARIABLE:
+            return None
+        return k
+
+    def __getitem__(self, bid):
+        k = self.index(bid)
+        if k is None:
+            raise KeyError(bid)
+        return self.instr.operands[k]
+
+    def __contains__(self, bid):
+        return self.index(bid) is not None
+
+    def __iter__(self):
+        instr = self.instr
+        for k in range(len(instr.phi_blocks)):
+            if not self.variables_only or instr.operand_kinds[k] == Instruction.VARIABLE:
+                yield instr.phi_blocks[k]
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+class Instruction(object):
     PHI = "phi"
     LOAD = "load_"
     STORE = "store_"
     MOV = "mov"
     BRANCH = "br"
 
+    # Kinds of operands.
+    VARIABLE = 0
+    CONST = 1
+    LABEL = 2
+    SLOT = 3
+
+    # uses       - Variables used by the instruction (for PHI: list of pairs (pred block id, var)).
+    # uses_debug - all values used by the instruction (for PHI: list of pairs (pred block id, val)).
+    #              Names of variables from uses are replaced by these variables.
     def __init__(self, bb, defn, opname, uses, uses_debug, ssa=True):
         # Parent BasicBlock.
         self.bb = bb
@@ -80,38 +157,60 @@ class Instruction:
         # we want to know what was the original instructions of the modified ones.
         self.original = None
 
-        # Variables that are used by this instruction. It doesn't include constants, labels
-        # or any other values that are not interesting for register allocator. 
-        # All values (also constants and labels) are hold in self.uses_debug (see below).
-        # If this is PHI instruction, self.uses is turned into dictionary {pred block id: var}.
-        self.uses = uses if uses else set()
-
-        # If this is PHI instruction, phi_preds maps variable id to corresponding
-        # predecessor block id.
+        # List of all values used by the instruction: Variables, constants, labels (basic block ids)
+        # and memory slots, in the original order. Kinds of the operands (VARIABLE, CONST, LABEL
+        # or SLOT) are hold in the parallel bytearray operand_kinds.
+        # Variables used by the instruction (self.uses) and all its values (self.uses_debug)
+        # are views derived from the operands. They should be modified only with set_operands,
+        # replace_operand and replace_phi_block.
+        self.operands = []
+        self.operand_kinds = bytearray()
+
+        # If this is PHI instruction, phi_blocks[k] is the id of predecessor block
+        # the value operands[k] comes from. Otherwise None.
+        self.phi_blocks = None
+
+        # Data derived from the operands (see update_derived).
+        # Non-phi instruction: tuple of distinct used Variables and set of their ids.
+        self.variables = ()
+        self.variable_ids = frozenset()
+        # PHI instruction: dictionaries {pred block id: index of its operand} and
+        # {variable id: pred block id} (see phi_preds).
+        self.phi_index = None
         self.phi_preds = None
-
-        # List of all values (not only allocable Variables) used by the instruction.
-        # If this is PHI instruction, self.uses_debug is turned into dictionary {pred block if: value}
-        self.uses_debug = uses_debug if uses_debug else []
+        # Views returned by uses and uses_debug.
+        self.uses_view = None
+        self.uses_debug_view = ()
       
-        # Set of variables live-in and live-out at this instruction.
-        # and dictionaries of live variables with their allocations
+        # Sets of variables live-in and live-out at this instruction (LiveSets).
         self.live_in = None
         self.live_out = None
 
+        uses = uses if uses else []
+        uses_debug = uses_debug if uses_debug else []
         if opname == Instruction.PHI:
-            phi_uses = {}
-            self.phi_preds = {}
-            for (bid, var) in uses:
-                phi_uses[bid] = var
-                self.phi_preds[var.id] = bid
-            
-            self.uses = phi_uses
-            phi_uses = {}
+            phi_uses = dict(uses)
+            operands = []
+            phi_blocks = []
             for (bid, val) in uses_debug:
-                phi_uses[bid] = val
+                var = phi_uses.get(bid)
+                if var is not None and isinstance(val, basestring) and val == var.id:
+                    val = var
+                phi_blocks.append(bid)
+                operands.append(val)
+            for (bid, var) in uses:
+                if bid not in phi_blocks:
+                    phi_blocks.append(bid)
+                    operands.append(var)
+
+            self.set_operands(operands, phi_blocks)
 
-            self.uses_debug = phi_uses
+        else:
+            variables = {var.id: var for var in uses}
+            operands = [variables.get(val, val) if isinstance(val, basestring) else val 
+                    for val in uses_debug]
+            operands.extend(var for var in uses if var not in operands)
+            self.set_operands(operands)
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
@@ -119,37 +218,109 @@ class Instruction:
             
         return False
 
+    # Returns kind of the operand val: VARIABLE, LABEL, SLOT or CONST.
+    @staticmethod
+    def operand_kind(val):
+        if isinstance(val, Variable):
+            return Instruction.VARIABLE
+        if isinstance(val, basestring):
+            if utils.is_slotname(val):
+                return Instruction.SLOT
+            if utils.is_bbname(val):
+                return Instruction.LABEL
+        return Instruction.CONST
+
+    # Variables used by this instruction. It doesn't include constants, labels
+    # or any other values that are not interesting for register allocator. 
+    # If this is PHI instruction, it is a dictionary {pred block id: var}.
+    @property
+    def uses(self):
+        return self.uses_view
+
+    # All values (also constants and labels) used by the instruction (a tuple).
+    # If this is PHI instruction, it is a dictionary {pred block id: value}.
+    @property
+    def uses_debug(self):
+        return self.uses_debug_view
+
+    # Recomputes data derived from the operands. It must be called after every
+    # change of operands, kinds or phi blocks.
+    def update_derived(self):
+        if self.phi_blocks is None:
+            variables = []
+            ids = set()
+            for (val, kind) in zip(self.operands, self.operand_kinds):
+                if kind == Instruction.VARIABLE and val.id not in ids:
+                    ids.add(val.id)
+                    variables.append(val)
+            self.variables = tuple(variables)
+            self.variable_ids = frozenset(ids)
+            self.phi_index = None
+            self.phi_preds = None
+            self.uses_view = VariableUses(self)
+            self.uses_debug_view = tuple(self.operands)
+        else:
+            self.phi_index = {}
+            for k in range(len(self.phi_blocks)):
+                self.phi_index.setdefault(self.phi_blocks[k], k)
+            self.phi_preds = {}
+            for bid in self.phi_blocks:
+                k = self.phi_index[bid]
+                if self.operand_kinds[k] == Instruction.VARIABLE:
+                    self.phi_preds[self.operands[k].id] = bid
+            self.uses_view = PhiOperands(self, variables_only=True)
+            self.uses_debug_view = PhiOperands(self, variables_only=False)
+
+    # Sets new list of operands (and for PHI instruction, ids of corresponding
+    # predecessor blocks).
+    def set_operands(self, operands, phi_blocks=None):
+        assert (phi_blocks is not None) == self.is_phi()
+        self.operands = list(operands)
+        self.operand_kinds = bytearray(Instruction.operand_kind(val) for val in self.operands)
+        if phi_blocks is not None:
+            self.phi_blocks = list(phi_blocks)
+        self.update_derived()
+
+    # Replaces all occurrences of the operand old by new.
+    def replace_operand(self, old, new):
+        kind = Instruction.operand_kind(new)
+        for k in range(len(self.operands)):
+            if self.operands[k] == old:
+                self.operands[k] = new
+                self.operand_kinds[k] = kind
+        self.update_derived()
+
+    # Changes the predecessor block of PHI operand from old_bid to new_bid.
+    def replace_phi_block(self, old_bid, new_bid):
+        for k in range(len(self.phi_blocks)):
+            if self.phi_blocks[k] == old_bid:
+                self.phi_blocks[k] = new_bid
+        self.update_derived()
+
     # Create a deep copy of the instruction inside Basic Block cbb.
     # Assumes that cbb.f has already all variable regsitered in f.vars.
-    def copy(self, cbb):
-        cuses = set()
-        cuses_debug = []
+    # memo - dictionary shared by copies of instructions from the same function.
+    def copy(self, cbb, memo=None):
         cf = cbb.f
-        if self.is_phi():
-            cuses = [(bid, cf.vars[v.id]) for (bid,v) in self.uses.iteritems()]
-            for (bid, val) in self.uses_debug.iteritems():
-                if isinstance(val, Variable):
-                    cuses_debug.append((bid, cf.vars[val.id]))
-                else:
-                    cuses_debug.append((bid, val))
-            
-        else:
-            cuses = set([cf.vars[v.id] for v in self.uses])
-            for val in self.uses_debug:
-                if isinstance(val, Variable):
-                    cuses_debug.append(cf.vars[val.id])
-                else:
-                    cuses_debug.append(val)
-
-      
         cdefn = cf.vars[self.definition.id] if self.definition else None
-        ci = Instruction(cbb, cdefn, self.opname, cuses, cuses_debug)
+        ci = Instruction(cbb, cdefn, self.opname, None, None)
+        ci.operands = [cf.vars[val.id] if kind == Instruction.VARIABLE else val
+                for (val, kind) in zip(self.operands, self.operand_kinds)]
+        ci.operand_kinds = bytearray(self.operand_kinds)
+        if self.phi_blocks is not None:
+            ci.phi_blocks = list(self.phi_blocks)
+        ci.update_derived()
+
         ci.original = self.original if self.f.is_copy else self
 
         ci.num = self.num
         
-        ci.live_in = set([cf.vars[var.id] for var in self.live_in])
-        ci.live_out = set([cf.vars[var.id] for var in self.live_out])
+        # Live sets are shared between instructions, so we copy them with a memo
+        # common for the whole function to keep the structure shared.
+        if memo is None:
+            memo = {}
+        ci.live_in = self.live_in.remap(cf.vars, memo)
+        ci.live_out = self.live_out.remap(cf.vars, memo)
         
         return ci
 
@@ -160,35 +331,25 @@ class Instruction:
         opname = instruction_json['opname']
         defn = bb.f.get_or_create_variable(instruction_json['def'])
         is_phi = (opname == Instruction.PHI)
-        uses = set()
-        uses_debug = []
+        operands = []
+        phi_blocks = [] if is_phi else None
 
-        # Setting up uses and phi predecessors.
+        # Setting up operands and phi predecessors.
         for op_json in instruction_json['use']:
             val_name = op_json['val'] if is_phi else op_json
-            bb_id = utils.extract_id(op_json['bb']) if is_phi else None
+            if is_phi:
+                phi_blocks.append(utils.extract_id(op_json['bb']))
 
             if utils.is_varname(val_name):
-                v = bb.f.get_or_create_variable(val_name)
-                if is_phi:
-                    uses.add((bb_id, v))
-                    uses_debug.append((bb_id, v))
-                else:
-                    uses.add(v)
-                    uses_debug.append(v)
-
+                operands.append(bb.f.get_or_create_variable(val_name))
             elif utils.is_bbname(val_name): # label, keep just id string.
-                if is_phi:
-                    uses_debug.append((bb_id, utils.extract_id(val_name)))
-                else:
-                    uses_debug.append(utils.extract_id(val_name))
+                operands.append(utils.extract_id(val_name))
             else:
-                if is_phi:
-                    uses_debug.append((bb_id, val_name))
-                else:
-                    uses_debug.append(val_name)
+                operands.append(val_name)
 
-        return cls(bb, defn, opname, uses, uses_debug)
+        instr = cls(bb, defn, opname, None, None)
+        instr.set_operands(operands, phi_blocks)
+        return instr
 
     def is_phi(self):
         return self.opname == Instruction.PHI
@@ -217,11 +378,19 @@ class Instruction:
     def register_pressure_out(self):
         return len(self.live_out)
 
-class BasicBlock:
+class BasicBlock(object):
     def __init__(self, bid, f, llvm_name = None):
         # Id of the basic block of the form "bb[0-9]+".
         self.id = bid
 
+        # Index of the basic block in the EdgeStore of its function.
+        self.index = f.edges.add_block(self)
+
+        # Dictionaries of predecessors and successors {bblock-id: BasicBlock}.
+        # They are views of the function's EdgeStore (see cfg/edges.py).
+        self.preds = edges.EdgeView(self, backwards=True)
+        self.succs = edges.EdgeView(self, backwards=False)
+
         # Optional name taken from llvm IR.
         self.llvm_name = llvm_name
 
@@ -234,10 +403,6 @@ class BasicBlock:
         # List of phi instructions if there are any in this block.
         self.phis = []
 
-        # Dictionaries of predecessors and successors {bblock-id: BasicBlock}.
-        self.preds = {}
-        self.succs = {}
-
         # Sets of definition and upward-exposed variables (used before any redefinition)
         self.defs = set()
         self.uevs = set()
@@ -254,6 +419,20 @@ class BasicBlock:
         # inside any loop.
         self.loop = None
 
+        # Estimated execution frequency of this block and probabilities of the edges
+        # to successors {bblock-id: probability} (see analysis.perform_frequency_analysis).
+        self.frequency = None
+        self.succ_probs = None
+
+    # Returns list of ids of basic blocks this block branches to, in the order
+    # of labels in its terminator (the last instruction).
+    def branch_targets(self):
+        if not self.instructions:
+            return []
+        last = self.instructions[-1]
+        return [val for (val, kind) in zip(last.operands, last.operand_kinds) 
+                if kind == Instruction.LABEL]
+
     # Creates new Basic Block object from given json inside provided Function f.
     @classmethod
     def from_json(cls, bblock_json, f):
@@ -369,6 +548,9 @@ class Function:
         self.name = fname
         self.is_copy = is_copy
 
+        # Edges between basic blocks of this function.
+        self.edges = edges.EdgeStore(self)
+
         # Dictionary of all variables in this function {vid: Variable}.
         self.vars = {}
         self.free_vid = "v1"
@@ -388,6 +570,8 @@ class Function:
         # List of loops in this function
         self.loops = []
 
+        # Cached list of basic blocks in reverse postorder, see reverse_postorder().
+        self.rpo = None
 
     @classmethod
     def from_json(cls, function_json):
@@ -407,32 +591,25 @@ class Function:
 
             pred_ids = [utils.extract_id(fname) for fname in bbj['predecessors']]
             for pid in pred_ids:
-                bblocks[bid].preds[pid] = bblocks[pid]
-                bblocks[pid].succs[bid] = bblocks[bid]
+                f.edges.add_edge(bblocks[pid], bblocks[bid])
 
         # Find all reachable blocks and remove unreachable ones.
         reachable = set()
         def store_reachable(bb):
             reachable.add(bb.id)
 
-        utils.dfs(entry_bblock, set(), vpre=store_reachable)
+        traversal.dfs(entry_bblock, vpre=store_reachable)
         reachable_bblocks = {bid: bb for (bid, bb) in bblocks.iteritems() if bid in reachable}
         for bb in bblocks.values():
-            pred_ids = bb.preds.keys()
-            for pid in pred_ids:
-                if pid not in reachable_bblocks:
-                    del bb.preds[pid]
-
-            succ_ids = bb.succs.keys()
-            for sid in succ_ids:
-                if sid not in reachable_bblocks:
-                    del bb.succs[sid]
+            if bb.id not in reachable_bblocks:
+                f.edges.remove_block_edges(bb)
 
         f.set_bblocks(reachable_bblocks, entry_bblock)
         return f
 
     # Deepcopy of the function.
     def copy(self):
+        metrics.count(metrics.FUNCTION_COPIES)
         cf = Function(self.name, is_copy=True)
         cf.vars = {vid: deepcopy(var) for (vid, var) in self.vars.iteritems()}
         #cf.reset_alloc_assignment()
@@ -446,12 +623,22 @@ class Function:
 
         cf.entry_bblock = cf.bblocks[self.entry_bblock.id]
 
+        # Edges (with the same order of neighbours).
+        succ_lists = []
+        pred_lists = []
+        for cbb in cf.edges.blocks:
+            bb = self.bblocks[cbb.id]
+            succ_lists.append([cf.bblocks[s.id].index for s in bb.succs.itervalues()])
+            pred_lists.append([cf.bblocks[p.id].index for p in bb.preds.itervalues()])
+        cf.edges.build(succ_lists, pred_lists)
+        if self.rpo is not None:
+            cf.rpo = [cf.bblocks[bb.id] for bb in self.rpo]
+
         # Copy basic blocks.
+        memo = {}
         for (bid, bb) in self.bblocks.iteritems():
             cbb = cf.bblocks[bid] # copy
             
-            cbb.preds = {k: cf.bblocks[k] for k in bb.preds.keys()}
-            cbb.succs = {k: cf.bblocks[k] for k in bb.succs.keys()}
             cbb.dominators = set([cf.bblocks[dom.id] for dom in bb.dominators])
             
             cbb.uevs = set([cf.get_or_create_variable(v.id) for v in bb.uevs])
@@ -459,10 +646,13 @@ class Function:
             
             cbb.live_in = set([cf.get_or_create_variable(v.id) for v in bb.live_in]) 
             cbb.live_out = set([cf.get_or_create_variable(v.id) for v in bb.live_out])
+
+            cbb.frequency = bb.frequency
+            cbb.succ_probs = None if bb.succ_probs is None else dict(bb.succ_probs)
             
             #instructions:
             for instr in bb.instructions:
-                ci = instr.copy(cbb)
+                ci = instr.copy(cbb, memo)
                 if ci.is_phi():
                     cbb.phis.append(ci)
                 cbb.instructions.append(ci)
@@ -485,6 +675,88 @@ class Function:
 
         return cf 
 
+    # Returns the function (without results of analyses) in a compact form made
+    # of tuples, lists and strings, which is cheap to pickle and send between
+    # processes (see parallel.py):
+    # (name, entry block id, instruction counter, variables, blocks) where
+    # variables    - list of tuples (vid, llvm name, alloc)
+    # blocks       - list of tuples (bid, llvm name, succ ids, pred ids, instructions)
+    # instructions - list of tuples (iid, definition vid, opname, operands, operand kinds,
+    #                phi blocks, ssa, iid of the original instruction)
+    # Variable operands are replaced by their ids. As in Function.copy, if this
+    # function is not a copy, its instructions are the originals.
+    def compact(self):
+        variables = [(v.id, v.llvm_name, v.alloc) for v in self.vars.itervalues()]
+
+        blocks = []
+        for bb in self.bblocks.itervalues():
+            instructions = []
+            for instr in bb.instructions:
+                original = instr.original if self.is_copy else instr
+                operands = [val.id if kind == Instruction.VARIABLE else val
+                        for (val, kind) in zip(instr.operands, instr.operand_kinds)]
+                instructions.append((instr.id,
+                    instr.definition.id if instr.definition else None,
+                    instr.opname, operands, str(instr.operand_kinds), instr.phi_blocks, instr.ssa,
+                    original.id if original is not None else None))
+
+            blocks.append((bb.id, bb.llvm_name,
+                [s.id for s in bb.succs.itervalues()],
+                [p.id for p in bb.preds.itervalues()],
+                instructions))
+
+        return (self.name, self.entry_bblock.id, self.instr_counter, variables, blocks)
+
+    # Creates the function from its compact form (see Function.compact).
+    # original - the function whose instructions are the originals of the instructions
+    #            of the compacted one (usually the input of register allocation) or None.
+    @classmethod
+    def from_compact(cls, compact, original=None):
+        name, entry_id, instr_counter, variables, blocks = compact
+        f = cls(name, is_copy=(original is not None))
+        for (vid, llvm_name, alloc) in variables:
+            v = Variable(vid)
+            v.llvm_name = llvm_name
+            v.alloc = alloc
+            f.vars[vid] = v
+
+        originals = {}
+        if original is not None:
+            for bb in original.bblocks.itervalues():
+                for instr in bb.instructions:
+                    originals[instr.id] = instr
+
+        for (bid, llvm_name, _, _, instructions) in blocks:
+            bb = BasicBlock(bid, f, llvm_name)
+            f.bblocks[bid] = bb
+            for (iid, defn, opname, operands, kinds, phi_blocks, ssa, orig) in instructions:
+                instr = Instruction(bb, f.vars[defn] if defn else None, opname, None, None, ssa)
+                instr.id = iid
+                instr.operand_kinds = bytearray(kinds)
+                instr.operands = [f.vars[val] if kind == Instruction.VARIABLE else val
+                        for (val, kind) in zip(operands, instr.operand_kinds)]
+                instr.phi_blocks = phi_blocks
+                instr.update_derived()
+                instr.original = originals.get(orig)
+                bb.instructions.append(instr)
+                if instr.is_phi():
+                    bb.phis.append(instr)
+
+        f.instr_counter = instr_counter
+        f.entry_bblock = f.bblocks[entry_id]
+
+        # Edges (with the same order of neighbours).
+        neighbours = {bid: (succs, preds) for (bid, _, succs, preds, _) in blocks}
+        succ_lists = []
+        pred_lists = []
+        for bb in f.edges.blocks:
+            succs, preds = neighbours[bb.id]
+            succ_lists.append([f.bblocks[sid].index for sid in succs])
+            pred_lists.append([f.bblocks[pid].index for pid in preds])
+        f.edges.build(succ_lists, pred_lists)
+
+        return f
+
     # Returns the maximum over minimal register pressure
     # values in all basic blocks in this function.
     # see BasicBlock.minimal_register_pressure()
@@ -497,27 +769,135 @@ class Function:
 
     # Returns the maximal "maximal register pressure" over
     # all basic blocks. See BasicBlock.maximal_register_pressure().
+    # It is computed from the pressure profile, so only liveness of basic
+    # blocks is needed.
     def maximal_register_pressure(self):
         max_pressure = 0
         for bb in self.bblocks.values():
-            max_pressure = max(max_pressure, bb.maximal_register_pressure())
+            max_pressure = max(max_pressure, bb.register_pressure_in())
+
+        profile = self.pressure_profile()
+        if len(profile) > 0:
+            max_pressure = max(max_pressure, int(profile.max()))
 
         return max_pressure
 
+    # Returns NumPy array with register pressure at every position of the program:
+    # profile[n] is a number of variables live-out at the n-th instruction of the 
+    # function in reverse postorder (the same order in which instructions are numbered
+    # by the analysis). It needs only liveness of basic blocks (bb.live_out).
+    #
+    # Instead of computing live sets of instructions, for every variable we compute
+    # ranges of positions it is live-out at, in a single backward pass over each block.
+    # Then the profile is a cumulative sum over the sorted endpoints of the ranges.
+    def pressure_profile(self):
+        starts = []
+        ends = []
+        n = 0
+        for bb in self.reverse_postorder():
+            first = n
+            n += len(bb.instructions)
+
+            # Variable -> the first position after its current range.
+            live_until = {var: n for var in bb.live_out}
+            pos = n
+            for instr in reversed(bb.instructions):
+                pos -= 1
+                defn = instr.definition
+                if defn and defn in live_until:
+                    starts.append(pos)
+                    ends.append(live_until.pop(defn))
+
+                if not instr.is_phi():
+                    for var in instr.uses:
+                        if var not in live_until:
+                            live_until[var] = pos
+
+            for end in live_until.values():
+                starts.append(first)
+                ends.append(end)
+
+        changes = np.bincount(starts, minlength=n+1) - np.bincount(ends, minlength=n+1)
+        return np.cumsum(changes)[:n]
+
+    # Returns a stable content hash (hex string) of the function. It covers basic blocks,
+    # edges, opcodes, definitions and operands of instructions and, if with_alloc is True,
+    # current allocation of variables. It doesn't depend on dict iteration order nor object
+    # identity, so a freshly parsed copy of the same program has the same fingerprint.
+    # Without allocation, it can be used as a cache key for analyses and allocation results.
+    def fingerprint(self, with_alloc=False):
+        def key(id_):
+            return (utils.extract_num_from_id(id_), id_)
+
+        def operand(val):
+            if isinstance(val, Variable):
+                return val.id
+            return str(val)
+
+        h = hashlib.sha1()
+        h.update("function " + self.name + "\n")
+        h.update("entry " + self.entry_bblock.id + "\n")
+        for bid in sorted(self.bblocks.keys(), key=key):
+            bb = self.bblocks[bid]
+            h.update("bb " + bid + "\n")
+            h.update("succs " + " ".join(sorted(bb.succs.keys(), key=key)) + "\n")
+            for instr in bb.instructions:
+                defn = instr.definition.id if instr.definition else "-"
+                if instr.is_phi():
+                    ops = [pid + ":" + operand(val) for (pid, val)
+                            in sorted(instr.uses_debug.iteritems(), key=lambda item: key(item[0]))]
+                else:
+                    ops = [operand(val) for val in instr.uses_debug]
+                h.update(defn + " = " + instr.opname + " " + " ".join(ops) + "\n")
+
+        if with_alloc:
+            for vid in sorted(self.vars.keys(), key=key):
+                alloc = self.vars[vid].alloc
+                if alloc is not None:
+                    h.update("alloc " + vid + " " + str(alloc) + "\n")
+
+        return h.hexdigest()
+
     def reset_alloc_assignment(self):
         for var in self.vars.values():
             var.alloc = None
 
+    # Sets basic blocks of the function. Successors of every block are ordered
+    # as labels in its terminator, so that traversals don't depend on the order
+    # in which the edges were added.
     def set_bblocks(self, bbs_dict, entrybb):
         self.entry_bblock = entrybb
         self.bblocks = bbs_dict
         self.llvm_name2id = {}
 
+        targets = {}
+        def target_position(bb, succ):
+            if bb.id not in targets:
+                targets[bb.id] = bb.branch_targets()
+            if succ.id in targets[bb.id]:
+                return targets[bb.id].index(succ.id)
+            return len(targets[bb.id])
+
+        self.edges.sort_successors(target_position)
+        self.invalidate_reverse_postorder()
+
         for bb in self.bblocks.values():
             if bb.llvm_name is not None:
                 self.llvm_name2id[bb.llvm_name] = bb.id
 
 
+    # Returns list of basic blocks in reverse postorder. The list is computed once
+    # and cached until the edges of the CFG change, so it must not be modified
+    # by the caller.
+    def reverse_postorder(self):
+        if self.rpo is None:
+            self.rpo = traversal.reverse_postorder(self.entry_bblock)
+        return self.rpo
+
+    # Called whenever an edge of the CFG is added or removed (see EdgeStore).
+    def invalidate_reverse_postorder(self):
+        self.rpo = None
+
     # Finds and returns the first available variable id.
     def find_free_vid(self):
         while (self.free_vid in self.vars):
@@ -567,26 +947,14 @@ class Function:
 
     # Inserts bti between bb1 and bb2.
     def insert_basic_block_between(self, bti, bb1, bb2):
-        # Add edge bb1-bti 
-        bti.preds[bb1.id] = bb1
-        bb1.succs[bti.id] = bti
-        # Add edge bti-bb2
-        bti.succs[bb2.id] = bb2
-        bb2.preds[bti.id] = bti
-        # Delete edge (bb1, bb2).
-        del bb2.preds[bb1.id]
-        del bb1.succs[bb2.id]
+        # Replace edge (bb1, bb2) with (bb1, bti) in place and add edge (bti, bb2).
+        self.edges.replace_successor(bb1, bb2, bti)
+        self.edges.add_edge(bti, bb2)
 
         # For all phi instructions in bb2, replace all 
         # entries (bb1.id -> val) with (bti.id -> val)
         for phi in bb2.phis:
-            v = phi.uses_debug[bb1.id]
-            del phi.uses_debug[bb1.id]
-            phi.uses_debug[bti.id] = v
-
-            if bb1.id in phi.uses: # false if val is const
-                del phi.uses[bb1.id]
-                phi.uses[bti.id] = v # if condition was true, it is the same var
+            phi.replace_phi_block(bb1.id, bti.id)
 
         # Append instruction "br bb2" in bti. We use this function only for
         # new, empty basic blocks, so it is safe.
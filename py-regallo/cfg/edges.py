@@ -0,0 +1,314 @@
+import collections
+from array import array
+
+#########################################################################
+############################### CFG EDGES ###############################
+#########################################################################
+
+# Edges of the control flow graph are stored per Function, over indices of
+# basic blocks (BasicBlock.index), in the compressed sparse row (CSR) form:
+# neighbours of block u are targets[offsets[u]:offsets[u+1]]. Successors and
+# predecessors are stored separately, each in one Adjacency.
+#
+# CSR arrays are immutable in size, so changes are first recorded aside:
+# added edges in small per-block lists (extra) and removed ones as tombstones.
+# When there are too many of them, the adjacency is compacted back to CSR.
+# Compaction is linear and happens after a linear number of changes, so
+# a single change costs amortized O(1) (plus the degree of the block).
+#
+# The order of neighbours is stable: compaction preserves it and an edge
+# replaced with replace() keeps its position.
+#
+# Lists of neighbouring blocks are cached in views of blocks (EdgeView), so
+# iterating over neighbours doesn't walk the arrays. A list is built on demand
+# and dropped by the store when edges of the block change.
+
+class Adjacency(object):
+    def __init__(self):
+        self.offsets = array('l', [0])
+        self.targets = array('l')
+
+        # {u: list of neighbours added after the last compaction}
+        self.extra = {}
+        self.extra_count = 0
+
+        # Set of pairs (u, v) removed from the CSR arrays.
+        self.removed = set()
+
+        # Set of all present pairs (u, v), for constant-time edge lookups.
+        self.pairs = set()
+
+    def base_range(self, u):
+        if u + 1 < len(self.offsets):
+            return xrange(self.offsets[u], self.offsets[u+1])
+        return xrange(0)
+
+    def neighbours(self, u):
+        targets = self.targets
+        removed = self.removed
+        for k in self.base_range(u):
+            v = targets[k]
+            if not removed or (u, v) not in removed:
+                yield v
+
+        if u in self.extra:
+            for v in self.extra[u]:
+                yield v
+
+    def contains(self, u, v):
+        return (u, v) in self.pairs
+
+    # Assumes that (u, v) is not present.
+    def add(self, u, v):
+        self.extra.setdefault(u, []).append(v)
+        self.extra_count += 1
+        self.pairs.add((u, v))
+
+    # Assumes that (u, v) is present.
+    def remove(self, u, v):
+        self.pairs.discard((u, v))
+        if u in self.extra and v in self.extra[u]:
+            self.extra[u].remove(v)
+            self.extra_count -= 1
+            if not self.extra[u]:
+                del self.extra[u]
+        else:
+            self.removed.add((u, v))
+
+    # Replaces (u, v) with (u, w) at the same position. Assumes that (u, v) is present
+    # and (u, w) is not.
+    def replace(self, u, v, w):
+        if u in self.extra and v in self.extra[u]:
+            lst = self.extra[u]
+            lst[lst.index(v)] = w
+            self.pairs.discard((u, v))
+            self.pairs.add((u, w))
+            return
+
+        if (u, w) not in self.removed:
+            for k in self.base_range(u):
+                if self.targets[k] == v and (u, v) not in self.removed:
+                    self.targets[k] = w
+                    self.pairs.discard((u, v))
+                    self.pairs.add((u, w))
+                    return
+
+        self.remove(u, v)
+        self.add(u, w)
+
+    def pending(self):
+        return self.extra_count + len(self.removed)
+
+    # Rebuilds CSR arrays from lists of neighbours of blocks 0..n-1.
+    def build(self, lists):
+        offsets = array('l', [0])
+        targets = array('l')
+        pairs = set()
+        for (u, lst) in enumerate(lists):
+            targets.extend(lst)
+            offsets.append(len(targets))
+            pairs.update((u, v) for v in lst)
+
+        self.offsets = offsets
+        self.targets = targets
+        self.extra = {}
+        self.extra_count = 0
+        self.removed = set()
+        self.pairs = pairs
+
+    def compact(self, n):
+        self.build([list(self.neighbours(u)) for u in xrange(n)])
+
+
+class EdgeStore(object):
+    def __init__(self, f):
+        # Parent Function.
+        self.f = f
+
+        # List of all basic blocks created in the function, indexed by BasicBlock.index.
+        self.blocks = []
+        # Dictionary {bblock-id: BasicBlock.index}.
+        self.ids = {}
+
+        self.succs = Adjacency()
+        self.preds = Adjacency()
+
+    # Registers a new basic block and returns its index.
+    def add_block(self, bb):
+        self.blocks.append(bb)
+        self.ids[bb.id] = len(self.blocks) - 1
+        return len(self.blocks) - 1
+
+    def adjacency(self, backwards):
+        return self.preds if backwards else self.succs
+
+    # List of successors (or predecessors if backwards) of bb, cached in its view.
+    # It must not be modified.
+    def neighbours(self, bb, backwards=False):
+        view = bb.preds if backwards else bb.succs
+        if view.neighbour_list is None:
+            blocks = self.blocks
+            view.neighbour_list = [blocks[v] for v in self.adjacency(backwards).neighbours(bb.index)]
+        return view.neighbour_list
+
+    def degree(self, bb, backwards=False):
+        return len(self.neighbours(bb, backwards))
+
+    # Drops the cached lists of successors of bb and of predecessors of succs.
+    def forget(self, bb, succs):
+        bb.succs.neighbour_list = None
+        for s in succs:
+            s.preds.neighbour_list = None
+
+    def forget_all(self):
+        for bb in self.blocks:
+            bb.succs.neighbour_list = None
+            bb.preds.neighbour_list = None
+
+    def has_edge(self, bb1, bb2):
+        return self.succs.contains(bb1.index, bb2.index)
+
+    # Adds edge (bb1, bb2) if it doesn't exist yet.
+    def add_edge(self, bb1, bb2):
+        if self.has_edge(bb1, bb2):
+            return
+        self.succs.add(bb1.index, bb2.index)
+        self.preds.add(bb2.index, bb1.index)
+        self.forget(bb1, [bb2])
+        self.changed()
+
+    def remove_edge(self, bb1, bb2):
+        if not self.has_edge(bb1, bb2):
+            raise KeyError((bb1.id, bb2.id))
+        self.succs.remove(bb1.index, bb2.index)
+        self.preds.remove(bb2.index, bb1.index)
+        self.forget(bb1, [bb2])
+        self.changed()
+
+    # Replaces edge (bb1, bb2) with (bb1, bb3) keeping the position of bb3
+    # among successors of bb1.
+    def replace_successor(self, bb1, bb2, bb3):
+        if not self.has_edge(bb1, bb2):
+            raise KeyError((bb1.id, bb2.id))
+        if self.has_edge(bb1, bb3):
+            self.remove_edge(bb1, bb2)
+            return
+        self.succs.replace(bb1.index, bb2.index, bb3.index)
+        self.preds.remove(bb2.index, bb1.index)
+        self.preds.add(bb3.index, bb1.index)
+        self.forget(bb1, [bb2, bb3])
+        self.changed()
+
+    # Removes all edges from and to bb.
+    def remove_block_edges(self, bb):
+        for s in list(self.neighbours(bb)):
+            self.remove_edge(bb, s)
+        for p in list(self.neighbours(bb, backwards=True)):
+            self.remove_edge(p, bb)
+
+    # Sorts successors of every block (stable) with the key function key(bb, succ)
+    # and compacts the store.
+    def sort_successors(self, key):
+        n = len(self.blocks)
+        lists = []
+        for u in xrange(n):
+            bb = self.blocks[u]
+            succs = sorted(self.succs.neighbours(u), key = lambda v: key(bb, self.blocks[v]))
+            lists.append(succs)
+
+        self.succs.build(lists)
+        self.preds.compact(n)
+        self.forget_all()
+        self.changed(compact=False)
+
+    # Sets all edges of the store. succ_lists[u] and pred_lists[u] are lists of
+    # indices of successors and predecessors of the block with index u.
+    def build(self, succ_lists, pred_lists):
+        self.succs.build(succ_lists)
+        self.preds.build(pred_lists)
+        self.forget_all()
+        self.changed(compact=False)
+
+    # Called after every change of edges.
+    def changed(self, compact=True):
+        self.f.invalidate_reverse_postorder()
+        if not compact:
+            return
+
+        n = len(self.blocks)
+        for adj in (self.succs, self.preds):
+            if adj.pending() > (n + len(adj.targets)) // 2 + 8:
+                adj.compact(n)
+
+# Dictionary {bblock-id: BasicBlock} of successors (or predecessors if backwards)
+# of the basic block, backed by the EdgeStore of its function. Every block has
+# one view in each direction (see BasicBlock.preds and succs).
+# Setting or deleting an item adds or removes the edge in both directions.
+class EdgeView(collections.MutableMapping):
+    def __init__(self, bb, backwards):
+        self.bb = bb
+        self.backwards = backwards
+        # Cached list of the neighbours (see EdgeStore.neighbours).
+        self.neighbour_list = None
+
+    def store(self):
+        return self.bb.f.edges
+
+    # Returns the neighbour with id bid or None. O(1).
+    def find(self, bid):
+        store = self.store()
+        v = store.ids.get(bid)
+        if v is None or not store.adjacency(self.backwards).contains(self.bb.index, v):
+            return None
+        return store.blocks[v]
+
+    def edge(self, other):
+        if self.backwards:
+            return (other, self.bb)
+        return (self.bb, other)
+
+    def __getitem__(self, bid):
+        n = self.find(bid)
+        if n is None:
+            raise KeyError(bid)
+        return n
+
+    def __setitem__(self, bid, other):
+        assert bid == other.id
+        old = self.find(bid)
+        if old is other:
+            return
+        if old is not None:
+            self.store().remove_edge(*self.edge(old))
+        self.store().add_edge(*self.edge(other))
+
+    def __delitem__(self, bid):
+        n = self.find(bid)
+        if n is None:
+            raise KeyError(bid)
+        self.store().remove_edge(*self.edge(n))
+
+    def __contains__(self, bid):
+        return self.find(bid) is not None
+
+    def neighbours(self):
+        if self.neighbour_list is None:
+            return self.store().neighbours(self.bb, self.backwards)
+        return self.neighbour_list
+
+    def __iter__(self):
+        for n in self.neighbours():
+            yield n.id
+
+    def __len__(self):
+        return len(self.neighbours())
+
+    # Iterates over the neighbours at the time of the call, even if edges change.
+    def itervalues(self):
+        return iter(self.neighbours())
+
+    def values(self):
+        return self.neighbours()[:]
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
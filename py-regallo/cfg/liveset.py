@@ -0,0 +1,204 @@
+import operator
+import collections
+
+#########################################################################
+############################### LIVE SETS ###############################
+#########################################################################
+
+# LiveSet is an immutable (persistent) set of live variables. Live sets of
+# consecutive instructions differ by at most a few variables, so instead of
+# storing a full copy, a LiveSet stores only its difference from a neighbouring
+# set (base): variables added and removed with respect to the base.
+#
+# A chain of deltas ends with a set stored in full (anchor, base is None).
+# A new anchor is stored only when the deltas since the previous one contain
+# at least as many variables as the new set, so anchors never take more memory
+# than the deltas they replace. Live sets of N instructions with at most L live
+# variables take O(N + L) memory per chain (instead of O(N*L) for plain sets),
+# and membership checks walk at most O(L) deltas.
+#
+# It supports the read-only set interface (collections.Set): membership, iteration,
+# len, comparison and set operations (which return ordinary sets).
+class LiveSet(object):
+    __slots__ = ("base", "added", "removed", "size", "chain")
+
+    def __init__(self, base, added, removed, size, chain):
+        self.base = base
+        self.added = added
+        self.removed = removed
+        self.size = size
+        # Number of variables in deltas between this set and its anchor.
+        self.chain = chain
+
+    # Creates a full (anchor) LiveSet with the given variables.
+    @classmethod
+    def from_iterable(cls, variables):
+        variables = frozenset(variables)
+        return cls(None, variables, (), len(variables), 0)
+
+    # Returns the set (self - removed) | added. If nothing changes, it returns self.
+    def derive(self, added=(), removed=()):
+        rem = tuple(v for v in removed if v not in added and v in self)
+        add = tuple(set(v for v in added if v not in self))
+        return self.apply(add, rem)
+
+    # Same as derive, but the deltas are exact: no variable of added is in this set
+    # and all variables of removed are, so no membership checks are needed.
+    # variables - optional ordinary set equal to the result, which is copied
+    #             instead of materializing the result if it is stored in full.
+    def apply(self, added, removed, variables=None):
+        if not added and not removed:
+            return self
+
+        size = self.size + len(added) - len(removed)
+        chain = self.chain + len(added) + len(removed)
+        if chain > size:
+            if variables is None:
+                variables = self.materialize()
+                variables.difference_update(removed)
+                variables.update(added)
+            return LiveSet.from_iterable(variables)
+
+        return LiveSet(self, tuple(added), tuple(removed), size, chain)
+
+    # Returns a copy of this LiveSet (sharing structure with other sets
+    # already copied with the same memo) with variables replaced by
+    # the ones with the same ids from the dictionary variables.
+    def remap(self, variables, memo):
+        key = id(self)
+        if key not in memo:
+            base = None
+            if self.base is not None:
+                base = self.base.remap(variables, memo)
+            added = [variables[v.id] for v in self.added]
+            if base is None:
+                added = frozenset(added)
+            else:
+                added = tuple(added)
+            removed = tuple(variables[v.id] for v in self.removed)
+            memo[key] = LiveSet(base, added, removed, self.size, self.chain)
+
+        return memo[key]
+
+    # Returns a new, ordinary set with all variables of this LiveSet.
+    def materialize(self):
+        deltas = []
+        s = self
+        while s.base is not None:
+            deltas.append(s)
+            s = s.base
+
+        variables = set(s.added)
+        for delta in reversed(deltas):
+            variables.difference_update(delta.removed)
+            variables.update(delta.added)
+
+        return variables
+
+    def __contains__(self, var):
+        s = self
+        while s is not None:
+            if var in s.added:
+                return True
+            if var in s.removed:
+                return False
+            s = s.base
+
+        return False
+
+    # Walks the chain of deltas from this set to its anchor and yields variables
+    # which are added by the nearest delta deciding about them. Only variables of
+    # the deltas are remembered, not the whole set.
+    def __iter__(self):
+        decided = set()
+        s = self
+        while s.base is not None:
+            for var in s.added:
+                if var not in decided:
+                    decided.add(var)
+                    yield var
+            decided.update(s.removed)
+            s = s.base
+
+        for var in s.added:
+            if var not in decided:
+                yield var
+
+    def __len__(self):
+        return self.size
+
+    def __eq__(self, other):
+        if isinstance(other, LiveSet):
+            if self is other:
+                return True
+            other = other.materialize()
+        if not isinstance(other, (set, frozenset)):
+            return NotImplemented
+        return self.size == len(other) and self.materialize() == other
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    __hash__ = None
+
+    def copy(self):
+        return self.materialize()
+
+    def __sub__(self, other):
+        return self.materialize().difference(other)
+
+    def __rsub__(self, other):
+        return set(other).difference(self.materialize())
+
+    def __or__(self, other):
+        return self.materialize().union(other)
+
+    __ror__ = __or__
+
+    def __and__(self, other):
+        return self.materialize().intersection(other)
+
+    __rand__ = __and__
+
+    def __xor__(self, other):
+        return self.materialize().symmetric_difference(other)
+
+    __rxor__ = __xor__
+
+    def issubset(self, other):
+        return self.materialize().issubset(other)
+
+    def issuperset(self, other):
+        return self.materialize().issuperset(other)
+
+    def isdisjoint(self, other):
+        return self.materialize().isdisjoint(other)
+
+    # Compares this set with other using op on ordinary sets, e.g. operator.le
+    # is the subset relation.
+    def compare(self, other, op):
+        if isinstance(other, LiveSet):
+            other = other.materialize()
+        if not isinstance(other, (set, frozenset)):
+            return NotImplemented
+        return op(self.materialize(), other)
+
+    def __le__(self, other):
+        return self.compare(other, operator.le)
+
+    def __lt__(self, other):
+        return self.compare(other, operator.lt)
+
+    def __ge__(self, other):
+        return self.compare(other, operator.ge)
+
+    def __gt__(self, other):
+        return self.compare(other, operator.gt)
+
+    def __repr__(self):
+        return "LiveSet(" + repr(sorted(self.materialize())) + ")"
+
+collections.Set.register(LiveSet)
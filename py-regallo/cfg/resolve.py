@@ -1,6 +1,7 @@
 import utils
 import cfg
 import analysis
+import decisions
 
 # A helper class storing a value plus its allocation (register
 # or memory slot in case of Variable, and None in case of const).
@@ -114,12 +115,13 @@ def order_moves(moves):
 def insert_moves(bb, moves, regcount=0):
     new_instructions = []
     
-    all_regs = utils.RegisterSet(regcount).free
-    reg_defs = set() 
+    regset = utils.RegisterSet(regcount)
+    reg_defs = 0 # Mask of registers defined by the moves.
 
     for (d,u) in moves:
+        decisions.move(bb, d.alloc, u.alloc)
         if utils.is_regname(d.alloc): 
-            reg_defs.add(d.alloc)
+            reg_defs |= utils.register_mask([d.alloc])
 
             # REG - CONST
             if u.alloc is None:
@@ -156,13 +158,13 @@ def insert_moves(bb, moves, regcount=0):
                 if bb.instructions:
                     live_out = bb.instructions[-1].live_out
 
-                occupied_regs = set(var.alloc for var in live_out) | reg_defs
-                free_regs = all_regs - occupied_regs
-                if not free_regs:
+                occupied_regs = utils.register_mask(var.alloc for var in live_out) | reg_defs
+                free_reg = regset.first_free(occupied_regs)
+                if free_reg is None:
                     return False
 
                 tmp = bb.f.get_or_create_variable()
-                tmp.alloc = free_regs.pop()
+                tmp.alloc = free_reg
                 load = cfg.Instruction(bb, tmp, cfg.Instruction.LOAD, [], [u.alloc], ssa=False)
                 store = cfg.Instruction(bb, None, cfg.Instruction.STORE, [tmp], [d.alloc, tmp], ssa=False)
 
@@ -177,6 +179,7 @@ def insert_moves(bb, moves, regcount=0):
 def insert_cycles(bb, cycles):
     endpoints = []
     for cycle in cycles:
+        decisions.cycle(bb, len(cycle))
         instructions = []
         tmp = bb.f.get_or_create_variable()
         i1, i2 = None, None # endpoints of the cycle
@@ -216,11 +219,11 @@ def allocate_cycle(i1, i2, cycle_allocs, regcount=0):
     if regcount:
         regset = utils.RegisterSet(regcount)
         # registers live out at the end of the cycle
-        live_out_regs = set([var.alloc for var in i2.live_out if utils.is_regname(var.alloc)])
-        occupied = cycle_allocs | live_out_regs
-        free = regset.free - occupied
-        if free:
-            i1.definition.alloc = free.pop() 
+        live_out_regs = utils.register_mask(var.alloc for var in i2.live_out)
+        occupied = utils.register_mask(cycle_allocs) | live_out_regs
+        free = regset.first_free(occupied)
+        if free is not None:
+            i1.definition.alloc = free
             return
 
     # There is no free register, we need to spill.
@@ -232,13 +235,12 @@ def allocate_cycle(i1, i2, cycle_allocs, regcount=0):
     # tmp = mov v2 -> store mem(tmp), v2
     i1.opname = cfg.Instruction.STORE
     i1.definition = None
-    i1.uses_debug = [slot, list(i1.uses)[0]]
+    i1.set_operands([slot, list(i1.uses)[0]])
     # i1.uses stay the same.
 
     # v1 = mov tmp -> v1 = load mem(tmp)
     i2.opname = cfg.Instruction.LOAD
-    i2.uses = set()
-    i2.uses_debug = [slot]
+    i2.set_operands([slot])
     # i2.definition stays the same
 
 
@@ -408,13 +410,7 @@ def insert_spill_code(f):
                         insert_before[instr.id].append(load)
 
                 for (a, b) in replace:
-                    instr.uses.remove(a)
-                    instr.uses.add(b)
-
-                    # Replace all occurrences in uses_debug.
-                    for j, vd in enumerate(instr.uses_debug):
-                        if vd == a:
-                            instr.uses_debug[j] = b
+                    instr.replace_operand(a, b)
 
 
     # Reewrite instructions.
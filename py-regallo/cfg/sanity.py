@@ -94,9 +94,10 @@ def data_flow_is_correct(f, f_orig):
         for instr in bb.instructions:
             # For all instructions that are copies of the original ones.
             if instr.original is not None:
-                for var in instr.uses:
-                    index = instr.uses_debug.index(var)
-                    var_orig = instr.original.uses_debug[index]
+                for (index, var) in enumerate(instr.operands):
+                    if instr.operand_kinds[index] != cfg.Instruction.VARIABLE:
+                        continue
+                    var_orig = instr.original.operands[index]
                    
                     # Skip variables defined in phi instruction.
                     if var_orig.id in defs_orig and defs_orig[var_orig.id].is_phi():
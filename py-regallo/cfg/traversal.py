@@ -0,0 +1,81 @@
+#########################################################################
+########################### CFG TRAVERSALS ##############################
+#########################################################################
+
+# Traversals of the control flow graph with an explicit stack instead of
+# recursion, so that they work for CFGs of any depth (a recursive DFS hits
+# Python's recursion limit on a chain of a few thousand basic blocks).
+# Neighbours are visited in the same order as a recursive DFS would visit
+# them, so the resulting orders are identical.
+
+def neighbours(bb, backwards=False):
+    if backwards:
+        return bb.preds.itervalues()
+    return bb.succs.itervalues()
+
+# DFS that traverses basic blocks starting from bb.
+#
+# Params:
+# visited   - set of ids of already visited basic blocks. It is updated in place.
+# vpre      - function called on a basic block when it is visited for the first time.
+# vpost     - function called on a basic block when all its neighbours were processed.
+# ef        - function called on every edge (bb, neighbour), also leading to visited blocks.
+# backwards - if True, the traversal follows predecessors instead of successors.
+# vstop     - basic block at which, after calling vpre, the traversal should not go further.
+#             vpost is not called for it.
+def dfs(bb, visited=None, vpre=None, vpost=None, ef=None, backwards=False, vstop=None):
+    if visited is None:
+        visited = set()
+
+    visited.add(bb.id)
+    if vpre is not None:
+        vpre(bb)
+
+    if vstop is not None and bb.id == vstop.id:
+        return visited
+
+    # Stack of pairs (basic block, iterator over its remaining neighbours).
+    stack = [(bb, neighbours(bb, backwards))]
+    while stack:
+        current, remaining = stack[-1]
+        descended = False
+        for n in remaining:
+            if ef is not None:
+                ef((current, n))
+
+            if n.id not in visited:
+                visited.add(n.id)
+                if vpre is not None:
+                    vpre(n)
+                if vstop is not None and n.id == vstop.id:
+                    continue
+
+                stack.append((n, neighbours(n, backwards)))
+                descended = True
+                break
+
+        if not descended:
+            stack.pop()
+            if vpost is not None:
+                vpost(current)
+
+    return visited
+
+# Returns list of basic blocks reachable from bb in preorder.
+def preorder(bb, backwards=False):
+    bbs = []
+    dfs(bb, vpre=bbs.append, backwards=backwards)
+    return bbs
+
+# Returns list of basic blocks reachable from bb in postorder.
+def postorder(bb, backwards=False):
+    bbs = []
+    dfs(bb, vpost=bbs.append, backwards=backwards)
+    return bbs
+
+# Returns list of basic blocks reachable from bb in reverse postorder.
+# It guarantees that for each edge (a DOM> b), a will be before b
+def reverse_postorder(bb, backwards=False):
+    bbs = postorder(bb, backwards)
+    bbs.reverse()
+    return bbs
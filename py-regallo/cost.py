@@ -1,5 +1,6 @@
 import math
 import cfg
+import cfg.analysis as analysis
 import utils
 
 class CostCalculator():
@@ -16,6 +17,11 @@ class CostCalculator():
     def function_diff(self, f1, f2):
         return self.function_cost(f1) - self.function_cost(f2)
 
+    # Computes estimated cost difference cost(g) - cost(f) where g is the result of
+    # full register allocation of f, from allocators.estimate.CostEstimate.
+    def estimate_diff(self, estimate):
+        raise NotImplementedError()
+
     # Computes sum of cost differences between modules' corresponding functions.
     def module_diff(self, m1, m2):
         total = 0
@@ -50,6 +56,9 @@ class SpillInstructionsCounter(CostCalculator):
             total += self.bb_cost(bb)
         return total
 
+    def estimate_diff(self, estimate):
+        return estimate.spill_count()
+
 
 # This is the main cost calculator which for every instruction
 # computes L^(loop_depth) * {S - if instruction is store or load, N - otherwise}
@@ -94,3 +103,82 @@ class MainCostCalculator(CostCalculator):
 
         return res
 
+    # Phi instructions cost nothing, so we add costs of inserted instructions and
+    # subtract costs of moves which become redundant.
+    def estimate_diff(self, estimate):
+        res = 0
+        for instr in estimate.inserted:
+            if instr.redundant:
+                continue
+            cost = self.N
+            if instr.opname == cfg.Instruction.LOAD or instr.opname == cfg.Instruction.STORE:
+                cost = self.S
+            res += cost * math.pow(self.L, instr.loop_depth)
+
+        for instr in estimate.redundant:
+            res -= self.N * math.pow(self.L, instr.get_loop_depth())
+
+        return res
+
+
+
+# Cost calculator which for every instruction computes 
+# frequency(basic block) * {S - if instruction is store or load, N - otherwise}
+# where frequency is the estimated number of executions of the instruction's basic
+# block (see analysis.perform_frequency_analysis). Contrary to MainCostCalculator,
+# it takes into account branch structure, e.g. spill code in a rarely taken
+# branch of a loop is cheaper than in the loop's main path.
+class FrequencyWeightedCostCalculator(CostCalculator):
+    def __init__(self, S=2, N=1, name=None):
+        self.S = S # spill
+        self.N = N # normal
+        if name is None:
+            self.name = "Frequency cost (S={}, N={})".format(S, N)
+        else:
+            self.name = name
+
+    def instr_cost(self, instr):
+        if instr.is_redundant() or instr.is_phi():
+            return 0
+
+        if instr.opname == cfg.Instruction.LOAD or instr.opname == cfg.Instruction.STORE:
+            return self.S * instr.bb.frequency
+
+        return self.N * instr.bb.frequency
+
+    def bb_cost(self, bb):
+        res = 0
+        for instr in bb.instructions:
+            res += self.instr_cost(instr)
+
+        return res
+
+    # Frequencies are computed unless they are up to date, e.g. they are computed again
+    # after register allocation adds new basic blocks.
+    def function_cost(self, f):
+        analysis.update_frequency_analysis(f)
+        res = 0
+        for bb in f.bblocks.values():
+            res += self.bb_cost(bb)
+
+        return res
+
+    # Like MainCostCalculator.estimate_diff, but instructions are weighted by frequencies
+    # of the blocks they would be inserted into. New blocks on edges may change
+    # the branch heuristics of the allocated function, so the estimate is only
+    # approximate if any of them is inserted.
+    def estimate_diff(self, estimate):
+        analysis.update_frequency_analysis(estimate.f)
+        res = 0
+        for instr in estimate.inserted:
+            if instr.redundant:
+                continue
+            cost = self.N
+            if instr.opname == cfg.Instruction.LOAD or instr.opname == cfg.Instruction.STORE:
+                cost = self.S
+            res += cost * instr.get_frequency()
+
+        for instr in estimate.redundant:
+            res -= self.N * instr.bb.frequency
+
+        return res
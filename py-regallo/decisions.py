@@ -0,0 +1,276 @@
+import os
+import struct
+
+#########################################################################
+############################### DECISIONS ###############################
+#########################################################################
+
+# Opt-in trace of decisions made by register allocators, written as compact
+# binary events. It can be used as a context manager:
+#
+#   with Recorder("sort.trace"):
+#       utils.compute_full_results(setting)
+#
+# Every full register allocation (see Allocator.perform_full_register_allocation)
+# is recorded as ALLOCATION followed by its attempts (ATTEMPT ... ATTEMPT_END) with
+# decisions of the allocator (START, EXPIRE, ASSIGN, SPILL) and of the phi
+# elimination (MOVE, CYCLE), and RESULT with the final allocation of all variables.
+# The final allocation is enough to rebuild the allocated function from the
+# input without running the heuristics (see allocators/replay.py), e.g. to compute
+# its costs with other cost calculators.
+#
+# Hot paths call recording functions (e.g. assign(var, alloc)), which only check
+# a global variable when no Recorder is enabled.
+#
+# Decisions are recorded only in the current process, not in worker processes
+# (see parallel.py).
+
+# Kinds of events. Every event starts with its kind (one byte), followed by fields
+# packed with the format below. Strings (names of allocators, functions, variables,
+# registers, memory slots and basic blocks) are written once, as STRING events
+# with consecutive indices, and referenced by their indices. Positions of the linear
+# scan are multiples of 0.1 and are written in tenths.
+STRING, ALLOCATION, ATTEMPT, ATTEMPT_END, START, EXPIRE, ASSIGN, SPILL, MOVE, CYCLE, \
+        WARM_START, RESULT = range(12)
+
+FORMATS = {
+    STRING: "<H",        # length of the utf-8 encoded string, followed by the string
+    ALLOCATION: "<IIH",  # allocator, function, regcount
+    ATTEMPT: "<HB",      # number of registers, spilling
+    ATTEMPT_END: "<B",   # status (see below)
+    START: "<Ii",        # variable, position
+    EXPIRE: "<Ii",       # variable, position
+    ASSIGN: "<II",       # variable, register or memory slot
+    SPILL: "<IIH",       # spilled variable, current variable, number of candidates
+                         # followed by the candidates ("<I" each)
+    MOVE: "<III",        # basic block, destination alloc, source alloc ("" for constants)
+    CYCLE: "<IH",        # basic block, length of the cycle
+    WARM_START: "<H",    # number of registers (see search.WarmStart)
+    RESULT: "<BI",       # success, number of variables followed by pairs
+                         # (variable, alloc) ("<II" each)
+}
+
+# Statuses of attempts.
+FAILED, SUCCEEDED, PHI_ELIMINATION_FAILED = range(3)
+
+# Recorder currently recording decisions or None if nothing is recorded.
+recorder = None
+
+# Events are written to the file when the buffer exceeds this number of bytes.
+BUFFER_SIZE = 1 << 20
+
+def allocation(allocator, f, regcount):
+    if recorder is not None:
+        recorder.write(ALLOCATION, recorder.string(allocator.name), recorder.string(f.name), regcount)
+
+def attempt(rc, spilling):
+    if recorder is not None:
+        recorder.write(ATTEMPT, rc, int(spilling))
+
+def attempt_end(status):
+    if recorder is not None:
+        recorder.write(ATTEMPT_END, status)
+
+def start(var, pos):
+    if recorder is not None:
+        recorder.write(START, recorder.string(var.id), int(round(pos * 10)))
+
+def expire(var, pos):
+    if recorder is not None:
+        recorder.write(EXPIRE, recorder.string(var.id), int(round(pos * 10)))
+
+def assign(var, alloc):
+    if recorder is not None:
+        recorder.write(ASSIGN, recorder.string(var.id), recorder.string(alloc))
+
+# current    - variable being allocated when spilling was needed (the spilled one if
+#              there is no such variable, e.g. in graph coloring).
+# candidates - variables the spilled one was chosen from (see variables).
+def spill(spilled, current, candidates):
+    if recorder is not None:
+        candidates = [recorder.string(var.id) for var in candidates or []]
+        recorder.write(SPILL, recorder.string(spilled.id), recorder.string(current.id),
+                len(candidates), *candidates)
+
+def move(bb, dst, src):
+    if recorder is not None:
+        recorder.write(MOVE, recorder.string(bb.id), recorder.string(dst or ""),
+                recorder.string(src or ""))
+
+def cycle(bb, length):
+    if recorder is not None:
+        recorder.write(CYCLE, recorder.string(bb.id), length)
+
+def warm_start(rc):
+    if recorder is not None:
+        recorder.write(WARM_START, rc)
+
+# g - the allocated function or None if the allocation failed.
+def result(g):
+    if recorder is not None:
+        pairs = []
+        if g is not None:
+            for (vid, var) in sorted(g.vars.iteritems()):
+                pairs.extend([recorder.string(vid), recorder.string(var.alloc or "")])
+        recorder.write(RESULT, int(g is not None), len(pairs) // 2, *pairs)
+
+# Returns list of variables of the given intervals (any iterable, which is consumed
+# only if a Recorder is enabled) or None if it isn't. Candidates for spilling are
+# collected this way before the spiller modifies the set of intervals.
+def variables(intervals):
+    if recorder is None:
+        return None
+    return [iv.var for iv in intervals]
+
+# Writes events to a file while it is enabled.
+class Recorder(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = None
+        self.buffer = bytearray()
+        # Dictionary {string: index}.
+        self.strings = {}
+        self.previous = None
+        # Process the recorder was enabled in. Events of forked worker processes
+        # are dropped instead of being written to the same file.
+        self.pid = None
+
+    def enable(self):
+        global recorder
+        if self.file is None:
+            self.file = open(self.filename, "wb")
+        self.pid = os.getpid()
+        self.previous = recorder
+        recorder = self
+
+    def disable(self):
+        global recorder
+        recorder = self.previous
+        self.previous = None
+        self.flush()
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+        self.close()
+        return False
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def flush(self):
+        if os.getpid() == self.pid and self.file is not None:
+            self.file.write(self.buffer)
+            self.file.flush()
+        self.buffer = bytearray()
+
+    # Returns index of the string, writing it first if it is new.
+    def string(self, s):
+        index = self.strings.get(s)
+        if index is None:
+            index = len(self.strings)
+            self.strings[s] = index
+            data = s.encode("utf-8")
+            self.write(STRING, len(data))
+            self.buffer.extend(data)
+        return index
+
+    # Appends event of the given kind. If the format of the kind is followed by
+    # a list, its items are passed after the fields.
+    def write(self, kind, *fields):
+        fmt = FORMATS[kind]
+        count = len(fmt) - 1
+        self.buffer.append(kind)
+        self.buffer.extend(struct.pack(fmt, *fields[:count]))
+        if len(fields) > count:
+            rest = fields[count:]
+            self.buffer.extend(struct.pack("<" + "I" * len(rest), *rest))
+        if len(self.buffer) > BUFFER_SIZE:
+            self.flush()
+
+# Reads events from a file written by Recorder and yields tuples (kind, fields...)
+# with strings instead of their indices and positions in instruction numbers.
+# STRING events are not yielded. Lists (candidates of SPILL, pairs of RESULT) are
+# yielded as the last field: list of variable names or dictionary {variable: alloc}.
+# Empty allocs are yielded as None.
+def read(filename):
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    strings = []
+    def string(index):
+        return strings[index] or None
+
+    offset = 0
+    while offset < len(data):
+        kind = ord(data[offset])
+        fmt = FORMATS[kind]
+        fields = struct.unpack_from(fmt, data, offset + 1)
+        offset += 1 + struct.calcsize(fmt)
+
+        if kind == STRING:
+            strings.append(data[offset:offset + fields[0]].decode("utf-8"))
+            offset += fields[0]
+        elif kind == ALLOCATION:
+            yield (kind, strings[fields[0]], strings[fields[1]], fields[2])
+        elif kind in (START, EXPIRE):
+            yield (kind, strings[fields[0]], fields[1] / 10.0)
+        elif kind == ASSIGN:
+            yield (kind, strings[fields[0]], string(fields[1]))
+        elif kind == MOVE:
+            yield (kind, strings[fields[0]], string(fields[1]), string(fields[2]))
+        elif kind == CYCLE:
+            yield (kind, strings[fields[0]], fields[1])
+        elif kind == SPILL:
+            spilled, current, n = fields
+            candidates = struct.unpack_from("<" + "I" * n, data, offset)
+            offset += 4 * n
+            yield (kind, strings[spilled], strings[current], [strings[c] for c in candidates])
+        elif kind == RESULT:
+            success, n = fields
+            pairs = struct.unpack_from("<" + "I" * (2 * n), data, offset)
+            offset += 8 * n
+            yield (kind, bool(success), {strings[pairs[i]]: string(pairs[i+1])
+                for i in range(0, 2 * n, 2)})
+        else:
+            yield (kind,) + fields
+
+# Full register allocation read from a trace (see records).
+class Allocation(object):
+    def __init__(self, allocator, function, regcount):
+        self.allocator = allocator
+        self.function = function
+        self.regcount = regcount
+        # List of events of the allocation (without ALLOCATION and RESULT).
+        self.events = []
+        # Whether the allocation succeeded or None if the record is incomplete
+        # (e.g. because the allocation exceeded its budget).
+        self.success = None
+        # Dictionary {variable: alloc} of the allocated function.
+        self.allocs = None
+
+    # Returns list of events of the given kind.
+    def decisions(self, kind):
+        return [e for e in self.events if e[0] == kind]
+
+# Reads a trace and yields Allocations. Incomplete records are skipped.
+def records(filename):
+    current = None
+    for event in read(filename):
+        kind = event[0]
+        if kind == ALLOCATION:
+            current = Allocation(*event[1:])
+        elif current is None:
+            continue
+        elif kind == RESULT:
+            current.success, current.allocs = event[1:]
+            yield current
+            current = None
+        else:
+            current.events.append(event)
@@ -11,6 +11,8 @@ from allocators.lscan.extended import ExtendedLinearScan
 
 from cost import MainCostCalculator, SpillInstructionsCounter
 
+import profiling
+import decisions
 import cfg
 import cfg.sanity as sanity
 import cfg.resolve as resolve
@@ -20,11 +22,18 @@ from cfg.printer import BBString, InstrString, FunctionString, IntervalsString,
 import allocators.graph as graph
 from allocators.graph import BasicGraphColoringAllocator
 from allocators.graph.spillers import BeladySpiller, BeladyWithLoopsSpiller
+import allocators.replay as replay
 
 parser = argparse.ArgumentParser(description='Process json with CFG')
 parser.add_argument('-file', help="Name of the json file with CFG.")
 parser.add_argument('-dir', help="Path to the directory with json files to read.")
 parser.add_argument('-function', help="Name of the json file with CFG.")
+parser.add_argument('-jobs', type=int, default=1, help="Number of processes used for the analysis and allocation of functions (0 means all cores).")
+parser.add_argument('-trace', help="Name of the file the Chrome trace of allocation phases is written to.")
+parser.add_argument('-time_budget', type=float, help="Limit of wall time (in seconds) of a single allocation.")
+parser.add_argument('-memory_budget', type=float, help="Limit of memory (in megabytes) of a single allocation.")
+parser.add_argument('-decisions', help="Name of the file the binary trace of allocator decisions is written to.")
+parser.add_argument('-replay', help="Name of the file with a trace of allocator decisions. Costs of the recorded allocations of -file are computed without allocating.")
 
 args = parser.parse_args()
 
@@ -38,10 +47,24 @@ extnu = ExtendedLinearScan(spiller=extspillers.FurthestNextUseFirst(), name="Ext
 bgca = BasicGraphColoringAllocator(name="Graph Coloring")
 bgcaloops = BasicGraphColoringAllocator(name="Graph Coloring (Loops)", spiller=BeladyWithLoopsSpiller())
 
+for al in [bas, bcf, bnu, blu, ext, extnu, bgca, bgcaloops]:
+    al.processes = args.jobs or None
+
 mcc = MainCostCalculator()
 sic = SpillInstructionsCounter()
 
-if args.file:
+tracer = profiling.Tracer() if args.trace else None
+
+recorder = decisions.Recorder(args.decisions) if args.decisions else None
+if recorder is not None:
+    recorder.enable()
+
+if args.file and args.replay:
+    m = cfg.Module.from_file(args.file)
+    analysis.perform_full_analysis(m)
+    pprint.pprint(replay.recost(args.replay, [m], [mcc, sic]))
+
+elif args.file:
     
     m = cfg.Module.from_file(args.file)
     analysis.perform_full_analysis(m)
@@ -50,7 +73,11 @@ if args.file:
             inputs = [m],
             regcounts = range(m.minimal_register_pressure(), m.minimal_register_pressure()+3),
             allocators = [bas, bnu],
-            cost_calculators = [mcc, sic])
+            cost_calculators = [mcc, sic],
+            tracer = tracer,
+            time_budget = args.time_budget,
+            memory_budget = args.memory_budget,
+            warm_start = True)
 
     res = utils.compute_full_results(setting)
     utils.compute_and_print_result_table(res, setting)
@@ -60,8 +87,8 @@ if args.file:
 
 if args.dir:
     modules = utils.modules_from_files(args.dir)
+    analysis.perform_full_analysis(modules, processes=(args.jobs or None))
     for m in modules:
-        analysis.perform_full_analysis(m)
         print m.name, m.minimal_register_pressure(), m.maximal_register_pressure(), m.instr_count()
 
         
@@ -69,7 +96,11 @@ if args.dir:
             inputs = [m],
             regcounts = range(m.minimal_register_pressure(), m.maximal_register_pressure()+1),
             allocators = [bgca, bnu, extnu],
-            cost_calculators = [mcc, sic])
+            cost_calculators = [mcc, sic],
+            tracer = tracer,
+            time_budget = args.time_budget,
+            memory_budget = args.memory_budget,
+            warm_start = True)
 
         res = utils.compute_full_results(setting)
         utils.compute_and_print_result_table(res, setting)
@@ -80,3 +111,9 @@ if args.dir:
     #res = utils.compute_full_results(setting)
     #utils.compute_and_print_result_table(res, setting)
 
+if tracer is not None:
+    tracer.write_chrome_trace(args.trace)
+
+if recorder is not None:
+    recorder.disable()
+    recorder.close()
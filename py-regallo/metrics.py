@@ -0,0 +1,75 @@
+import collections
+
+#########################################################################
+################################ METRICS ################################
+#########################################################################
+
+# Counters of what the algorithms do (e.g. iterations of fixpoint loops,
+# operations on sorted sets, copies of functions). Unlike time, they don't
+# depend on the machine load, so they show complexity regressions.
+#
+# Hot paths call count(name), which only checks a global variable when no
+# Counters object is collecting.
+#
+# Counters are collected only in the current process, not in worker processes
+# (see parallel.py).
+
+# Names of the counters.
+LIVENESS_ITERATIONS = "liveness iterations"
+DOMINANCE_ITERATIONS = "dominance iterations"
+SORTEDSET_ADDS = "sortedset adds"
+SORTEDSET_REMOVES = "sortedset removes"
+INTERFERENCE_EDGES = "interference edges"
+SPILLS = "spill decisions"
+FUNCTION_COPIES = "function copies"
+ALLOCATION_ATTEMPTS = "allocation attempts"
+WARM_STARTS = "warm starts"
+PREPARATIONS = "preparations"
+
+# Counters object currently collecting or None if nothing is collected.
+collector = None
+
+def count(name, n=1):
+    if collector is not None:
+        collector.counts[name] += n
+
+# Collects counters while it is enabled. Enabled Counters can be nested: when
+# the inner one is disabled, its counts are added to the outer one. It can be
+# used as a context manager:
+#
+#   with Counters() as c:
+#       analysis.perform_full_analysis(f)
+#   print c[metrics.LIVENESS_ITERATIONS]
+class Counters(object):
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.previous = None
+
+    def enable(self):
+        global collector
+        self.previous = collector
+        collector = self
+
+    def disable(self):
+        global collector
+        collector = self.previous
+        if self.previous is not None:
+            self.previous.counts.update(self.counts)
+        self.previous = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+        return False
+
+    def __getitem__(self, name):
+        return self.counts[name]
+
+    def as_dict(self):
+        return dict(self.counts)
+
+    def __repr__(self):
+        return "Counters(" + repr(self.as_dict()) + ")"
@@ -0,0 +1,47 @@
+import multiprocessing
+
+#########################################################################
+########################### PROCESS POOLS ###############################
+#########################################################################
+
+# CFG objects are deeply nested graphs that are expensive (and for large
+# functions impossible, because of the recursion limit) to pickle. Instead of
+# sending them to worker processes, we store the work items in this module
+# before the pool is created. Workers are forked, so they inherit the items
+# and we only send their indices. Results should be sent back in a compact
+# form, not as CFG objects.
+#
+# It relies on the 'fork' start method, so it works on Linux and Mac OS.
+
+# Pair (function, list of items) shared with the worker processes.
+shared = None
+
+def call_shared(index):
+    func, items = shared
+    return (index, func(items[index]))
+
+# Applies func to every item in worker processes and yields pairs
+# (index of the item, result) in order of completion.
+#
+# Params:
+# processes - number of worker processes, None means all available cores.
+# sizes     - optional list of item sizes. Items are scheduled largest first
+#             which balances the load when sizes differ a lot.
+#
+# If the consumer stops iterating early (e.g. because one item failed),
+# outstanding work is cancelled.
+def imap_unordered(func, items, processes=None, sizes=None):
+    global shared
+    order = range(len(items))
+    if sizes is not None:
+        order = sorted(order, key = lambda i: sizes[i], reverse=True)
+
+    shared = (func, items)
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(call_shared, order, chunksize=1):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+        shared = None
@@ -0,0 +1,177 @@
+import os
+import json
+import functools
+from timeit import default_timer
+from dashtable import data2rst
+
+#########################################################################
+############################### PROFILING ###############################
+#########################################################################
+
+# Register allocation is instrumented with nested phases, e.g.:
+#
+#   with profiling.phase("compute_intervals"):
+#       ...
+#
+# or with the @profiling.timed(name) decorator for whole functions.
+# Phases are recorded only when a Tracer is enabled. Otherwise phase() returns
+# a shared object with empty __enter__ and __exit__, so instrumentation is
+# nearly free.
+#
+# Phases are recorded only in the current process, not in worker processes
+# (see parallel.py).
+
+# Tracer currently recording phases or None if profiling is disabled.
+tracer = None
+
+class NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NO_PHASE = NoPhase()
+
+# Returns context manager which records time of the phase with given name.
+# args - additional information about the phase (e.g. function name or regcount)
+#        inherited by all nested phases.
+def phase(name, **args):
+    if tracer is None:
+        return NO_PHASE
+    return Phase(tracer, name, args)
+
+# Decorator recording every call of the function as a phase with given name.
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if tracer is None:
+                return func(*args, **kwargs)
+            with Phase(tracer, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class Phase(object):
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = None
+        self.children_time = 0.0
+
+    def __enter__(self):
+        stack = self.tracer.stack
+        if stack and stack[-1].args:
+            args = dict(stack[-1].args)
+            args.update(self.args)
+            self.args = args
+        stack.append(self)
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = default_timer()
+        stack = self.tracer.stack
+        stack.pop()
+        duration = end - self.start
+        if stack:
+            stack[-1].children_time += duration
+
+        self.tracer.events.append(PhaseEvent(self.name, self.args, self.start, duration,
+            duration - self.children_time, len(stack)))
+        return False
+
+# Recorded phase. Times are in seconds.
+class PhaseEvent(object):
+    __slots__ = ("name", "args", "start", "duration", "self_time", "depth")
+
+    def __init__(self, name, args, start, duration, self_time, depth):
+        self.name = name
+        self.args = args
+        self.start = start
+        self.duration = duration
+        self.self_time = self_time
+        self.depth = depth
+
+# Records phases while it is enabled. It can be used as a context manager:
+#
+#   with Tracer() as t:
+#       allocator.perform_full_register_allocation(f, regcount)
+#   t.print_summary()
+class Tracer(object):
+    def __init__(self):
+        # List of PhaseEvents in order of their ends.
+        self.events = []
+        # Stack of phases that are currently in progress.
+        self.stack = []
+        self.previous = None
+        self.origin = default_timer()
+
+    def enable(self):
+        global tracer
+        self.previous = tracer
+        tracer = self
+
+    def disable(self):
+        global tracer
+        tracer = self.previous
+        self.previous = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+        return False
+
+    def clear(self):
+        self.events = []
+
+    # Returns the recorded phases in Chrome trace format (chrome://tracing, Perfetto).
+    def chrome_trace(self):
+        pid = os.getpid()
+        events = []
+        for e in sorted(self.events, key = lambda e: (e.start, e.depth)):
+            events.append({
+                "name": e.name,
+                "cat": "regallo",
+                "ph": "X",
+                "ts": (e.start - self.origin) * 1e6,
+                "dur": e.duration * 1e6,
+                "pid": pid,
+                "tid": 0,
+                "args": {k: str(v) for (k, v) in e.args.iteritems()},
+            })
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    # Returns list of tuples (phase name, number of calls, total time, self time)
+    # sorted by self time, descending.
+    def summary(self):
+        totals = {}
+        for e in self.events:
+            calls, total, self_time = totals.get(e.name, (0, 0.0, 0.0))
+            totals[e.name] = (calls + 1, total + e.duration, self_time + e.self_time)
+
+        rows = [(name, calls, total, self_time) for (name, (calls, total, self_time)) in totals.iteritems()]
+        return sorted(rows, key = lambda row: row[3], reverse=True)
+
+    # Returns table with the summary that we can print out using dashtable.data2rst.
+    def summary_table(self):
+        traced = sum(e.duration for e in self.events if e.depth == 0)
+        table = [["Phase", "Calls", "Total time [s]", "Self time [s]", "Self time [%]"]]
+        for (name, calls, total, self_time) in self.summary():
+            share = 100.0 * self_time / traced if traced else 0.0
+            table.append([name, calls, "{:.4f}".format(total), "{:.4f}".format(self_time),
+                "{:.1f}".format(share)])
+        return table
+
+    def print_summary(self):
+        print(data2rst(self.summary_table(), use_headers=True))
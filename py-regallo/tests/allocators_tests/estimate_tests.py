@@ -0,0 +1,97 @@
+import unittest
+import cfg
+import utils
+import metrics
+import cfg.analysis as analysis
+from cost import MainCostCalculator, SpillInstructionsCounter, FrequencyWeightedCostCalculator
+from allocators.lscan.basic import BasicLinearScan
+from allocators.lscan.extended import ExtendedLinearScan
+from allocators.graph import BasicGraphColoringAllocator
+
+
+class EstimateTests(unittest.TestCase):
+
+    def setUp(self):
+        self.m = cfg.Module.from_file("programs/sort.json")
+        analysis.perform_full_analysis(self.m)
+        self.sic = SpillInstructionsCounter()
+        self.mcc = MainCostCalculator()
+        self.fwcc = FrequencyWeightedCostCalculator()
+
+    def test_function_not_modified(self):
+        for al in [BasicLinearScan(), ExtendedLinearScan()]:
+            for f in self.m.functions.values():
+                fp = f.fingerprint(with_alloc=True)
+                instr_counter = f.instr_counter
+                nums = [instr.num for bb in f.reverse_postorder() for instr in bb.instructions]
+                live_out = {bb.id: bb.live_out for bb in f.bblocks.values()}
+                with metrics.Counters() as c:
+                    estimate = al.estimate(f, f.minimal_register_pressure(), [self.sic, self.mcc])
+
+                self.assertGreater(estimate.costs[self.sic.name], 0)
+                self.assertEqual(c[metrics.FUNCTION_COPIES], 0)
+                self.assertEqual(fp, f.fingerprint(with_alloc=True))
+                self.assertEqual(instr_counter, f.instr_counter)
+                self.assertEqual(nums,
+                        [instr.num for bb in f.reverse_postorder() for instr in bb.instructions])
+                for bb in f.bblocks.values():
+                    self.assertIs(bb.live_out, live_out[bb.id])
+
+    # Allocators without intervals allocate a copy of the function.
+    def test_graph_coloring_not_modified(self):
+        bgca = BasicGraphColoringAllocator()
+        for f in self.m.functions.values():
+            fp = f.fingerprint(with_alloc=True)
+            estimate = bgca.estimate(f, f.minimal_register_pressure(), [self.sic])
+            self.assertGreater(estimate.costs[self.sic.name], 0)
+            self.assertEqual(fp, f.fingerprint(with_alloc=True))
+
+    def test_exact_without_spilling(self):
+        for al in [BasicLinearScan(), BasicGraphColoringAllocator()]:
+            for f in self.m.functions.values():
+                regcount = f.maximal_register_pressure()
+                estimate = al.estimate(f, regcount, [self.sic, self.mcc, self.fwcc], validate=True)
+                self.assertEqual(estimate.frc, regcount)
+                errors = estimate.errors()
+                self.assertAlmostEqual(errors.pop(self.fwcc.name), 0)
+                self.assertEqual(errors, {self.sic.name: 0, self.mcc.name: 0})
+
+    def test_spill_instructions(self):
+        bls = BasicLinearScan()
+        for f in self.m.functions.values():
+            for regcount in range(f.minimal_register_pressure(), f.maximal_register_pressure()):
+                estimate = bls.estimate(f, regcount, [self.sic], validate=True)
+                self.assertEqual(estimate.errors(), {self.sic.name: 0})
+
+    def test_below_minimal_pressure(self):
+        f = self.m.functions.values()[0]
+        self.assertIsNone(BasicLinearScan().estimate(f, f.minimal_register_pressure()-1, [self.sic]))
+
+    def test_result_computation(self):
+        setting = utils.ResultCompSetting(
+                inputs = [self.m],
+                regcounts = [self.m.maximal_register_pressure()],
+                allocators = [BasicLinearScan()],
+                cost_calculators = [self.sic, self.mcc],
+                estimate = True)
+        estimated = utils.compute_full_results(setting)
+        setting.estimate = False
+        self.assertEqual(estimated, utils.compute_full_results(setting))
+
+    # Results are sums of costs of the functions, which are floats for this calculator.
+    def test_frequency_weighted_result_computation(self):
+        setting = utils.ResultCompSetting(
+                inputs = [self.m],
+                regcounts = [self.m.maximal_register_pressure()],
+                allocators = [BasicLinearScan()],
+                cost_calculators = [self.fwcc],
+                estimate = True)
+        [(_, [(_, [(_, [(_, estimated)])])])] = utils.compute_full_results(setting)
+        setting.estimate = False
+        [(_, [(_, [(_, [(_, actual)])])])] = utils.compute_full_results(setting)
+        self.assertGreater(estimated, 0)
+        self.assertAlmostEqual(estimated, actual)
+
+
+if __name__ == '__main__':
+    unittest.main()
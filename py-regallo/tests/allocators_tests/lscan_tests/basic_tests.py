@@ -1,12 +1,48 @@
 import unittest
+import collections
+import copy
+import utils
+from sortedcontainers import SortedSet
 from allocators.lscan.basic import BasicLinearScan
 from allocators.lscan.basic import spillers
+from allocators.lscan import ActiveSet
+from allocators.lscan.intervals import Interval
 import tests.cfgmocks as cfgmocks
 import cfg
 import cfg.sanity
 import cfg.analysis as analysis
 
 
+# The loop of BasicLinearScan.allocate_registers with the default spiller
+# (FurthestFirst) and a SortedSet of active intervals, as it was before ActiveSet,
+# except that ended intervals are removed while iterating over a copy of the set.
+# Returns dictionary {variable id: alloc}.
+def reference_allocation(intervals, regcount):
+    regset = utils.RegisterSet(regcount)
+    active = SortedSet(key = lambda iv: iv.to)
+    for iv in sorted([ivl[0] for ivl in intervals.values()], key = lambda iv: iv.fr):
+        for old in list(active):
+            if old.to > iv.fr:
+                break
+            active.remove(old)
+            regset.set_free(old.alloc)
+
+        reg = regset.get_free()
+        if reg:
+            iv.allocate(reg)
+            active.add(iv)
+        elif active and active[-1].to > iv.to:
+            spilled = active[-1]
+            iv.allocate(spilled.alloc)
+            spilled.spill()
+            active.remove(spilled)
+            active.add(iv)
+        else:
+            iv.spill()
+
+    return {vid: ivl[0].var.alloc for (vid, ivl) in intervals.iteritems()}
+
+
 class BasicLinearScanTest(cfgmocks.GCDTest):
 
     def setUp(self):
@@ -75,3 +111,57 @@ class BasicLinearScanTest(cfgmocks.GCDTest):
         self.assertNotIn("v17", intervals)
         self.assertNotIn("v18", intervals)
 
+
+class ActiveSetTests(unittest.TestCase):
+
+    def test_order_and_lazy_removal(self):
+        ivs = [Interval(cfg.Variable("v" + str(i)), 0, to) for (i, to) in enumerate([5, 3, 5, 8, 1])]
+        active = ActiveSet()
+        for iv in ivs:
+            active.add(iv)
+
+        # Equal endpoints are ordered by insertion.
+        self.assertEqual(list(active), [ivs[4], ivs[1], ivs[0], ivs[2], ivs[3]])
+        self.assertIs(active.last(), ivs[3])
+
+        active.remove(ivs[3])
+        self.assertNotIn(ivs[3], active)
+        self.assertIs(active.last(), ivs[2])
+
+        active.remove(ivs[1])
+        self.assertEqual(active.expire(5), [ivs[4], ivs[0], ivs[2]])
+        self.assertEqual(len(active), 0)
+        self.assertIsNone(active.last())
+
+        # Re-added intervals are not shadowed by their removed entries.
+        active.add(ivs[3])
+        self.assertEqual(active.expire(7), [])
+        self.assertEqual(active.expire(8), [ivs[3]])
+
+    # Every interval ending before the current one starts frees its register, also
+    # one following another expired interval in the set.
+    def test_expire_frees_all_ended_intervals(self):
+        p, q, d = [cfg.Variable("v" + str(i)) for i in range(3)]
+        intervals = collections.OrderedDict([("v0", [Interval(p, 0, 1)]),
+            ("v1", [Interval(q, 0, 0.5)]), ("v2", [Interval(d, 2, 5)])])
+        self.assertTrue(BasicLinearScan().allocate_registers(intervals, 2))
+        self.assertEqual((p.alloc, q.alloc, d.alloc), ("reg1", "reg2", "reg1"))
+
+
+class ReferenceAllocationTests(unittest.TestCase):
+
+    # ActiveSet only makes the loop faster, allocation is the same as with SortedSet.
+    def test_same_allocation(self):
+        for prog in ["programs/sort.json", "programs/fft.json", "programs/gjk.json"]:
+            m = cfg.Module.from_file(prog)
+            analysis.perform_full_analysis(m)
+            bls = BasicLinearScan()
+            for f in m.functions.values():
+                intervals = bls.compute_intervals(f)
+                for regcount in range(f.minimal_register_pressure(), f.maximal_register_pressure()+1):
+                    variables = {vid: copy.copy(var) for (vid, var) in f.vars.iteritems()}
+                    bound = bls.bind_intervals(intervals, variables)
+                    bls.allocate_registers(bound, regcount)
+                    variables = {vid: copy.copy(var) for (vid, var) in f.vars.iteritems()}
+                    self.assertEqual({vid: ivl[0].alloc for (vid, ivl) in bound.iteritems()},
+                        reference_allocation(bls.bind_intervals(intervals, variables), regcount))
@@ -0,0 +1,51 @@
+import unittest
+import cfg
+from allocators.lscan.extended.extended import RegisterIndexedSet, ExtendedLinearScan
+from allocators.lscan.intervals import ExtendedInterval
+
+
+class RegisterIndexedSetTests(unittest.TestCase):
+
+    def test_index(self):
+        ivs = [ExtendedInterval(cfg.Variable("v" + str(i)), 0, to, alloc)
+                for (i, (to, alloc)) in enumerate([(4, "reg1"), (2, "reg3"), (6, "reg1")])]
+        s = RegisterIndexedSet(key = lambda iv: iv.to)
+        for iv in ivs:
+            s.add(iv)
+
+        self.assertEqual(list(s), [ivs[1], ivs[0], ivs[2]])
+        self.assertEqual(s.mask, 0b101)
+        self.assertEqual(s.by_register["reg1"], set([ivs[0], ivs[2]]))
+
+        s.remove(ivs[0])
+        self.assertEqual(s.mask, 0b101)
+        s.discard(ivs[2])
+        self.assertEqual(s.mask, 0b100)
+
+        s.add(ivs[0])
+        s.evict("reg3")
+        self.assertEqual(list(s), [ivs[0]])
+        self.assertEqual(s.by_register, {"reg1": set([ivs[0]])})
+        self.assertEqual(s.mask, 0b1)
+
+
+class ExtendedLinearScanTests(unittest.TestCase):
+
+    def test_end_before_start(self):
+        # Interval ending at a position frees its register for the one starting there,
+        # also after a lifetime hole.
+        ivs = []
+        for (i, subs) in enumerate([[(0, 2), (6, 8)], [(2, 4)], [(4, 6)], [(8, 9)]]):
+            iv = ExtendedInterval(cfg.Variable("v" + str(i)))
+            for (fr, to) in subs:
+                iv.add_subinterval(fr, to)
+            iv.update_endpoints(subs[0][0], subs[-1][1])
+            ivs.append(iv)
+
+        intervals = {iv.var.id: [iv] for iv in ivs}
+        self.assertTrue(ExtendedLinearScan().allocate_registers(intervals, 1, spilling=False))
+        self.assertEqual(set(iv.alloc for iv in ivs), set(["reg1"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
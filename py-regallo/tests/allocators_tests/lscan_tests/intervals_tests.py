@@ -1,5 +1,5 @@
 import unittest
-from allocators.lscan.intervals import ExtendedInterval
+from allocators.lscan.intervals import Interval, ExtendedInterval, furthest_next_use
 
 SubInterval = ExtendedInterval.SubInterval
 
@@ -31,30 +31,33 @@ class ExtendedIntervalsTest(unittest.TestCase):
         iv2.add_subinterval(17, 19)
 
         self.assertEqual(iv1.intersection(iv2), 13)
+        self.assertEqual(iv2.intersection(iv1), 13)
+
+        iv3 = ExtendedInterval("v3")
+        iv3.add_subinterval(5, 10)
+        self.assertIsNone(iv1.intersection(iv3))
+        self.assertEqual(iv2.intersection(iv3), 5)
 
     def test_subintervals(self):
         iv = ExtendedInterval(None)
-
-        Sub = ExtendedInterval.SubInterval
-
-        subA = Sub(1, 2, iv)
-        subB = Sub(3, 6, iv)
-        subC = Sub(3, 13, iv)
-        subD = Sub(8, 11, iv)
-        subE = Sub(12, 15, iv)
-        subF = Sub(17, 19, iv)
-        subG = Sub(17, 19, iv)
-
-        iv.subintervals = [subA, subB, subC, subD, subE, subF, subG]
+        for (fr, to) in [(1, 2), (17, 19), (3, 6), (12, 15), (3, 13), (8, 11), (17, 19)]:
+            iv.add_subinterval(fr, to)
 
         iv.rebuild_and_order_subintervals()
 
-        def sub_equal(sub1, sub2):
-            return sub1.fr == sub2.fr and sub1.to == sub2.to
+        self.assertEqual(iv.starts, [1, 17])
+        self.assertEqual(iv.ends, [15, 19])
+        self.assertEqual([(sub.fr, sub.to) for sub in iv.subintervals], [(1, 15), (17, 19)])
+
+    def test_covers(self):
+        iv = ExtendedInterval(None)
+        iv.add_subinterval(1, 4)
+        iv.add_subinterval(11, 14)
 
-        self.assertEqual(len(iv.subintervals), 2)
-        self.assertTrue(sub_equal(iv.subintervals[0], Sub(1, 15, iv)))
-        self.assertTrue(sub_equal(iv.subintervals[1], subF))
+        for pos in [1, 3, 4, 11, 14]:
+            self.assertTrue(iv.covers(pos))
+        for pos in [0, 5, 10, 15]:
+            self.assertFalse(iv.covers(pos))
 
     def test_splitting(self):
         iv = ExtendedInterval(None)
@@ -93,5 +96,31 @@ class ExtendedIntervalsTest(unittest.TestCase):
         self.assertEqual(new_uses_expected, new_uses_actual)
 
 
+class InstrMock():
+    def __init__(self, num):
+        self.num = num
+
+class NextUseTest(unittest.TestCase):
+
+    def test_next_use_after(self):
+        iv = Interval("v1", uses=[InstrMock(2), InstrMock(5), InstrMock(9)])
+        self.assertEqual(iv.next_use_after(0), 2)
+        self.assertEqual(iv.next_use_after(2), 5)
+        self.assertEqual(iv.next_use_after(6.5), 9)
+        self.assertIsNone(iv.next_use_after(9))
+
+        copy = iv.copy("v2")
+        self.assertIs(copy.use_nums, iv.use_nums)
+
+        iv.uses = [InstrMock(1)]
+        self.assertIsNone(iv.next_use_after(2))
+        self.assertEqual(copy.next_use_after(2), 5)
 
+    def test_furthest_next_use(self):
+        iv1 = Interval("v1", uses=[InstrMock(2), InstrMock(8)])
+        iv2 = Interval("v2", uses=[InstrMock(3), InstrMock(4)])
+        iv3 = Interval("v3", uses=[InstrMock(1), InstrMock(8)])
 
+        self.assertEqual(furthest_next_use([iv1, iv2, iv3], 2), (8, iv1))
+        self.assertEqual(furthest_next_use([iv2, iv3, iv1], 0), (3, iv2))
+        self.assertEqual(furthest_next_use([iv1, iv2], 8), (0, None))
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+import cfg
+import utils
+import decisions
+import cfg.analysis as analysis
+import allocators.replay as replay
+from cost import MainCostCalculator, SpillInstructionsCounter
+from allocators.lscan.basic import BasicLinearScan
+from allocators.lscan.extended import ExtendedLinearScan
+from allocators.graph import BasicGraphColoringAllocator
+
+
+class ReplayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "decisions.trace")
+        self.m = cfg.Module.from_file("programs/sort.json")
+        analysis.perform_full_analysis(self.m)
+        self.regcounts = range(self.m.minimal_register_pressure(), self.m.maximal_register_pressure()+1)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_same_function(self):
+        allocated = []
+        with decisions.Recorder(self.filename):
+            for al in [BasicLinearScan(), ExtendedLinearScan(), BasicGraphColoringAllocator()]:
+                for f in self.m.functions.values():
+                    for regcount in self.regcounts:
+                        allocated.append(al.perform_full_register_allocation(f, regcount))
+
+        records = list(decisions.records(self.filename))
+        self.assertEqual(len(records), len(allocated))
+        for (record, g) in zip(records, allocated):
+            h = replay.replay(record, self.m.functions[record.function])
+            self.assertEqual(g is None, h is None)
+            if g is not None:
+                self.assertEqual(g.fingerprint(with_alloc=True), h.fingerprint(with_alloc=True))
+
+    def test_recost(self):
+        mcc, sic = MainCostCalculator(), SpillInstructionsCounter()
+        setting = utils.ResultCompSetting(
+                inputs = self.m.functions.values(),
+                regcounts = self.regcounts,
+                allocators = [BasicLinearScan()],
+                cost_calculators = [mcc, sic])
+        with decisions.Recorder(self.filename):
+            results = utils.compute_full_results(setting)
+
+        other = MainCostCalculator(S=5, L=3)
+        recosted = replay.recost(self.filename, [self.m], [mcc, sic, other])
+        expected = [(al_name, fname, regc, costs) for (fname, reg_results) in results
+                for (regc, alloc_results) in reg_results for (al_name, costs) in alloc_results]
+        self.assertEqual([(al, fname, regc, costs[:2]) for (al, fname, regc, costs) in recosted],
+                expected)
+        for (_, fname, regc, costs) in recosted:
+            g = BasicLinearScan().perform_full_register_allocation(self.m.functions[fname], regc)
+            if g is not None:
+                self.assertEqual(costs[2][1], other.function_diff(g, self.m.functions[fname]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import unittest
+import cfg
+import metrics
+import cfg.analysis as analysis
+import cfg.resolve as resolve
+import allocators.search as search
+import allocators.lscan.basic.spillers as spillers
+from allocators.lscan.basic import BasicLinearScan
+from allocators.lscan.extended import ExtendedLinearScan
+from allocators.graph import BasicGraphColoringAllocator
+
+
+# The plain retry loop, without memoization.
+def reference_allocation(allocator, f, regcount):
+    def try_allocate_and_eliminate_phi(fprim, rc, spilling):
+        while rc >= 0:
+            g = fprim.copy()
+            if not allocator.perform_register_allocation(g, rc, spilling):
+                return (g, False)
+            if resolve.eliminate_phi(g, regcount):
+                return (g, True)
+            rc -= 1
+        return (None, False)
+
+    frc = regcount
+    while frc >= 0:
+        g, success = try_allocate_and_eliminate_phi(f, frc, spilling=True)
+        if success:
+            analysis.perform_full_analysis(g)
+            return g
+        if g is None:
+            return None
+
+        resolve.insert_spill_code(g)
+        h, success = try_allocate_and_eliminate_phi(g, regcount, spilling=False)
+        if success:
+            analysis.perform_full_analysis(h)
+            return h
+        frc -= 1
+
+    return None
+
+
+# Attempts with outcomes given by a table {frc: True/False}.
+class TableAttempts(search.RegcountAttempts):
+    def __init__(self, table):
+        super(TableAttempts, self).__init__(None, None, max(table.keys()))
+        self.table = table
+
+    def outcome(self, frc):
+        if frc not in self.outcomes:
+            self.count += 1
+            self.outcomes[frc] = frc if self.table[frc] else None
+        return self.outcomes[frc]
+
+
+class RegcountSearchTests(unittest.TestCase):
+
+    def test_same_result_as_plain_loop(self):
+        m = cfg.Module.from_file("programs/sort.json")
+        analysis.perform_full_analysis(m)
+        bls = BasicLinearScan()
+        for f in m.functions.values():
+            for regcount in range(f.minimal_register_pressure(), f.maximal_register_pressure()+1):
+                g = bls.perform_full_register_allocation(f, regcount)
+                h = reference_allocation(bls, f, regcount)
+                self.assertEqual(g is None, h is None)
+                if g is not None:
+                    self.assertEqual(g.fingerprint(with_alloc=True), h.fingerprint(with_alloc=True))
+                    self.assertGreater(bls.attempts, 0)
+
+    def test_below_minimal_pressure(self):
+        m = cfg.Module.from_file("programs/gcd.json")
+        analysis.perform_full_analysis(m)
+        bls = BasicLinearScan()
+        for f in m.functions.values():
+            if f.minimal_register_pressure() > 0:
+                regcount = f.minimal_register_pressure() - 1
+                self.assertIsNone(bls.perform_full_register_allocation(f, regcount))
+                self.assertEqual(bls.attempts, 0)
+
+    def test_galloping_monotone(self):
+        table = {frc: frc <= 5 for frc in range(65)}
+        attempts = TableAttempts(table)
+        self.assertEqual(search.GallopingSearch().search(attempts, 64), 5)
+        self.assertLess(attempts.count, 20)
+
+        attempts = TableAttempts(table)
+        self.assertEqual(search.LinearSearch().search(attempts, 64), 5)
+        self.assertEqual(attempts.count, 60)
+
+    def test_galloping_no_success(self):
+        table = {frc: False for frc in range(65)}
+        attempts = TableAttempts(table)
+        self.assertIsNone(search.GallopingSearch().search(attempts, 64))
+        self.assertEqual(len(attempts.outcomes), 65)
+
+    def test_parallel_same_result(self):
+        m = cfg.Module.from_file("programs/fft.json")
+        analysis.perform_full_analysis(m)
+        bls = BasicLinearScan()
+        pbls = BasicLinearScan()
+        pbls.regcount_search = search.ParallelSearch(processes=2, batch=4)
+        for f in m.functions.values():
+            for regcount in range(f.minimal_register_pressure(), f.minimal_register_pressure()+3):
+                g = bls.perform_full_register_allocation(f, regcount)
+                h = pbls.perform_full_register_allocation(f, regcount)
+                self.assertEqual(g is None, h is None)
+                if g is not None:
+                    self.assertEqual(g.fingerprint(with_alloc=True), h.fingerprint(with_alloc=True))
+                    self.assertGreaterEqual(pbls.attempts, bls.attempts)
+
+    def test_warm_start_same_result(self):
+        m = cfg.Module.from_file("programs/fft.json")
+        analysis.perform_full_analysis(m)
+        bls = BasicLinearScan()
+        total_warm_starts = 0
+        for f in m.functions.values():
+            warm_start = bls.warm_start_for(f)
+            warm_starts = 0
+            attempts, warm_attempts = 0, 0
+            for regcount in range(f.minimal_register_pressure(), f.maximal_register_pressure()+1):
+                g = bls.perform_full_register_allocation(f, regcount)
+                attempts += bls.attempts
+                h = bls.perform_full_register_allocation(f, regcount, warm_start)
+                warm_attempts += bls.attempts
+                warm_starts += bls.counters[metrics.WARM_STARTS]
+                self.assertEqual(g is None, h is None)
+                if g is not None:
+                    self.assertEqual(g.fingerprint(with_alloc=True), h.fingerprint(with_alloc=True))
+
+            self.assertEqual(warm_attempts + warm_starts, attempts)
+            total_warm_starts += warm_starts
+
+        self.assertGreater(total_warm_starts, 0)
+
+    def test_warm_start_of_other_function(self):
+        m = cfg.Module.from_file("programs/sort.json")
+        analysis.perform_full_analysis(m)
+        f, g = m.functions.values()
+        bls = BasicLinearScan()
+        self.assertTrue(bls.warm_start_for(f).applies_to(bls, f))
+        self.assertFalse(bls.warm_start_for(f).applies_to(bls, g))
+        self.assertFalse(bls.warm_start_for(f).applies_to(BasicLinearScan(), f))
+
+
+class AllocateManyTests(unittest.TestCase):
+
+    def test_same_result_as_single_allocations(self):
+        m = cfg.Module.from_file("programs/sort.json")
+        analysis.perform_full_analysis(m)
+        groups = [
+            [BasicLinearScan(), BasicLinearScan(spillers.FurthestNextUseFirst(), name="FNUF")],
+            [ExtendedLinearScan()],
+            [BasicGraphColoringAllocator()]]
+        for group in groups:
+            self.assert_same_results(m, group)
+
+    # Intervals with equal endpoints are allocated in the same order, whether they
+    # are computed for the copy or bound to it (factor has many of them).
+    def test_ties_between_intervals(self):
+        m = cfg.Module.from_file("programs/factor.json")
+        analysis.perform_full_analysis(m)
+        for group in [[BasicLinearScan()], [ExtendedLinearScan()]]:
+            self.assert_same_results(m, group)
+
+    def assert_same_results(self, m, group):
+        regcounts = range(m.minimal_register_pressure(), m.maximal_register_pressure()+1)
+        for f in m.functions.values():
+            with metrics.Counters() as c:
+                results = list(group[0].allocate_many(f, regcounts, group))
+
+            self.assertLessEqual(c[metrics.PREPARATIONS], 1)
+            self.assertEqual([(al, regcount) for (al, regcount, _) in results],
+                    [(al, regcount) for regcount in regcounts for al in group])
+            for (al, regcount, g) in results:
+                h = al.perform_full_register_allocation(f, regcount)
+                self.assertEqual(g is None, h is None)
+                if g is not None:
+                    self.assertEqual(g.fingerprint(with_alloc=True), h.fingerprint(with_alloc=True))
+
+    def test_preparation_not_shared(self):
+        m = cfg.Module.from_file("programs/sort.json")
+        analysis.perform_full_analysis(m)
+        f, g = m.functions.values()
+        bls = BasicLinearScan()
+        preparation = bls.preparation_for(f)
+        self.assertTrue(preparation.applies_to(BasicLinearScan(spillers.CurrentFirst()), f))
+        self.assertFalse(preparation.applies_to(bls, g))
+        self.assertFalse(preparation.applies_to(ExtendedLinearScan(), f))
+
+
+class ParallelModuleAllocationTests(unittest.TestCase):
+
+    def test_same_result_as_sequential(self):
+        m = cfg.Module.from_file("programs/sort.json")
+        analysis.perform_full_analysis(m)
+        bls = BasicLinearScan()
+        pbls = BasicLinearScan()
+        pbls.processes = 2
+        regcount = m.minimal_register_pressure() + 1
+        g = bls.perform_full_module_register_allocation(m, regcount)
+        h = pbls.perform_full_module_register_allocation(m, regcount)
+        self.assertEqual(g.functions.keys(), h.functions.keys())
+        self.assertEqual(pbls.attempts, bls.attempts)
+        self.assertEqual(pbls.counters.as_dict(), bls.counters.as_dict())
+        for (name, gf) in g.functions.iteritems():
+            hf = h.functions[name]
+            self.assertEqual(gf.fingerprint(with_alloc=True), hf.fingerprint(with_alloc=True))
+            for bb in gf.bblocks.values():
+                for (instr, hinstr) in zip(bb.instructions, hf.bblocks[bb.id].instructions):
+                    self.assertEqual(hinstr.num, instr.num)
+                    self.assertIs(hinstr.original, instr.original)
+                    self.assertEqual(set(hinstr.live_out), set(instr.live_out))
+
+    def test_failure(self):
+        m = cfg.Module.from_file("programs/sort.json")
+        analysis.perform_full_analysis(m)
+        pbls = BasicLinearScan()
+        pbls.processes = 2
+        self.assertIsNone(pbls.perform_full_module_register_allocation(m, 
+            m.minimal_register_pressure() - 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
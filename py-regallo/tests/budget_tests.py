@@ -0,0 +1,70 @@
+import unittest
+import cfg
+import utils
+import budget
+import cfg.analysis as analysis
+from cost import SpillInstructionsCounter
+from allocators.lscan.basic import BasicLinearScan
+
+
+# Allocator exceeding the memory budget for one regcount.
+class OutOfMemoryLinearScan(BasicLinearScan):
+    def __init__(self, oom_regcount):
+        super(OutOfMemoryLinearScan, self).__init__(name="OOM")
+        self.oom_regcount = oom_regcount
+
+    def perform_full_register_allocation(self, f, regcount, warm_start=None, preparation=None):
+        if regcount == self.oom_regcount:
+            raise MemoryError()
+        return super(OutOfMemoryLinearScan, self).perform_full_register_allocation(f, regcount,
+                warm_start, preparation)
+
+
+class BudgetTests(unittest.TestCase):
+
+    def test_disabled(self):
+        self.assertIsNone(budget.current)
+        budget.check()
+
+    def test_time_budget(self):
+        with budget.Budget(seconds=0) as b:
+            self.assertIs(budget.current, b)
+            self.assertRaises(budget.TimeBudgetExceeded, budget.check)
+        self.assertIsNone(budget.current)
+
+        with budget.Budget(seconds=60, memory=1024):
+            budget.check()
+
+    def test_nested_budgets(self):
+        with budget.Budget(seconds=0):
+            with budget.Budget(seconds=60):
+                self.assertRaises(budget.TimeBudgetExceeded, budget.check)
+
+    def test_exceeded_cells(self):
+        m = cfg.Module.from_file("programs/gcd.json")
+        analysis.perform_full_analysis(m)
+        f = m.functions.values()[0]
+        minimal = f.minimal_register_pressure()
+        setting = utils.ResultCompSetting(
+                inputs = [f],
+                regcounts = [minimal, minimal+1],
+                allocators = [OutOfMemoryLinearScan(minimal), BasicLinearScan()],
+                cost_calculators = [SpillInstructionsCounter()])
+        [(_, reg_results)] = utils.compute_full_results(setting)
+
+        [(_, oom_results), (_, results)] = reg_results[0][1]
+        self.assertEqual(oom_results, [(SpillInstructionsCounter().name, budget.OOM)])
+        self.assertNotIsInstance(results[0][1], basestring)
+        for (_, alloc_results) in reg_results[1:]:
+            for (_, cost_results) in alloc_results:
+                self.assertNotIsInstance(cost_results[0][1], basestring)
+
+        setting.time_budget = 0
+        results = utils.compute_full_results(setting)
+        table, _ = utils.compute_result_table(results, setting)
+        self.assertEqual(table[2][2:], [budget.OOM, budget.TIMEOUT])
+        self.assertEqual(table[3][2:], [budget.TIMEOUT, budget.TIMEOUT])
+
+
+if __name__ == '__main__':
+    unittest.main()
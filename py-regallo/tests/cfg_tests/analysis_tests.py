@@ -0,0 +1,203 @@
+import unittest
+import collections
+import cfg
+import cfg.analysis as analysis
+from cfg.liveset import LiveSet
+from allocators.lscan.basic import BasicLinearScan
+from allocators.lscan.extended import ExtendedLinearScan
+
+PROGRAMS = ["programs/gcd.json", "programs/sort.json", "programs/fft.json", "programs/gjk.json"]
+
+class ParallelAnalysisTests(unittest.TestCase):
+
+    def assert_same_analysis(self, f, g):
+        def ids(s):
+            return sorted(x.id for x in s)
+
+        self.assertEqual(set(f.bblocks.keys()), set(g.bblocks.keys()))
+        for bid, bb in f.bblocks.iteritems():
+            bb2 = g.bblocks[bid]
+            self.assertEqual(ids(bb.live_in), ids(bb2.live_in))
+            self.assertEqual(ids(bb.live_out), ids(bb2.live_out))
+            self.assertEqual(ids(bb.defs), ids(bb2.defs))
+            self.assertEqual(ids(bb.uevs), ids(bb2.uevs))
+            self.assertEqual(ids(bb.dominators), ids(bb2.dominators))
+            self.assertEqual(bb.loop.id if bb.loop else None, bb2.loop.id if bb2.loop else None)
+
+            for (instr, instr2) in zip(bb.instructions, bb2.instructions):
+                self.assertEqual(instr.num, instr2.num)
+                self.assertEqual(ids(instr.live_in), ids(instr2.live_in))
+                self.assertEqual(ids(instr.live_out), ids(instr2.live_out))
+
+        loops = {loop.id: loop for loop in g.loops}
+        self.assertEqual(len(f.loops), len(loops))
+        for loop in f.loops:
+            loop2 = loops[loop.id]
+            self.assertEqual(loop.depth, loop2.depth)
+            self.assertEqual([bb.id for bb in loop.body], [bb.id for bb in loop2.body])
+            self.assertEqual(loop.parent.id if loop.parent else None,
+                    loop2.parent.id if loop2.parent else None)
+
+    def test_parallel_matches_serial(self):
+        serial = [cfg.Module.from_file(p) for p in PROGRAMS]
+        parallel = [cfg.Module.from_file(p) for p in PROGRAMS]
+
+        analyzed = analysis.perform_full_analysis(serial)
+        analyzed_parallel = analysis.perform_full_analysis(parallel, processes=2)
+        self.assertEqual(len(analyzed), len(analyzed_parallel))
+
+        for (m, m2) in zip(serial, parallel):
+            for name, f in m.functions.iteritems():
+                self.assert_same_analysis(f, m2.functions[name])
+
+
+class SsaLivenessTests(unittest.TestCase):
+
+    def iterative_liveness(self, f):
+        analysis.perform_liveness_analysis(f)
+        return {bb.id: (set(bb.live_in), set(bb.live_out)) for bb in f.bblocks.values()}
+
+    def test_matches_iterative_analysis(self):
+        for p in PROGRAMS + ["programs/factor.json"]:
+            m = cfg.Module.from_file(p)
+            analysis.perform_full_analysis(m)
+            for f in m.functions.values():
+                single = {bb.id: (bb.live_in, bb.live_out) for bb in f.bblocks.values()}
+                self.assertIsNotNone(analysis.compute_ssa_liveness(f))
+                self.assertEqual(self.iterative_liveness(f), single)
+
+    # Back edges of unknown loops are detected and the iterative analysis is used.
+    def test_without_loops(self):
+        m = cfg.Module.from_file("programs/sort.json")
+        analysis.perform_full_analysis(m)
+        for f in m.functions.values():
+            expected = self.iterative_liveness(f)
+            live_out = {bb.id: bb.live_out for bb in f.bblocks.values()}
+            f.loops = []
+            self.assertIsNone(analysis.compute_ssa_liveness(f))
+            for bb in f.bblocks.values():
+                self.assertIs(bb.live_out, live_out[bb.id])
+
+            analysis.perform_liveness_analysis(f, loops=True)
+            self.assertEqual(self.iterative_liveness(f), expected)
+
+    # Functions are analyzed again after phi elimination, when variables defined
+    # by phi instructions are defined in every predecessor.
+    def test_after_phi_elimination(self):
+        m = cfg.Module.from_file("programs/fft.json")
+        analysis.perform_full_analysis(m)
+        for f in m.functions.values():
+            g = BasicLinearScan().perform_full_register_allocation(f, 4)
+            self.assertIsNotNone(g)
+            single = {bb.id: (set(bb.live_in), set(bb.live_out)) for bb in g.bblocks.values()}
+            self.assertEqual(self.iterative_liveness(g), single)
+            if f.name == "FFT_transform_internal":
+                self.assertIsNone(analysis.compute_ssa_liveness(g))
+
+    # Intervals are built from live-out sets of the analysis.
+    def test_same_intervals(self):
+        def endpoints(intervals):
+            return {vid: [(iv.fr, iv.to, [instr.id for instr in iv.uses],
+                list(getattr(iv, "starts", [])), list(getattr(iv, "ends", []))) for iv in ivl]
+                for (vid, ivl) in intervals.iteritems()}
+
+        m = cfg.Module.from_file("programs/factor.json")
+        analysis.perform_full_analysis(m)
+        for f in m.functions.values():
+            for al in [BasicLinearScan(), ExtendedLinearScan()]:
+                intervals = endpoints(al.compute_intervals(f))
+                analysis.perform_liveness_analysis(f)
+                self.assertEqual(intervals, endpoints(al.compute_intervals(f)))
+                analysis.perform_liveness_analysis(f, loops=True)
+
+
+class LiveSetTests(unittest.TestCase):
+
+    def test_live_set_operations(self):
+        v = [cfg.Variable("v"+str(i)) for i in range(0, 6)]
+        s = LiveSet.from_iterable(v[:3])
+        t = s.derive(added=[v[3], v[0]], removed=[v[1]])
+
+        self.assertEqual(len(t), 3)
+        self.assertEqual(set(t), set([v[0], v[2], v[3]]))
+        self.assertIn(v[3], t)
+        self.assertNotIn(v[1], t)
+        self.assertIn(v[1], s)
+        self.assertEqual(t - s, set([v[3]]))
+        self.assertEqual(s - t, set([v[1]]))
+        self.assertEqual(t | set([v[5]]), set([v[0], v[2], v[3], v[5]]))
+        self.assertIs(t.derive(added=[v[0]], removed=[v[4]]), t)
+        self.assertTrue(t == set([v[0], v[2], v[3]]))
+
+        # Long chains of deltas are stored in full when they get longer than the set.
+        u = t
+        for i in range(30):
+            u = u.derive(added=[v[i % 6]], removed=[v[(i+1) % 6]])
+            self.assertTrue(u.chain <= len(u))
+            self.assertEqual(sorted(u), sorted(u.materialize()))
+
+    def test_set_interface(self):
+        v = [cfg.Variable("v"+str(i)) for i in range(0, 4)]
+        s = LiveSet.from_iterable(v[:2])
+        t = s.apply(added=[v[2]], removed=[v[0]])
+
+        self.assertIsInstance(t, collections.Set)
+        self.assertEqual(t, set([v[1], v[2]]))
+        self.assertEqual(t ^ s, set([v[0], v[2]]))
+        self.assertEqual(set([v[3]]) ^ t, set([v[1], v[2], v[3]]))
+        self.assertTrue(t.isdisjoint([v[0], v[3]]))
+        self.assertFalse(t.isdisjoint(s))
+        self.assertTrue(t <= set(v))
+        self.assertTrue(t < set(v))
+        self.assertFalse(t <= s)
+        self.assertTrue(t >= LiveSet.from_iterable([v[1]]))
+        self.assertTrue(t > set([v[2]]))
+        self.assertFalse(t > set([v[1], v[2]]))
+
+    def test_matches_plain_sets(self):
+        for p in PROGRAMS:
+            m = cfg.Module.from_file(p)
+            analysis.perform_full_analysis(m)
+            for f in m.functions.values():
+                for bb in f.bblocks.values():
+                    live = set(bb.live_out)
+                    previous = None
+                    for instr in reversed(bb.instructions):
+                        self.assertEqual(set(instr.live_out), live)
+                        self.assertEqual(len(instr.live_out), len(live))
+                        if previous is not None:
+                            self.assertIs(previous.live_in, instr.live_out)
+                        if instr.definition:
+                            live.discard(instr.definition)
+                        if not instr.is_phi():
+                            live |= set(instr.uses)
+                        self.assertEqual(set(instr.live_in), live)
+                        previous = instr
+
+                g = f.copy()
+                for bb in g.bblocks.values():
+                    for (i1, i2) in zip(bb.instructions[:-1], bb.instructions[1:]):
+                        self.assertIs(i1.live_out, i2.live_in)
+                        for var in i1.live_out:
+                            self.assertIs(var, g.vars[var.id])
+
+
+class PressureProfileTests(unittest.TestCase):
+
+    def test_profile_matches_live_sets(self):
+        for p in PROGRAMS + ["programs/factor.json"]:
+            m = cfg.Module.from_file(p)
+            analysis.perform_full_analysis(m)
+            for f in m.functions.values():
+                profile = f.pressure_profile()
+                instrs = [instr for bb in f.reverse_postorder() for instr in bb.instructions]
+                self.assertEqual(len(profile), len(instrs))
+                for (pressure, instr) in zip(profile, instrs):
+                    self.assertEqual(pressure, instr.register_pressure_out())
+
+                max_pressure = max(bb.maximal_register_pressure() for bb in f.bblocks.values())
+                self.assertEqual(f.maximal_register_pressure(), max_pressure)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import unittest
 import cfg
+import utils
+import cfg.analysis as analysis
 import tests.cfgmocks as cfgmocks
 from copy import deepcopy, copy
 
@@ -13,3 +15,170 @@ class CopyTests(cfgmocks.GCDTest):
         s = set([v])
         w = list(s)[0]
         self.assertEqual(v.alloc, w.alloc)
+
+
+class ReversePostorderTests(cfgmocks.GCDTest):
+
+    def test_reverse_postorder_is_cached(self):
+        rpo = self.f.reverse_postorder()
+        self.assertIs(rpo, self.f.reverse_postorder())
+        self.assertEqual([bb.id for bb in rpo], ["bb1", "bb2", "bb3", "bb4", "bb5", "bb6"])
+
+    def test_cache_invalidated_by_new_edges(self):
+        rpo = self.f.reverse_postorder()
+        bb1, bb3 = self.f.bblocks["bb1"], self.f.bblocks["bb3"]
+        bti = self.f.create_new_basic_block()
+        self.f.insert_basic_block_between(bti, bb1, bb3)
+
+        new_rpo = self.f.reverse_postorder()
+        self.assertIsNot(rpo, new_rpo)
+        self.assertIn(bti, new_rpo)
+        self.assertTrue(new_rpo.index(bb1) < new_rpo.index(bti) < new_rpo.index(bb3))
+
+    def test_copy_keeps_cached_order(self):
+        ids = [bb.id for bb in self.f.reverse_postorder()]
+        g = self.f.copy()
+        self.assertEqual([bb.id for bb in g.reverse_postorder()], ids)
+        for bb in g.reverse_postorder():
+            self.assertIs(bb, g.bblocks[bb.id])
+
+    def test_long_chain(self):
+        # A chain of basic blocks deeper than Python's recursion limit.
+        f = cfg.Function("chain")
+        n = 5000
+        bbs = {}
+        prev = None
+        for i in range(1, n+1):
+            bb = cfg.BasicBlock("bb"+str(i), f)
+            bb.set_instructions([cfg.Instruction(bb, None, "br", [], [])])
+            bbs[bb.id] = bb
+            if prev is not None:
+                bb.preds[prev.id] = prev
+                prev.succs[bb.id] = bb
+            prev = bb
+        f.set_bblocks(bbs, bbs["bb1"])
+
+        rpo = f.reverse_postorder()
+        self.assertEqual([bb.id for bb in rpo], ["bb"+str(i) for i in range(1, n+1)])
+        utils.number_instructions(rpo)
+        self.assertEqual(f.bblocks["bb"+str(n)].first_instr().num, n-1)
+        self.assertEqual(len(utils.postorder(f)), n)
+
+
+class FingerprintTests(cfgmocks.GCDTest):
+
+    def test_fingerprint_of_copy(self):
+        g = self.f.copy()
+        self.assertEqual(self.f.fingerprint(), g.fingerprint())
+        self.assertEqual(self.f.fingerprint(with_alloc=True), g.fingerprint(with_alloc=True))
+
+    def test_fingerprint_of_parsed_module(self):
+        m1 = cfg.Module.from_file("programs/sort.json")
+        m2 = cfg.Module.from_file("programs/sort.json")
+        for (name, f) in m1.functions.iteritems():
+            self.assertEqual(f.fingerprint(), m2.functions[name].fingerprint())
+
+    def test_fingerprint_changes(self):
+        fp = self.f.fingerprint()
+        bb1, bb3 = self.f.bblocks["bb1"], self.f.bblocks["bb3"]
+        bti = self.f.create_new_basic_block()
+        self.f.insert_basic_block_between(bti, bb1, bb3)
+        self.assertNotEqual(fp, self.f.fingerprint())
+
+    def test_fingerprint_with_alloc(self):
+        fp = self.f.fingerprint()
+        fp_alloc = self.f.fingerprint(with_alloc=True)
+        self.f.vars["v1"].alloc = "reg1"
+        self.assertEqual(fp, self.f.fingerprint())
+        self.assertNotEqual(fp_alloc, self.f.fingerprint(with_alloc=True))
+
+
+class CompactTests(cfgmocks.GCDTest):
+
+    def test_compact_round_trip(self):
+        analysis.perform_full_analysis(self.f)
+        self.f.vars["v1"].alloc = "reg1"
+        g = cfg.Function.from_compact(self.f.compact(), original=self.f)
+        self.assertEqual(self.f.fingerprint(with_alloc=True), g.fingerprint(with_alloc=True))
+        self.assertEqual(g.instr_counter, self.f.instr_counter)
+        self.assertEqual([bb.id for bb in g.reverse_postorder()],
+                [bb.id for bb in self.f.reverse_postorder()])
+
+        for bb in self.f.bblocks.values():
+            gbb = g.bblocks[bb.id]
+            self.assertEqual(gbb.preds.keys(), bb.preds.keys())
+            for (instr, ginstr) in zip(bb.instructions, gbb.instructions):
+                self.assertEqual(ginstr.id, instr.id)
+                self.assertIs(ginstr.original, instr)
+                self.assertEqual(ginstr.operands, instr.operands)
+                for var in ginstr.operands:
+                    if isinstance(var, cfg.Variable):
+                        self.assertIs(var, g.vars[var.id])
+
+    def test_compact_analysis(self):
+        analysis.perform_full_analysis(self.f)
+        g = cfg.Function.from_compact(self.f.compact())
+        analysis.apply_compact_analysis(g, analysis.compact_analysis(self.f))
+        for bb in self.f.bblocks.values():
+            gbb = g.bblocks[bb.id]
+            self.assertEqual(gbb.live_out, bb.live_out)
+            self.assertEqual(gbb.dominators, bb.dominators)
+            for (instr, ginstr) in zip(bb.instructions, gbb.instructions):
+                self.assertEqual(ginstr.num, instr.num)
+                self.assertEqual(set(ginstr.live_in), set(instr.live_in))
+
+
+class OperandTests(cfgmocks.GCDTest):
+
+    def test_names_normalised_to_variables(self):
+        i0 = self.f.bblocks["bb1"].instructions[0]
+        self.assertEqual(i0.operands, [self.f.vars["v2"], self.f.vars["v3"]])
+        self.assertIs(i0.uses_debug[0], self.f.vars["v2"])
+        self.assertEqual(set(i0.uses), set([self.f.vars["v2"], self.f.vars["v3"]]))
+
+    def test_operand_kinds(self):
+        i1 = self.f.bblocks["bb1"].instructions[1]
+        self.assertEqual(list(i1.operand_kinds), 
+                [cfg.Instruction.VARIABLE, cfg.Instruction.LABEL, cfg.Instruction.LABEL])
+        self.assertEqual(list(i1.uses), [self.f.vars["v1"]])
+
+        i11 = self.f.bblocks["bb4"].instructions[2]
+        self.assertEqual(list(i11.operand_kinds), [cfg.Instruction.VARIABLE, cfg.Instruction.CONST])
+
+    def test_replace_operand(self):
+        i2 = self.f.bblocks["bb2"].instructions[0]
+        v2, v3 = self.f.vars["v2"], self.f.vars["v3"]
+        i2.replace_operand(v2, "mem(v2)")
+        self.assertEqual(i2.uses_debug, ("mem(v2)", v3))
+        self.assertEqual(list(i2.operand_kinds), [cfg.Instruction.SLOT, cfg.Instruction.VARIABLE])
+        self.assertNotIn(v2, i2.uses)
+        self.assertIn(v3, i2.uses)
+
+    def test_phi_operands(self):
+        i6 = self.f.bblocks["bb3"].instructions[0]
+        self.assertEqual(dict(i6.uses), {"bb2": self.f.vars["v6"], "bb1": self.f.vars["v3"]})
+        self.assertEqual(i6.phi_preds, {"v6": "bb2", "v3": "bb1"})
+
+        i6.replace_phi_block("bb1", "bb7")
+        self.assertNotIn("bb1", i6.uses)
+        self.assertIs(i6.uses["bb7"], self.f.vars["v3"])
+        self.assertIs(i6.uses_debug["bb7"], self.f.vars["v3"])
+        self.assertEqual(i6.phi_preds, {"v6": "bb2", "v3": "bb7"})
+
+        # The same variable may come from more than one predecessor.
+        i6.replace_operand(self.f.vars["v6"], self.f.vars["v3"])
+        self.assertEqual(len(i6.uses), 2)
+        self.assertEqual(i6.phi_preds, {"v3": "bb7"})
+        self.assertIs(i6.uses, i6.uses)
+
+    def test_copy_operands(self):
+        analysis.perform_full_analysis(self.f)
+        g = self.f.copy()
+        for bb in self.f.bblocks.values():
+            for (instr, cinstr) in zip(bb.instructions, g.bblocks[bb.id].instructions):
+                self.assertEqual(instr.operands, cinstr.operands)
+                self.assertEqual(instr.operand_kinds, cinstr.operand_kinds)
+                self.assertEqual(instr.phi_blocks, cinstr.phi_blocks)
+                for var in cinstr.operands:
+                    if isinstance(var, cfg.Variable):
+                        self.assertIs(var, g.vars[var.id])
@@ -0,0 +1,118 @@
+import unittest
+import cfg
+import tests.cfgmocks as cfgmocks
+
+
+class EdgeStoreTests(cfgmocks.GCDTest):
+
+    def ids(self, bbs):
+        return [bb.id for bb in bbs]
+
+    def test_views(self):
+        bb1, bb4 = self.f.bblocks["bb1"], self.f.bblocks["bb4"]
+        self.assertEqual(len(bb4.preds), 2)
+        self.assertIn("bb5", bb4.preds)
+        self.assertNotIn("bb2", bb4.preds)
+        self.assertIs(bb4.preds["bb3"], self.f.bblocks["bb3"])
+        self.assertEqual(sorted(bb4.preds.keys()), ["bb3", "bb5"])
+        self.assertEqual(bb1.preds.values(), [])
+        with self.assertRaises(KeyError):
+            bb1.preds["bb2"]
+        self.assertNotIn("bb100", bb4.preds)
+        self.assertIs(bb4.preds, bb4.preds)
+
+        for bb in self.f.bblocks.values():
+            for s in bb.succs.itervalues():
+                self.assertIs(s.preds[bb.id], bb)
+            for p in bb.preds.itervalues():
+                self.assertIs(p.succs[bb.id], bb)
+
+    def test_successors_ordered_by_terminator(self):
+        # br v1, bb3, bb2
+        self.assertEqual(self.ids(self.f.bblocks["bb1"].succs.values()), ["bb3", "bb2"])
+        # br v15, bb6, bb5
+        self.assertEqual(self.ids(self.f.bblocks["bb4"].succs.values()), ["bb6", "bb5"])
+
+    def test_insert_basic_block_between(self):
+        bb1, bb3 = self.f.bblocks["bb1"], self.f.bblocks["bb3"]
+        bti = self.f.create_new_basic_block()
+        self.f.insert_basic_block_between(bti, bb1, bb3)
+
+        # The new block takes the position of bb3.
+        self.assertEqual(self.ids(bb1.succs.values()), [bti.id, "bb2"])
+        self.assertEqual(self.ids(bti.preds.values()), ["bb1"])
+        self.assertEqual(self.ids(bti.succs.values()), ["bb3"])
+        self.assertEqual(sorted(bb3.preds.keys()), sorted(["bb2", bti.id]))
+        for phi in bb3.phis:
+            self.assertIn(bti.id, phi.uses)
+            self.assertNotIn("bb1", phi.uses)
+
+    def test_view_updates(self):
+        bb2, bb5, bb6 = self.f.bblocks["bb2"], self.f.bblocks["bb5"], self.f.bblocks["bb6"]
+        bb5.succs["bb6"] = bb6
+        self.assertIn("bb5", bb6.preds)
+        self.assertEqual(self.ids(bb5.succs.values()), ["bb4", "bb6"])
+
+        del bb6.preds["bb5"]
+        self.assertNotIn("bb6", bb5.succs)
+        with self.assertRaises(KeyError):
+            del bb5.succs["bb6"]
+
+        # Adding an existing edge again doesn't duplicate it.
+        bb2.succs["bb3"] = self.f.bblocks["bb3"]
+        self.assertEqual(len(bb2.succs), 1)
+
+    # Lists of neighbours cached by views follow changes of edges.
+    def test_cached_lists(self):
+        bb1, bb2, bb3 = self.f.bblocks["bb1"], self.f.bblocks["bb2"], self.f.bblocks["bb3"]
+        succs = bb1.succs.values()
+        preds = list(bb3.preds.itervalues())
+        succs.append(bb1)
+        self.assertEqual(self.ids(bb1.succs.values()), ["bb3", "bb2"])
+
+        it = bb1.succs.itervalues()
+        bti = self.f.create_new_basic_block()
+        self.f.insert_basic_block_between(bti, bb1, bb3)
+        self.assertEqual(self.ids(it), ["bb3", "bb2"])
+        self.assertEqual(self.ids(bb1.succs.values()), [bti.id, "bb2"])
+        self.assertEqual(sorted(self.ids(bb3.preds.values())),
+                sorted(bti.id if bb is bb1 else bb.id for bb in preds))
+        self.assertEqual(self.ids(bti.preds.values()), ["bb1"])
+
+        del bb1.succs["bb2"]
+        self.assertEqual(len(bb1.succs), 1)
+        self.assertNotIn(bb1, bb2.preds.values())
+
+    def test_order_preserved_by_compaction(self):
+        bb1 = self.f.bblocks["bb1"]
+        new_bbs = []
+        for i in range(100):
+            bb = self.f.create_new_basic_block()
+            bb1.succs[bb.id] = bb
+            new_bbs.append(bb)
+        for bb in new_bbs[::2]:
+            del bb1.succs[bb.id]
+
+        self.assertEqual(self.ids(bb1.succs.values()), ["bb3", "bb2"] + self.ids(new_bbs[1::2]))
+        for bb in new_bbs[1::2]:
+            self.assertEqual(self.ids(bb.preds.values()), ["bb1"])
+
+    def test_copy(self):
+        g = self.f.copy()
+        for bb in self.f.bblocks.values():
+            cbb = g.bblocks[bb.id]
+            self.assertEqual(self.ids(cbb.succs.values()), self.ids(bb.succs.values()))
+            self.assertEqual(self.ids(cbb.preds.values()), self.ids(bb.preds.values()))
+            for s in cbb.succs.itervalues():
+                self.assertIs(s, g.bblocks[s.id])
+
+    def test_unreachable_blocks_removed(self):
+        m = cfg.Module.from_file("programs/sort.json")
+        for f in m.functions.values():
+            for bb in f.bblocks.values():
+                for n in bb.succs.values() + bb.preds.values():
+                    self.assertIs(n, f.bblocks[n.id])
+
+
+if __name__ == '__main__':
+    unittest.main()
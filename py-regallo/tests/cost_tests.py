@@ -0,0 +1,90 @@
+import unittest
+import cfg
+import cfg.analysis as analysis
+from cost import MainCostCalculator, FrequencyWeightedCostCalculator
+from allocators.lscan.basic import BasicLinearScan
+
+class FrequencyAnalysisTests(unittest.TestCase):
+
+    def assert_flow_conserved(self, f):
+        for bb in f.bblocks.values():
+            if bb.succs:
+                self.assertLessEqual(sum(bb.succ_probs.values()), 1.0 + 1e-9)
+
+            incoming = sum(p.frequency * p.succ_probs[bb.id] for p in bb.preds.values())
+            if bb is f.entry_bblock:
+                incoming += 1
+            self.assertAlmostEqual(bb.frequency, incoming)
+
+    def test_gcd(self):
+        m = cfg.Module.from_file("programs/gcd.json")
+        analysis.perform_full_analysis(m)
+        for f in m.functions.values():
+            analysis.perform_frequency_analysis(f)
+            self.assert_flow_conserved(f)
+            self.assertAlmostEqual(f.entry_bblock.frequency, 1.0)
+
+            # Blocks inside loops are executed more often than the entry.
+            for bb in f.bblocks.values():
+                if bb.loop is not None:
+                    self.assertGreater(bb.frequency, f.entry_bblock.frequency)
+
+    def test_all_programs(self):
+        for p in ["sort", "fft", "gjk", "factor"]:
+            m = cfg.Module.from_file("programs/"+p+".json")
+            analysis.perform_full_analysis(m)
+            for f in m.functions.values():
+                analysis.perform_frequency_analysis(f)
+                self.assert_flow_conserved(f)
+
+    def test_update(self):
+        m = cfg.Module.from_file("programs/sort.json")
+        analysis.perform_full_analysis(m)
+        bls = BasicLinearScan()
+        for f in m.functions.values():
+            # Frequencies are not computed by the full analysis.
+            self.assertIsNone(f.entry_bblock.frequency)
+            analysis.update_frequency_analysis(f)
+            self.assert_flow_conserved(f)
+
+            # Up-to-date frequencies are not computed again.
+            f.entry_bblock.frequency = 2.0
+            analysis.update_frequency_analysis(f)
+            self.assertEqual(f.entry_bblock.frequency, 2.0)
+            f.entry_bblock.frequency = 1.0
+
+            # Blocks inserted by the allocation get their frequencies as well.
+            g = bls.perform_full_register_allocation(f, f.minimal_register_pressure())
+            self.assertIsNotNone(g)
+            analysis.update_frequency_analysis(g)
+            self.assert_flow_conserved(g)
+
+
+class FrequencyWeightedCostCalculatorTests(unittest.TestCase):
+
+    def test_spill_code_costs(self):
+        m = cfg.Module.from_file("programs/sort.json")
+        analysis.perform_full_analysis(m)
+        fcc = FrequencyWeightedCostCalculator()
+        mcc = MainCostCalculator()
+        bls = BasicLinearScan()
+
+        for f in m.functions.values():
+            regcount = f.minimal_register_pressure()
+            g = bls.perform_full_register_allocation(f, regcount)
+            self.assertIsNotNone(g)
+            if mcc.function_diff(g, f) > 0:
+                self.assertGreater(fcc.function_diff(g, f), 0)
+            self.assertGreaterEqual(fcc.function_cost(f), 0)
+
+            # Frequencies which are up to date are only read.
+            for bb in g.bblocks.values():
+                bb.frequency = 1.0
+            cost = fcc.function_cost(g)
+            for bb in g.bblocks.values():
+                bb.frequency = 2.0
+            self.assertEqual(fcc.function_cost(g), 2 * cost)
+
+
+if __name__ == '__main__':
+    unittest.main()
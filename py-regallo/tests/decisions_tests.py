@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+import cfg
+import decisions
+import cfg.analysis as analysis
+from allocators.lscan.basic import BasicLinearScan
+
+
+class DecisionsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "decisions.trace")
+        self.m = cfg.Module.from_file("programs/sort.json")
+        analysis.perform_full_analysis(self.m)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_disabled(self):
+        self.assertIsNone(decisions.recorder)
+        self.assertIsNone(decisions.variables([]))
+        decisions.attempt(1, True)
+
+    def test_records(self):
+        bls = BasicLinearScan()
+        allocated = []
+        attempts = []
+        with decisions.Recorder(self.filename) as r:
+            self.assertIs(decisions.recorder, r)
+            for f in self.m.functions.values():
+                for regcount in [f.minimal_register_pressure() - 1, f.minimal_register_pressure()]:
+                    allocated.append(bls.perform_full_register_allocation(f, regcount))
+                    attempts.append(bls.attempts)
+        self.assertIsNone(decisions.recorder)
+
+        records = list(decisions.records(self.filename))
+        self.assertEqual(len(records), len(allocated))
+        for (record, g, count) in zip(records, allocated, attempts):
+            self.assertEqual(record.allocator, bls.name)
+            self.assertEqual(record.success, g is not None)
+            self.assertEqual(len(record.decisions(decisions.ATTEMPT)), count)
+            self.assertEqual(len(record.decisions(decisions.ATTEMPT_END)), count)
+            if g is None:
+                continue
+
+            self.assertEqual(record.allocs, {vid: var.alloc for (vid, var) in g.vars.iteritems()})
+            starts = set(e[1] for e in record.decisions(decisions.START))
+            self.assertGreater(len(starts), 0)
+            for (_, spilled, current, candidates) in record.decisions(decisions.SPILL):
+                self.assertIn(current, starts)
+                self.assertTrue(spilled == current or spilled in candidates)
+
+    def test_buffered_until_disabled(self):
+        bls = BasicLinearScan()
+        f = self.m.functions.values()[0]
+        with decisions.Recorder(self.filename):
+            bls.perform_full_register_allocation(f, f.maximal_register_pressure())
+            self.assertEqual(os.path.getsize(self.filename), 0)
+            bls.perform_full_register_allocation(f, f.maximal_register_pressure())
+
+        [first, second] = list(decisions.records(self.filename))
+        self.assertEqual(first.events, second.events)
+        self.assertEqual(first.allocs, second.allocs)
+
+if __name__ == '__main__':
+    unittest.main()
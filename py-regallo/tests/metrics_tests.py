@@ -0,0 +1,70 @@
+import unittest
+import cfg
+import metrics
+import cfg.analysis as analysis
+from allocators.lscan.basic import BasicLinearScan
+from allocators.lscan.extended import ExtendedLinearScan
+import allocators.graph as graph
+
+
+class CountersTests(unittest.TestCase):
+
+    def test_disabled(self):
+        self.assertIsNone(metrics.collector)
+        metrics.count(metrics.SPILLS)
+
+    def test_nested_counters(self):
+        with metrics.Counters() as outer:
+            metrics.count("a")
+            with metrics.Counters() as inner:
+                metrics.count("a", 2)
+                metrics.count("b")
+
+        self.assertIsNone(metrics.collector)
+        self.assertEqual(inner.as_dict(), {"a": 2, "b": 1})
+        self.assertEqual(outer.as_dict(), {"a": 3, "b": 1})
+        self.assertEqual(outer["c"], 0)
+
+    def test_analysis(self):
+        m = cfg.Module.from_file("programs/sort.json")
+        with metrics.Counters() as c:
+            analysis.perform_full_analysis(m)
+
+        # Liveness takes one pass per function (see analysis.compute_ssa_liveness).
+        self.assertEqual(c[metrics.LIVENESS_ITERATIONS], len(m.functions))
+        self.assertGreaterEqual(c[metrics.DOMINANCE_ITERATIONS], 2 * len(m.functions))
+
+    def test_allocation_runs(self):
+        m = cfg.Module.from_file("programs/fft.json")
+        analysis.perform_full_analysis(m)
+        regcount = m.minimal_register_pressure()
+
+        bls = BasicLinearScan()
+        bls.perform_full_module_register_allocation(m, regcount)
+        counts = bls.counters
+        self.assertEqual(counts[metrics.ALLOCATION_ATTEMPTS], bls.attempts)
+        self.assertEqual(counts[metrics.FUNCTION_COPIES], bls.attempts)
+        self.assertGreater(counts[metrics.SORTEDSET_ADDS], 0)
+        self.assertGreater(counts[metrics.SPILLS], 0)
+        self.assertEqual(counts[metrics.INTERFERENCE_EDGES], 0)
+
+        # The same run gives the same counts.
+        bls.perform_full_module_register_allocation(m, regcount)
+        self.assertEqual(counts.as_dict(), bls.counters.as_dict())
+
+        ext = ExtendedLinearScan()
+        ext.perform_full_module_register_allocation(m, regcount)
+        self.assertGreaterEqual(ext.counters[metrics.SORTEDSET_ADDS], ext.counters[metrics.SORTEDSET_REMOVES])
+
+    def test_interference_edges(self):
+        m = cfg.Module.from_file("programs/gcd.json")
+        analysis.perform_full_analysis(m)
+        for f in m.functions.values():
+            with metrics.Counters() as c:
+                neighs = graph.build_interference_graph(f)
+            edges = set(frozenset([u, v]) for u in neighs for v in neighs[u])
+            self.assertEqual(c[metrics.INTERFERENCE_EDGES], len(edges))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import json
+import cfg
+import utils
+import profiling
+import cfg.analysis as analysis
+from cost import SpillInstructionsCounter
+from allocators.lscan.basic import BasicLinearScan
+
+
+class TracerTests(unittest.TestCase):
+
+    def test_disabled(self):
+        self.assertIsNone(profiling.tracer)
+        self.assertIs(profiling.phase("phase", function="f"), profiling.NO_PHASE)
+
+    def test_nested_phases(self):
+        with profiling.Tracer() as t:
+            with profiling.phase("outer", function="f"):
+                with profiling.phase("inner", regcount=3):
+                    pass
+                with profiling.phase("inner"):
+                    pass
+
+        self.assertIsNone(profiling.tracer)
+        self.assertEqual([e.name for e in t.events], ["inner", "inner", "outer"])
+        self.assertEqual(t.events[0].args, {"function": "f", "regcount": 3})
+        self.assertEqual(t.events[1].args, {"function": "f"})
+        self.assertEqual([e.depth for e in t.events], [1, 1, 0])
+
+        outer = t.events[2]
+        self.assertLessEqual(outer.self_time, outer.duration)
+        summary = {name: (calls, total) for (name, calls, total, _) in t.summary()}
+        self.assertEqual(summary["inner"][0], 2)
+        self.assertLessEqual(summary["inner"][1], outer.duration)
+
+    def test_allocation_phases(self):
+        m = cfg.Module.from_file("programs/sort.json")
+        analysis.perform_full_analysis(m)
+        f = m.functions.values()[0]
+        with profiling.Tracer() as t:
+            BasicLinearScan().perform_full_register_allocation(f, f.minimal_register_pressure())
+
+        names = set(e.name for e in t.events)
+        for name in ["full register allocation", "copy", "compute_intervals",
+                "allocate_registers", "eliminate_phi", "liveness analysis"]:
+            self.assertIn(name, names)
+
+        for e in t.events:
+            self.assertEqual(e.args["function"], f.name)
+
+        trace = json.loads(json.dumps(t.chrome_trace()))
+        self.assertEqual(len(trace["traceEvents"]), len(t.events))
+        for e in trace["traceEvents"]:
+            self.assertEqual(e["ph"], "X")
+            self.assertGreaterEqual(e["dur"], 0)
+
+    def test_result_computation(self):
+        m = cfg.Module.from_file("programs/gcd.json")
+        analysis.perform_full_analysis(m)
+        setting = utils.ResultCompSetting(
+                inputs = [m],
+                regcounts = [3],
+                allocators = [BasicLinearScan()],
+                cost_calculators = [SpillInstructionsCounter()],
+                tracer = profiling.Tracer())
+        utils.compute_full_results(setting)
+
+        self.assertIsNone(profiling.tracer)
+        self.assertTrue(setting.tracer.events)
+        table = setting.tracer.summary_table()
+        self.assertEqual(len(table), len(setting.tracer.summary()) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
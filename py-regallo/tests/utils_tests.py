@@ -106,5 +106,31 @@ class ResultTableTests(unittest.TestCase):
         #print(data2rst(table, spans=spans, use_headers=True))
 
 
+class RegisterSetTests(unittest.TestCase):
+
+    def test_lowest_free(self):
+        regset = utils.RegisterSet(3)
+        self.assertEqual([regset.get_free() for _ in range(4)], ["reg1", "reg2", "reg3", None])
+        regset.set_free("reg2")
+        regset.set_free("reg1")
+        self.assertEqual(regset.get_free(), "reg1")
+        regset.reset()
+        regset.occupy("reg1")
+        self.assertEqual(regset.get_free(), "reg2")
+        self.assertEqual(utils.registers_of(regset.occupied()), ["reg1", "reg2"])
+
+    def test_masks(self):
+        mask = utils.register_mask(["reg2", "mem(v1)", None, "reg12"])
+        self.assertEqual(mask, (1 << 1) | (1 << 11))
+        self.assertEqual(utils.registers_of(mask), ["reg2", "reg12"])
+        self.assertEqual(utils.lowest_register(mask), "reg2")
+        self.assertIsNone(utils.lowest_register(0))
+
+        regset = utils.RegisterSet(3)
+        self.assertEqual(regset.first_free(utils.register_mask(["reg1", "reg2"])), "reg3")
+        self.assertIsNone(regset.first_free(regset.all))
+        self.assertEqual(regset.get_free(), "reg1")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,6 +2,9 @@ import re
 import json
 import glob
 import cfg
+import cfg.traversal as traversal
+import profiling
+import budget
 import pygraphviz as pgv
 import numpy as np
 from cfg.printer import FunctionString, Opts
@@ -69,49 +72,18 @@ def modules_from_files(dir_path):
 #########################################################################
 
 # DFS function that traverses basic blocks.
+# See cfg.traversal.dfs for the description of params.
 def dfs(bb, visited, **params):
-    vpre = params.get("vpre", None)
-    vpost = params.get("vpost", None)
-    ef = params.get("ef", None)
-    backwards = params.get("backwards", False)
-    vstop = params.get("vstop", None) # id of bb at which, after processing,  dfs should stop
-
-    # Mark as visited.
-    visited.add(bb.id)
-
-    # Call vertex function if exists.
-    if vpre is not None:
-        vpre(bb)
-
-    # Maybe stop here.
-    if vstop and bb.id == vstop.id:
-        return
-
-    neighbours = (bb.succs, bb.preds)[backwards]
-    for n in neighbours.values():
-        # Call edge function if exists.
-        if ef is not None:
-            ef((bb, n))
-        if n.id not in visited:
-           dfs(n, visited, **params) 
-
-    if vpost is not None:
-        vpost(bb)
+    traversal.dfs(bb, visited, **params)
 
 # Returns list of basic blocks of the given function in postorder.
 def postorder(f):
-    bbs = []
-    def vpost(bb):
-        bbs.append(bb)
-
-    dfs(f.entry_bblock, visited=set(), vpost=vpost)
-    return bbs
+    return f.reverse_postorder()[::-1]
 
 # Returns list of basic blocks of the given function in reverse postorder.
 # It guarantees that for each edge (a DOM> b), a will be before b
 def reverse_postorder(f):
-    bbs = postorder(f)
-    return bbs[::-1]
+    return list(f.reverse_postorder())
 
 # This function takes list of basic blocks, and assignes numbers to instructions in this order.
 def number_instructions(bbs):
@@ -129,39 +101,96 @@ def number_instructions(bbs):
 ############################### REGISTERS ###############################
 #########################################################################
 
-# RegisterSet is a helper class for managing registers.
-# It is made up of a set of free registers and a set of allocated registers.
-# To return a free register it removes one from the set of free registers (if there are any)
-# and adds it to the set of allocated ones (both in O(lg N)). If some register becomes free,
-# it performs a reverse operation.
+# Registers are named reg1, reg2, ..., regN. Sets of registers are represented as
+# integer bitmasks in which register regI is bit I-1.
+
+# List of register names, indexed by bits, extended when needed.
+register_names = []
+
+# Dictionary {register name: bit}.
+register_bits = {}
+
+def register_name(bit):
+    while len(register_names) <= bit:
+        name = "reg" + str(len(register_names) + 1)
+        register_bits[name] = len(register_names)
+        register_names.append(name)
+    return register_names[bit]
+
+def register_bit(reg):
+    if reg not in register_bits:
+        register_name(int(reg[3:]) - 1)
+    return register_bits[reg]
+
+# Returns mask of the given registers. Other names (e.g. memory slots or None) are skipped.
+def register_mask(regs):
+    mask = 0
+    for reg in regs:
+        bit = register_bits.get(reg)
+        if bit is None:
+            if not is_regname(reg):
+                continue
+            bit = register_bit(reg)
+        mask |= 1 << bit
+    return mask
+
+# Returns the register with the lowest number in the mask or None if it is empty.
+def lowest_register(mask):
+    if not mask:
+        return None
+    return register_name((mask & -mask).bit_length() - 1)
+
+# Returns list of registers in the mask, ordered by numbers.
+def registers_of(mask):
+    regs = []
+    while mask:
+        low = mask & -mask
+        regs.append(register_name(low.bit_length() - 1))
+        mask ^= low
+    return regs
+
+# RegisterSet is a helper class for managing registers. It keeps the mask of free
+# registers, so that all operations are O(1) and the free register with the lowest
+# number is always returned, which makes the allocation deterministic.
 class RegisterSet:
     def __init__(self, count):
         self.count = count
-        # A list of free registers ['reg_count', 'reg_{count-1}', ..., 'reg3', 'reg2', 'reg1']
+        # Mask of all registers.
+        self.all = (1 << count) - 1
         self.reset()
 
     def reset(self):
-        self.free = set(["reg"+str(i+1) for i in range(self.count)])
-        self.occupied = set()
+        self.free = self.all
+
+    # Mask of occupied registers.
+    def occupied(self):
+        return self.all & ~self.free
 
-    # Returns id of one of free registers. If there are no free registers, returns None.
+    # Returns id of the free register with the lowest number and occupies it.
+    # If there are no free registers, returns None.
     def get_free(self):
-        if len(self.free) == 0:
+        if not self.free:
             return None
-        x = self.free.pop()
-        self.occupied.add(x)
-        return x
+        low = self.free & -self.free
+        self.free ^= low
+        return register_name(low.bit_length() - 1)
+
+    # Returns id of the free register with the lowest number which is not in the
+    # given mask (e.g. registers occupied somewhere in a range of instructions)
+    # without occupying it, or None if there is no such register.
+    def first_free(self, mask=0):
+        return lowest_register(self.free & ~mask)
 
     # Frees the given registers (makes it available for another allocation).
     def set_free(self, reg):
-        assert reg in self.occupied
-        self.occupied.remove(reg)
-        self.free.add(reg)
+        bit = 1 << register_bit(reg)
+        assert not self.free & bit
+        self.free |= bit
 
     def occupy(self, reg):
-        assert reg in self.free
-        self.occupied.add(reg)
-        self.free.remove(reg)
+        bit = 1 << register_bit(reg)
+        assert self.free & bit
+        self.free &= ~bit
 
 #########################################################################
 ############################### DRAWINGS ################################
@@ -182,7 +211,7 @@ def draw_intervals(intervals, regcount=0, to_file=None, figsize=None, with_subin
 
     if regcount:
         regset = RegisterSet(regcount)
-        reg_colors = {reg: col for reg, col in zip(list(regset.free), colors[1:])}
+        reg_colors = {reg: col for reg, col in zip(registers_of(regset.free), colors[1:])}
 
     for (vid, ivlist) in intervals.iteritems():
         id_num = int(extract_num_from_id(vid))
@@ -278,12 +307,27 @@ def draw_graph(neighs, filename, regcount, dot=False):
 # regcounts - list of ints denoting number of registers.
 # allocators - list of triples allocators.
 # cost_calculators - list of CostCalculators.
+# tracer - optional profiling.Tracer recording phases of the computation.
+# time_budget - optional limit of wall time (in seconds) of a single allocation
+#               (one input, regcount and allocator).
+# memory_budget - optional limit of memory (in megabytes) of a single allocation.
+# estimate - if True, costs are estimated without performing the full register
+#            allocation (see Allocator.estimate).
+# warm_start - if True, allocations of the same input with different regcounts share
+#              results of the first phase (see allocators.search.WarmStart). Results
+#              don't change.
 class ResultCompSetting:
-    def __init__(self, inputs, regcounts, allocators, cost_calculators):
+    def __init__(self, inputs, regcounts, allocators, cost_calculators, tracer=None,
+            time_budget=None, memory_budget=None, estimate=False, warm_start=False):
         self.inputs = inputs
         self.regcounts = regcounts
         self.allocators = allocators
         self.cost_calculators = cost_calculators
+        self.tracer = tracer
+        self.time_budget = time_budget
+        self.memory_budget = memory_budget
+        self.estimate = estimate
+        self.warm_start = warm_start
 
     def allocator_names(self):
         return [al.name for al in self.allocators]
@@ -294,10 +338,42 @@ class ResultCompSetting:
 
 # For provided ResultSetting object, computes results for provided arguments returning
 # list [(input_name, [(regcount, [(allocator_name, [(cost_name, RESULT)] )] )] )].
+# RESULT is -1 if the allocation failed and budget.TIMEOUT or budget.OOM if it
+# exceeded the time or memory budget of the setting.
 def compute_full_results(setting):
+    if setting.tracer is not None:
+        with setting.tracer:
+            return compute_full_results_untraced(setting)
+
+    return compute_full_results_untraced(setting)
+
+def compute_full_results_untraced(setting):
     results = []
 
     for inp in setting.inputs:
+        # Dictionary {allocator name: warm start for inp} (see Allocator.warm_start_for).
+        warm_starts = {}
+        if setting.warm_start:
+            warm_starts = {al.name: al.warm_start_for(inp) for al in setting.allocators}
+
+        # Allocators with the same preparation key share one preparation of inp
+        # (see Allocator.preparation_for). Dictionary {allocator name: preparation}.
+        preparations = {}
+        # Dictionary {allocator name: generator of allocations of inp by the group of
+        # allocators it belongs to (see Allocator.allocate_many)}. Allocations of
+        # a Function are made in batches, which yield their results in the same order
+        # as cells of the grid are computed.
+        batches = {}
+        for group in group_by_preparation(setting.allocators):
+            shared = group[0].preparation_for(inp)
+            batch = None
+            if isinstance(inp, cfg.Function) and not setting.estimate:
+                batch = group[0].allocate_many(inp, setting.regcounts, group, setting.warm_start)
+            for al in group:
+                preparations[al.name] = shared
+                if batch is not None:
+                    batches[al.name] = batch
+
         # REGISTERS
         reg_results = []
         for regc in setting.regcounts:
@@ -305,10 +381,38 @@ def compute_full_results(setting):
             alloc_results = []
             for al in setting.allocators:
                 input_after_allocation = None
-                if isinstance(inp, cfg.Function):
-                    input_after_allocation = al.perform_full_register_allocation(inp, regc)
-                elif isinstance(inp, cfg.Module):
-                    input_after_allocation = al.perform_full_module_register_allocation(inp, regc)
+                estimated = None
+                exceeded = None
+                try:
+                    with budget.Budget(setting.time_budget, setting.memory_budget):
+                        if setting.estimate:
+                            estimated = estimate_cost_results(al, inp, regc, setting.cost_calculators)
+                        elif al.name in batches:
+                            _, _, input_after_allocation = next(batches[al.name])
+                        elif isinstance(inp, cfg.Function):
+                            input_after_allocation = al.perform_full_register_allocation(inp, regc,
+                                    warm_starts.get(al.name), preparations.get(al.name))
+                        elif isinstance(inp, cfg.Module):
+                            input_after_allocation = al.perform_full_module_register_allocation(inp, regc,
+                                    warm_starts.get(al.name), preparations.get(al.name))
+                except budget.BudgetExceeded as e:
+                    exceeded = e.result
+                except MemoryError:
+                    exceeded = budget.OOM
+
+                if exceeded is not None and al.name in batches:
+                    # The batch can't be resumed, remaining cells of its group are
+                    # computed one by one.
+                    batch = batches[al.name]
+                    batches = {name: b for (name, b) in batches.iteritems() if b is not batch}
+
+                if exceeded is not None:
+                    alloc_results.append((al.name, [(cc.name, exceeded) for cc in setting.cost_calculators]))
+                    continue
+
+                if estimated is not None:
+                    alloc_results.append((al.name, estimated))
+                    continue
 
                 # COSTS 
                 cost_results = []
@@ -330,6 +434,40 @@ def compute_full_results(setting):
 
     return results
 
+# Splits allocators into groups (lists in the original order) of allocators with the same
+# preparation key (see Allocator.preparation_key). Allocators without a key form
+# one-element groups.
+def group_by_preparation(allocators):
+    groups = []
+    by_key = {}
+    for al in allocators:
+        key = al.preparation_key()
+        if key is None:
+            groups.append([al])
+        elif key in by_key:
+            by_key[key].append(al)
+        else:
+            by_key[key] = [al]
+            groups.append(by_key[key])
+
+    return groups
+
+# Returns list [(cost_name, RESULT)] of estimated costs of the full register allocation
+# of inp (Function or Module) performed by allocator al (see Allocator.estimate).
+def estimate_cost_results(al, inp, regc, cost_calculators):
+    estimates = None
+    if isinstance(inp, cfg.Function):
+        estimate = al.estimate(inp, regc, cost_calculators)
+        if estimate is not None:
+            estimates = [estimate]
+    elif isinstance(inp, cfg.Module):
+        estimates = al.estimate_module(inp, regc, cost_calculators)
+
+    if estimates is None:
+        return [(cc.name, -1) for cc in cost_calculators]
+
+    return [(cc.name, sum(e.costs[cc.name] for e in estimates)) for cc in cost_calculators]
+
 
 # Computes a table with span lists that we can print out to the
 # console using dashtable.data2rst.
@@ -396,10 +534,13 @@ def compute_result_table(d, setting):
     
     return table, spans
 
-# Computes and prints to the output table with results provided as argument.
+# Computes and prints to the output table with results provided as argument
+# and, if the setting has a tracer, the summary of recorded phases.
 def compute_and_print_result_table(results, setting):
     table, spans = compute_result_table(results, setting)
     print(data2rst(table, spans=spans, use_headers=True))
+    if setting.tracer is not None:
+        setting.tracer.print_summary()
 
 # For given setting (with only one cost calculator allowed) and corresponding results,
 # draws a separate plot (regcount -> sum of costs of each input) for every provided algorithm.
@@ -414,6 +555,9 @@ def plot_reg_to_cost(results, settings, cost_calc_index=0, to_file=None, figsize
             regcounts.add(reg)
             for (alname, costs) in allocators:
                 c = costs[cost_calc_index][1]
+                if isinstance(c, basestring):
+                    # Budget exceeded, plot it as failure.
+                    c = -1
                 if reg in plots[alname]:
                     if c == -1:
                         # -1 means failure, don't add
@@ -427,11 +571,8 @@ def plot_reg_to_cost(results, settings, cost_calc_index=0, to_file=None, figsize
    
     plt.figure(figsize=figsize)
     for alname, costs in plots.iteritems():
-        x = sorted(costs.keys())
+        x = [reg for reg in sorted(costs.keys()) if costs[reg] >= 0]
         y = [costs[reg] for reg in x]
-        failures = len([val for val in y if val < 0])
-        x = x[failures:]
-        y = y[failures:]
 
         plt.plot(x, y, label=alname) # colors
     